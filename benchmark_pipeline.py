@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Pipeline Benchmark
+Runs every event workflow stage offline against synthetic guest lists and
+compares wall time, throughput and peak memory with the previous run
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import zipfile
+import hashlib
+import resource
+import tempfile
+import threading
+import subprocess
+import socketserver
+import importlib.util
+import multiprocessing
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GOOGLE_WALLET_DIR = os.path.join(BASE_DIR, "wallettest", "google_wallet")
+
+DEFAULT_SIZES = [100, 1000, 10000, 50000]
+STAGES = ["ingest", "qr", "apple", "google", "render", "eml", "smtp"]
+BASELINE_FILE = os.path.join(BASE_DIR, "benchmark_baseline.json")
+# A stage regresses when it is this much slower (or bigger) than the previous run
+REGRESSION_THRESHOLD = 0.2
+# Differences below these are noise at small sizes
+MIN_TIME_DELTA_S = 0.05
+MIN_RSS_DELTA_MB = 5
+
+JWT_AVAILABLE = (importlib.util.find_spec("jwt") is not None
+                 and importlib.util.find_spec("cryptography") is not None)
+OPENSSL = shutil.which("openssl")
+
+FIRST_NAMES = ["Trevor", "Amelia", "Oliver", "Priya", "George", "Isla", "Hassan", "Freya", "Daniel", "Chloe"]
+LAST_NAMES = ["Cooper", "Smith", "Patel", "Jones", "O'Cleary", "Williams", "Nowak", "Brown", "Taylor", "Evans"]
+GALLERIES = ["Birmingham", "Manchester", "Leeds", "Bristol", "Edinburgh"]
+CONSULTANTS = ["Sam Carter", "Jo Reid", "Alex Moore", "Kim Hughes"]
+
+
+# --- Synthetic events -------------------------------------------------------
+
+def synthesize_event(root, size, seed=42):
+    """Create an event directory with a raw guest list of size rows"""
+    event_dir = os.path.join(root, f"Benchmark_{size}")
+    os.makedirs(os.path.join(event_dir, "csv"), exist_ok=True)
+
+    rng = random.Random(seed)
+    raw_csv = os.path.join(event_dir, "raw_guest_list.csv")
+    with open(raw_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'email', 'guest_count', 'pass_id', 'host_gallery', 'art_consultant'])
+        for i in range(size):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            writer.writerow([
+                f"{first} {last} {i}",
+                f"{first.lower()}.{i}@example.com",
+                rng.randint(1, 4),
+                f"P{i:06d}",
+                rng.choice(GALLERIES),
+                rng.choice(CONSULTANTS)
+            ])
+
+    event_info = {
+        "name": f"Benchmark {size}",
+        "date": (datetime.now() + timedelta(days=7)).strftime('%A, %d %B %Y'),
+        "time": "6:00 PM",
+        "location": "Castle Fine Art, The Mailbox, Birmingham"
+    }
+    with open(os.path.join(event_dir, "event_info.json"), 'w') as f:
+        json.dump(event_info, f, indent=2)
+
+    return event_dir
+
+
+def create_signing_material(root):
+    """Throwaway self-signed certificate and RSA keys, standing in for the real
+    pass certificate, WWDR certificate and Google service account key"""
+    material = {}
+    if not OPENSSL:
+        return material
+
+    cert_pem = os.path.join(root, "bench_cert.pem")
+    key_pem = os.path.join(root, "bench_key.pem")
+    subprocess.run(
+        [OPENSSL, "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=pass.com.castlefineart.benchmark", "-keyout", key_pem, "-out", cert_pem],
+        check=True, capture_output=True
+    )
+    material.update(cert_pem=cert_pem, key_pem=key_pem)
+
+    service_key = os.path.join(root, "bench_service_account_key.pem")
+    subprocess.run([OPENSSL, "genpkey", "-algorithm", "RSA", "-pkeyopt", "rsa_keygen_bits:2048", "-out", service_key],
+                   check=True, capture_output=True)
+    material["service_key_pem"] = service_key
+    return material
+
+
+# --- Local SMTP sink --------------------------------------------------------
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Accepts every message (and any login) and discards it"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply("220 benchmark sink ready")
+        for line in self.rfile:
+            command = line.strip().upper()
+            if command.startswith((b'EHLO', b'HELO')):
+                self.wfile.write(b'250-benchmark sink\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif command.startswith(b'AUTH'):
+                self.reply("235 accepted")
+            elif command == b'DATA':
+                self.reply("354 go ahead")
+                received = 0
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    received += len(data_line)
+                self.server.record(received)
+                self.reply("250 queued")
+            elif command == b'QUIT':
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPSinkHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+
+    def record(self, size):
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address[1]
+
+
+# --- Stages -----------------------------------------------------------------
+# Each stage takes (event_dir, context) and returns a dict with "items", or
+# "skipped" with the reason it could not run here.
+
+def stage_ingest(event_dir, context):
+    from guest_list import ingest_guest_csv, guest_csv_path
+
+    with open(os.path.join(event_dir, "raw_guest_list.csv"), 'rb') as stream:
+        result = ingest_guest_csv(stream, guest_csv_path(event_dir))
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return {"items": result["rows_written"]}
+
+
+def stage_qr(event_dir, context):
+    from qr_generator import QRCODE_AVAILABLE, generate_event_qr_codes
+
+    if not QRCODE_AVAILABLE:
+        return {"skipped": "qrcode not installed"}
+    result = generate_event_qr_codes(event_dir)
+    if not result["success"]:
+        raise RuntimeError(result["error"])
+    return {"items": result["qr_count"]}
+
+
+def build_pass_json(guest, config, event_date):
+    from pass_customization import apply_customizations_to_pass
+
+    pass_json = {
+        "formatVersion": 1,
+        "passTypeIdentifier": "pass.com.castlefineart.guest",
+        "serialNumber": f"{guest['pass_id']}-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+        "teamIdentifier": "R3NC84JPSH",
+        "organizationName": "Castle Fine Art",
+        "description": "Event Entry Pass",
+        "barcode": {
+            "message": json.dumps({"name": guest['name'], "guests": int(guest['guest_count'])}),
+            "format": "PKBarcodeFormatQR",
+            "messageEncoding": "iso-8859-1"
+        },
+        "storeCard": {
+            "primaryFields": [{"key": "spacer", "label": "", "value": " "}],
+            "secondaryFields": [
+                {"key": "name", "label": "Name", "value": guest['name']},
+                {"key": "guests", "label": "Guests", "value": guest['guest_count']}
+            ],
+            "auxiliaryFields": [
+                {"key": "host_gallery", "label": "Host Gallery", "value": guest['host_gallery']},
+                {"key": "art_consultant", "label": "Art Consultant", "value": guest['art_consultant']},
+                {"key": "date", "label": "Date", "value": event_date}
+            ]
+        }
+    }
+    return apply_customizations_to_pass(pass_json, config)
+
+
+def stage_apple(event_dir, context):
+    """pass.json, artwork, manifest, openssl signature and .pkpass for every guest,
+    as generate_passes.py and create_passes.sh do"""
+    from guest_list import load_event_guests
+    from pass_registry import load_pass_registry
+    from pass_customization import load_current_config, custom_asset_files
+
+    if "cert_pem" not in context:
+        return {"skipped": "openssl not found"}
+
+    guests = load_event_guests(event_dir)
+    registry = load_pass_registry(event_dir)
+    config = load_current_config()
+    assets = custom_asset_files(config)
+    event_date = (datetime.now() + timedelta(days=7)).strftime('%d %b %Y')
+
+    build_dir = os.path.join(event_dir, "passtest")
+    apple_dir = os.path.join(event_dir, "apple_passes")
+    os.makedirs(apple_dir, exist_ok=True)
+
+    for guest in guests:
+        pass_id = guest['pass_id']
+        pass_folder = os.path.join(build_dir, pass_id)
+        os.makedirs(pass_folder, exist_ok=True)
+
+        qr_path = registry.qr_path(pass_id)
+        if qr_path:
+            shutil.copy(qr_path, os.path.join(pass_folder, "qr.png"))
+        for src_file, target_name in assets:
+            shutil.copy(src_file, os.path.join(pass_folder, target_name))
+        with open(os.path.join(pass_folder, "pass.json"), 'w') as f:
+            json.dump(build_pass_json(guest, config, event_date), f, indent=4)
+
+        manifest = {}
+        for name in sorted(os.listdir(pass_folder)):
+            with open(os.path.join(pass_folder, name), 'rb') as f:
+                manifest[name] = hashlib.sha1(f.read()).hexdigest()
+        with open(os.path.join(pass_folder, "manifest.json"), 'w') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+
+        subprocess.run(
+            [OPENSSL, "smime", "-binary", "-sign", "-signer", context["cert_pem"], "-inkey", context["key_pem"],
+             "-certfile", context["cert_pem"], "-in", "manifest.json", "-out", "signature", "-outform", "DER"],
+            cwd=pass_folder, check=True, capture_output=True
+        )
+
+        pkpass_path = os.path.join(apple_dir, f"{pass_id}.pkpass")
+        with zipfile.ZipFile(pkpass_path, 'w', zipfile.ZIP_DEFLATED) as pkpass:
+            for name in os.listdir(pass_folder):
+                pkpass.write(os.path.join(pass_folder, name), name)
+        registry.update(pass_id, apple_pkpass=os.path.relpath(pkpass_path, event_dir))
+
+    registry.save()
+    return {"items": len(guests)}
+
+
+def stage_google(event_dir, context):
+    """Google Wallet object and RS256 save link for every guest"""
+    if not JWT_AVAILABLE:
+        return {"skipped": "PyJWT/cryptography not installed"}
+    if "service_key_pem" not in context:
+        return {"skipped": "openssl not found"}
+
+    import jwt
+    sys.path.insert(0, GOOGLE_WALLET_DIR)
+    from google_wallet_generator import GoogleWalletGenerator, ISSUER_ID
+    from guest_list import load_event_guests
+    from pass_registry import load_pass_registry
+
+    # Only the object builder is needed, not the service account login in __init__
+    generator = GoogleWalletGenerator.__new__(GoogleWalletGenerator)
+    generator.event_class_id = f"{ISSUER_ID}.castle_fine_art_generic"
+
+    with open(context["service_key_pem"], 'r') as f:
+        private_key = f.read()
+
+    guests = load_event_guests(event_dir)
+    registry = load_pass_registry(event_dir)
+    for guest in guests:
+        generic_object = generator.create_generic_object(guest, guest['pass_id'])
+        token = jwt.encode({
+            "iss": "benchmark@castle-comms.iam.gserviceaccount.com",
+            "aud": "google",
+            "typ": "savetowallet",
+            "iat": int(time.time()),
+            "payload": {"genericObjects": [generic_object]}
+        }, private_key, algorithm='RS256')
+        registry.update(guest['pass_id'], google_wallet_url=f"https://pay.google.com/gp/v/save/{token}")
+
+    registry.save()
+    return {"items": len(guests)}
+
+
+def stage_render(event_dir, context):
+    """Personalised HTML for every guest, kept in memory"""
+    from email_rendering import load_email_template, APPLE_ATTACHED_SECTION
+    from guest_list import load_event_guests
+    from pass_registry import load_pass_registry
+
+    with open(os.path.join(event_dir, "event_info.json"), 'r') as f:
+        event_data = json.load(f)
+    template = load_email_template()
+    guests = load_event_guests(event_dir)
+    registry = load_pass_registry(event_dir)
+
+    rendered_bytes = 0
+    for guest in guests:
+        html = template.render(guest, event_data, google_url=registry.google_url(guest['pass_id']),
+                               apple_section=APPLE_ATTACHED_SECTION)
+        rendered_bytes += len(html)
+    return {"items": len(guests), "rendered_bytes": rendered_bytes}
+
+
+def stage_eml(event_dir, context):
+    """.eml file for every guest through the same path as process_event_emails.py"""
+    from process_event_emails import EventEmailProcessor
+
+    processor = EventEmailProcessor(event_dir, config_file=context["email_config"])
+    event_data, guests, registry = processor.load_event_data()
+    for guest in guests:
+        result = processor.process_guest_email(guest, event_data, registry)
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    return {"items": len(guests)}
+
+
+def stage_smtp(event_dir, context):
+    """Send every stored .eml to the local sink, one connection per message as send_all_templates.py does"""
+    from email_sender import EmailSender
+
+    sender = EmailSender(context["email_config"])
+    processed_dir = os.path.join(event_dir, "processed_emails")
+    eml_files = sorted(name for name in os.listdir(processed_dir) if name.endswith('.eml')) \
+        if os.path.isdir(processed_dir) else []
+    if not eml_files:
+        return {"skipped": "no .eml files (run the eml stage first)"}
+
+    for name in eml_files:
+        result = sender.send_eml_file(os.path.join(processed_dir, name))
+        if not result['success']:
+            raise RuntimeError(result['error'])
+    return {"items": len(eml_files)}
+
+
+STAGE_FUNCTIONS = {
+    "ingest": stage_ingest,
+    "qr": stage_qr,
+    "apple": stage_apple,
+    "google": stage_google,
+    "render": stage_render,
+    "eml": stage_eml,
+    "smtp": stage_smtp,
+}
+
+
+# --- Measurement ------------------------------------------------------------
+
+def count_files(path):
+    files = 0
+    total_bytes = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            total_bytes += os.path.getsize(os.path.join(root, name))
+    return files, total_bytes
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of any worker processes it waited for"""
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _stage_process(stage, event_dir, context, conn):
+    sys.path.insert(0, BASE_DIR)
+    files_before, bytes_before = count_files(event_dir)
+    try:
+        started = time.perf_counter()
+        outcome = STAGE_FUNCTIONS[stage](event_dir, context)
+        elapsed = time.perf_counter() - started
+    except Exception as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+        return
+
+    if "skipped" not in outcome:
+        files_after, bytes_after = count_files(event_dir)
+        outcome.update(
+            wall_time_s=round(elapsed, 4),
+            throughput_per_s=round(outcome["items"] / elapsed, 1) if elapsed else None,
+            peak_rss_mb=round(peak_rss_mb(), 1),
+            files_written=files_after - files_before,
+            bytes_written=bytes_after - bytes_before
+        )
+    conn.send(outcome)
+
+
+def run_stage(stage, event_dir, context):
+    """Run one stage in a fresh interpreter so its peak RSS is its own"""
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_stage_process, args=(stage, event_dir, context, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        outcome = parent_conn.recv()
+    except EOFError:
+        outcome = {"error": f"stage process exited with code {process.exitcode}"}
+    process.join()
+    return outcome
+
+
+def write_email_config(root, smtp_port):
+    path = os.path.join(root, "bench_email_config.ini")
+    with open(path, 'w') as f:
+        f.write(
+            "[SMTP]\n"
+            "smtp_server = 127.0.0.1\n"
+            f"smtp_port = {smtp_port}\n"
+            "use_tls = False\n"
+            "username = benchmark\n"
+            "password = benchmark\n\n"
+            "[EMAIL]\n"
+            "from_email = events@example.com\n"
+            "from_name = Castle Fine Art Benchmark\n"
+            "reply_to = events@example.com\n"
+            "subject_template = Castle Fine Art Private View Invitation\n"
+        )
+    return path
+
+
+def run_benchmark(sizes, stages, work_dir):
+    """Synthesize an event per size and run the stages over it in order"""
+    sink = SMTPSink()
+    context = create_signing_material(work_dir)
+    context["email_config"] = write_email_config(work_dir, sink.start())
+
+    results = {}
+    try:
+        for size in sizes:
+            print(f"\n👥 {size:,} guests")
+            event_dir = synthesize_event(work_dir, size)
+            results[str(size)] = {}
+            for stage in stages:
+                outcome = run_stage(stage, event_dir, context)
+                results[str(size)][stage] = outcome
+                print_stage(stage, outcome)
+    finally:
+        sink.shutdown()
+        sink.server_close()
+
+    print(f"\n📬 SMTP sink received {sink.messages:,} messages ({sink.bytes / (1024 * 1024):.1f} MB)")
+    return results
+
+
+def print_stage(stage, outcome):
+    if "error" in outcome:
+        print(f"   ❌ {stage:<7} {outcome['error']}")
+    elif "skipped" in outcome:
+        print(f"   ⏭️  {stage:<7} skipped: {outcome['skipped']}")
+    else:
+        print(f"   ✅ {stage:<7} {outcome['wall_time_s']:9.2f}s {outcome['throughput_per_s']:>10,.1f}/s "
+              f"{outcome['peak_rss_mb']:8.1f} MB  {outcome['files_written']:>7,} files")
+
+
+def find_regressions(results, previous, threshold=REGRESSION_THRESHOLD):
+    """Stages that got slower or used more memory than in the previous run"""
+    regressions = []
+    for size, stages in results.items():
+        for stage, current in stages.items():
+            before = previous.get(size, {}).get(stage, {})
+            if "wall_time_s" not in current or "wall_time_s" not in before:
+                continue
+
+            if (current["wall_time_s"] > before["wall_time_s"] * (1 + threshold)
+                    and current["wall_time_s"] - before["wall_time_s"] > MIN_TIME_DELTA_S):
+                regressions.append(f"{size} guests / {stage}: wall time "
+                                   f"{before['wall_time_s']:.2f}s → {current['wall_time_s']:.2f}s")
+            if (current["peak_rss_mb"] > before["peak_rss_mb"] * (1 + threshold)
+                    and current["peak_rss_mb"] - before["peak_rss_mb"] > MIN_RSS_DELTA_MB):
+                regressions.append(f"{size} guests / {stage}: peak RSS "
+                                   f"{before['peak_rss_mb']:.1f} MB → {current['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    baseline = {
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def remove_created(work_dir, existing=None):
+    """Delete work_dir, or only the entries that are not in existing"""
+    if existing is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return
+    for name in set(os.listdir(work_dir)) - existing:
+        path = os.path.join(work_dir, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the event workflow offline with synthetic guest lists')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Guest list sizes to run')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='Stages to run, in order')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='JSON file holding the previous run')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='Relative slowdown that counts as a regression (default 0.2)')
+    parser.add_argument('--work-dir', help='Where to build the synthetic events (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic events afterwards')
+    parser.add_argument('--no-save', action='store_true', help='Compare only; do not replace the baseline')
+
+    args = parser.parse_args()
+    stages = [stage for stage in STAGES if stage in args.stages]
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="castle_benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+    # A --work-dir may hold other files, so only what this run adds is cleaned up
+    existing = set(os.listdir(work_dir)) if args.work_dir else None
+
+    print(f"⏱️  Pipeline benchmark: {', '.join(stages)}")
+    print(f"📁 Working in {work_dir}")
+    print("-" * 60)
+
+    try:
+        results = run_benchmark(args.sizes, stages, work_dir)
+    finally:
+        if not args.keep:
+            remove_created(work_dir, existing)
+
+    previous = load_baseline(args.baseline)
+    regressions = find_regressions(results, previous["results"], args.threshold) if previous else []
+
+    if previous:
+        print(f"\n📊 Compared with run from {previous['timestamp']}")
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if not regressions:
+            print("✅ No regressions")
+    else:
+        print("\n📊 No previous run to compare against")
+
+    if not args.no_save:
+        save_baseline(args.baseline, results)
+        print(f"💾 Baseline saved to {args.baseline}")
+
+    failed = any("error" in outcome for stages_run in results.values() for outcome in stages_run.values())
+    if regressions or failed:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Bundle Cache
+Content-keyed ZIP bundles that are streamed to clients while they are built
+"""
+
+import os
+import glob
+import fcntl
+import hashlib
+import zipfile
+import tempfile
+import threading
+
+CHUNK_SIZE = 64 * 1024
+
+# In-flight builds keyed by bundle path, so concurrent requests share one build.
+# Across worker processes, <bundle>.lock is held for the whole build instead.
+_builds = {}
+_builds_lock = threading.Lock()
+
+
+def bundle_key(files):
+    """Key for a bundle from its (arcname, digest) pairs"""
+    digest = hashlib.sha256()
+    for arcname, file_digest in sorted(files):
+        digest.update(f"{arcname}:{file_digest}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class _AppendOnlyFile:
+    """File wrapper without seek(), so zipfile writes data descriptors
+    instead of rewinding to patch headers - every byte is final once written
+    and can be streamed to readers immediately."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._position = 0
+
+    def write(self, data):
+        written = self._fileobj.write(data)
+        self._position += written
+        return written
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        self._fileobj.flush()
+
+
+class BundleBuild:
+    """A bundle being written to its own temporary file by a background thread"""
+
+    def __init__(self, path, files):
+        self.path = path
+        self.files = files
+        self.error = None
+        self.done = threading.Event()
+        self.changed = threading.Condition()
+        # Created up front so readers can open it before the first write
+        fd, self.partial_path = tempfile.mkstemp(
+            prefix=f".{os.path.basename(path)}.", suffix='.partial', dir=os.path.dirname(path)
+        )
+        os.close(fd)
+
+    def run(self):
+        try:
+            # Another worker process may be building the same bundle; wait for it
+            with open(self.path + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with open(self.partial_path, 'wb') as raw:
+                    if os.path.exists(self.path):
+                        self._copy(self.path, raw)
+                    else:
+                        self._build(raw)
+                self._install()
+        except Exception as e:
+            self.error = str(e)
+            print(f"❌ Bundle build failed for {os.path.basename(self.path)}: {e}")
+        finally:
+            try:
+                with _builds_lock:
+                    _builds.pop(self.path, None)
+                if os.path.exists(self.partial_path):
+                    os.remove(self.partial_path)
+            finally:
+                self.done.set()
+                self._notify()
+
+    def _build(self, raw):
+        writer = _AppendOnlyFile(raw)
+        # pkpass files are already compressed, so store them as-is
+        with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as zip_file:
+            for source, arcname in self.files:
+                zip_file.write(source, arcname)
+                writer.flush()
+                self._notify()
+
+    def _copy(self, source, raw):
+        """Stream a bundle another process finished while this one waited"""
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                raw.write(chunk)
+                raw.flush()
+                self._notify()
+
+    def _install(self):
+        # Publish under the lock so new readers either join this build or see the final file
+        with _builds_lock:
+            if not os.path.exists(self.path):
+                os.replace(self.partial_path, self.path)
+            _builds.pop(self.path, None)
+
+    def _notify(self):
+        with self.changed:
+            self.changed.notify_all()
+
+    def stream(self):
+        """Return a generator of the bundle's bytes as they are written.
+
+        The partial file is opened immediately, so the stream stays valid even
+        if the build finishes and renames it before the first chunk is read.
+        """
+        return self._tail(open(self.partial_path, 'rb'))
+
+    def _tail(self, f):
+        with f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+                if self.done.is_set():
+                    if self.error is not None:
+                        # Abort the response rather than end a truncated ZIP cleanly
+                        raise RuntimeError(f"Bundle build failed: {self.error}")
+                    # Drain anything written between the last read and completion
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        yield chunk
+                    return
+                with self.changed:
+                    self.changed.wait(timeout=0.5)
+
+
+def get_bundle(cache_dir, prefix, files):
+    """Return (path, None) for a cached bundle, or (None, stream) while it builds.
+
+    files is a list of (source_path, arcname, digest). Bundles are keyed by
+    the arcnames and digests, so any change to the set of files produces a
+    new bundle and stale ones for the same prefix are removed.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    key = bundle_key((arcname, digest) for _, arcname, digest in files)
+    path = os.path.join(cache_dir, f"{prefix}_{key[:16]}.zip")
+
+    with _builds_lock:
+        build = _builds.get(path)
+        if build is None:
+            if os.path.exists(path):
+                return path, None
+
+            for stale in glob.glob(os.path.join(cache_dir, f"{prefix}_*.zip")):
+                if stale != path:
+                    os.remove(stale)
+            for stale in glob.glob(os.path.join(cache_dir, f"{prefix}_*.zip.lock")):
+                if stale != path + '.lock':
+                    os.remove(stale)
+
+            build = BundleBuild(path, [(source, arcname) for source, arcname, _ in files])
+            _builds[path] = build
+            threading.Thread(target=build.run, daemon=True).start()
+
+        return None, build.stream()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Delivery Ledger
+Append-only record of every email send attempt, used to resume interrupted runs
+"""
+
+import os
+import json
+from datetime import datetime
+
+LEDGER_FILENAME = "delivery_ledger.jsonl"
+# Records are flushed immediately and fsynced in batches of this size
+SYNC_EVERY = 20
+
+
+class DeliveryLedger:
+    """One JSON line per send attempt in <templates_dir>/delivery_ledger.jsonl.
+
+    Messages are identified by the SHA-256 of the .eml file, so a message is
+    only considered delivered if exactly those bytes were accepted.
+    """
+
+    def __init__(self, templates_dir, sync_every=SYNC_EVERY):
+        self.path = os.path.join(templates_dir, LEDGER_FILENAME)
+        self.sync_every = sync_every
+        self.entries = []
+        self.delivered = set()
+        self._file = None
+        self._unsynced = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write can leave a partial last line
+                    continue
+                self.entries.append(entry)
+                if entry.get('status') == 'sent':
+                    self.delivered.add(entry['digest'])
+
+    def is_delivered(self, digest):
+        return digest in self.delivered
+
+    def record(self, eml_file, digest, recipient, result):
+        """Append the outcome of one send attempt"""
+        entry = {
+            "file": os.path.basename(eml_file),
+            "digest": digest,
+            "recipient": recipient,
+            "status": "sent" if result['success'] else "failed",
+            "smtp_code": result.get('smtp_code'),
+            "smtp_response": result.get('smtp_response', result.get('error')),
+            "timestamp": datetime.now().isoformat()
+        }
+
+        if self._file is None:
+            self._file = self._open()
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+
+        self.entries.append(entry)
+        if entry['status'] == 'sent':
+            self.delivered.add(digest)
+        return entry
+
+    def _open(self):
+        """Open the ledger for appending, ending a partial last line left by a killed run"""
+        f = open(self.path, 'a', encoding='utf-8')
+        if f.tell():
+            with open(self.path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b'\n':
+                    f.write('\n')
+        return f
+
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        """Latest outcome per message, derived from the ledger alone"""
+        latest = {}
+        for entry in self.entries:
+            latest[entry['digest']] = entry
+
+        failed = [entry for entry in latest.values() if entry['status'] != 'sent']
+        timestamps = [entry['timestamp'] for entry in self.entries]
+        return {
+            "attempts": len(self.entries),
+            "messages": len(latest),
+            "sent": len(latest) - len(failed),
+            "failed": failed,
+            "first_attempt": min(timestamps) if timestamps else None,
+            "last_attempt": max(timestamps) if timestamps else None
+        }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Email Rendering
+Personalises the wallet invitation template for each guest in a single pass
+"""
+
+import os
+import re
+import threading
+import metrics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_PATH = os.path.join(BASE_DIR, "wallettest", "google_wallet", "email_template.html")
+
+APPLE_SECTION_PATTERN = re.compile(r'<!-- Apple Wallet Button -->.*?</a>', re.DOTALL)
+GOOGLE_HREF_PATTERN = r'href="https://pay\.google\.com/gp/v/save/[^"]*"'
+APPLE_LINK_PLACEHOLDER = 'APPLE_WALLET_DOWNLOAD_LINK'
+
+# Sample text in the template that is replaced with each guest's details
+SAMPLE_NAME = "Trevor Cooper"
+SAMPLE_GUESTS = "4 people"
+SAMPLE_DATE = "Sunday, 15 December 2024"
+SAMPLE_TIME = "6:00 PM - 10:00 PM"
+SAMPLE_LOCATION = "Castle Fine Art, The Mailbox, Birmingham"
+
+# Apple Wallet section when the .pkpass travels as an attachment
+APPLE_ATTACHED_SECTION = '''
+                <!-- Apple Wallet Button -->
+                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 8px; margin: 10px; text-align: center;">
+                    <div style="background: #000; color: white; padding: 12px 20px; border-radius: 8px; font-size: 14px; display: inline-block;">
+                        📱 Apple Wallet Pass (see attachment)
+                    </div>
+                    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">
+                        The .pkpass file is attached to this email. Open it to add to your Apple Wallet.
+                    </p>
+                </div>'''
+
+# Apple Wallet section when the guest has no pass
+APPLE_MISSING_SECTION = '''
+                <!-- Apple Wallet Button -->
+                <div style="background-color: #fff3cd; padding: 15px; border-radius: 8px; margin: 10px; text-align: center;">
+                    <div style="background: #666; color: white; padding: 12px 20px; border-radius: 8px; font-size: 14px; display: inline-block;">
+                        📱 Apple Wallet Pass (not available)
+                    </div>
+                    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">
+                        Apple Wallet pass not found for this event.
+                    </p>
+                </div>'''
+
+
+class EmailTemplate:
+    """The invitation template, split once around its Apple Wallet button.
+
+    render() swaps in the chosen Apple Wallet section and replaces every
+    sample value with one regex pass over the template, instead of a chain
+    of str.replace calls and a DOTALL search per guest.
+    """
+
+    def __init__(self, html):
+        match = APPLE_SECTION_PATTERN.search(html)
+        if match:
+            self.before, self.apple_button, self.after = html[:match.start()], match.group(0), html[match.end():]
+        else:
+            self.before, self.apple_button, self.after = html, '', ''
+
+        samples = [SAMPLE_NAME, SAMPLE_GUESTS, SAMPLE_DATE, SAMPLE_TIME, SAMPLE_LOCATION, APPLE_LINK_PLACEHOLDER]
+        self.pattern = re.compile('|'.join([re.escape(sample) for sample in samples] + [GOOGLE_HREF_PATTERN]))
+
+    def render(self, guest, event_data, google_url='#', apple_download_url=None, apple_section=None):
+        """Personalised HTML for one guest.
+
+        apple_section replaces the template's download button (see
+        APPLE_ATTACHED_SECTION / APPLE_MISSING_SECTION); without it the
+        button is kept and linked to apple_download_url.
+        """
+        guest_count = int(guest['guest_count'])
+        values = {
+            SAMPLE_NAME: guest['name'],
+            SAMPLE_GUESTS: f"{guest_count} people" if guest_count != 1 else "1 person",
+            SAMPLE_DATE: event_data.get('date', 'TBD'),
+            SAMPLE_TIME: f"{event_data.get('time', 'TBD')} onwards",
+            SAMPLE_LOCATION: event_data.get('location', 'TBD'),
+            APPLE_LINK_PLACEHOLDER: apple_download_url or '#',
+        }
+
+        def substitute(match):
+            text = match.group(0)
+            if text in values:
+                return values[text]
+            # Google Wallet button: keep the sample link if the guest has no pass yet
+            return f'href="{google_url}"' if google_url != '#' else text
+
+        section = self.apple_button if apple_section is None else apple_section
+        with metrics.timed("template_render"):
+            return ''.join(self.pattern.sub(substitute, part) for part in (self.before, section, self.after))
+
+
+# Parsed templates keyed by path, invalidated on mtime change
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_email_template(path=TEMPLATE_PATH):
+    mtime = os.stat(path).st_mtime_ns
+    with _templates_lock:
+        cached = _templates.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        template = EmailTemplate(f.read())
+
+    with _templates_lock:
+        _templates[path] = (mtime, template)
+    return template
@@ -7,14 +7,15 @@ Handles email personalization and sending with Apple Wallet attachments
 import smtplib
 import json
 import os
-import csv
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from datetime import datetime
 import time
 import configparser
+from guest_list import load_event_guests
+from pass_registry import load_pass_registry
+from email_streaming import FileAttachment, send_message, read_headers, send_raw
+import metrics
 
 class EmailSender:
     def __init__(self, config_file="email_config.ini"):
@@ -148,11 +149,8 @@ class EmailSender:
         # Add Apple Wallet pass attachment if provided
         if apple_pass_file and os.path.exists(apple_pass_file):
             try:
-                with open(apple_pass_file, "rb") as attachment:
-                    part = MIMEBase('application', 'vnd.apple.pkpass')
-                    part.set_payload(attachment.read())
-
-                encoders.encode_base64(part)
+                # Streamed from disk when the message is written or sent
+                part = FileAttachment(apple_pass_file, 'application', 'vnd.apple.pkpass')
 
                 filename = os.path.basename(apple_pass_file)
                 part.add_header(
@@ -167,27 +165,57 @@ class EmailSender:
 
         return msg
 
-    def send_email(self, message):
-        """Send email message via SMTP"""
+    def connect(self):
+        """Open an authenticated SMTP connection"""
         smtp_config = self.get_smtp_config()
 
-        try:
-            server = smtplib.SMTP(smtp_config['server'], smtp_config['port'])
+        server = smtplib.SMTP(smtp_config['server'], smtp_config['port'])
 
-            if smtp_config['use_tls']:
-                server.starttls()
+        if smtp_config['use_tls']:
+            server.starttls()
 
-            server.login(smtp_config['username'], smtp_config['password'])
+        server.login(smtp_config['username'], smtp_config['password'])
+        return server
 
-            text = message.as_string()
-            server.sendmail(message['From'], message['To'], text)
+    def send_email(self, message):
+        """Send email message via SMTP"""
+        try:
+            server = self.connect()
+
+            # Streams the message to the connection instead of building one big string
+            code, response = send_message(server, message)
             server.quit()
 
-            return {"success": True}
+            metrics.inc("castle_emails_sent_total")
+            return {"success": True, "smtp_code": code, "smtp_response": response.decode('utf-8', 'replace')}
 
         except Exception as e:
+            metrics.inc("castle_emails_failed_total")
             return {"success": False, "error": str(e)}
 
+    def send_eml_file(self, eml_path):
+        """Send a stored .eml exactly as written, reading only its From/To headers"""
+        recipient = 'Unknown'
+        try:
+            headers = read_headers(eml_path)
+            recipient = headers.get('To', 'Unknown')
+
+            server = self.connect()
+            code, response = send_raw(server, headers['From'], headers['To'], eml_path)
+            server.quit()
+
+            metrics.inc("castle_emails_sent_total")
+            return {
+                "success": True,
+                "recipient": recipient,
+                "smtp_code": code,
+                "smtp_response": response.decode('utf-8', 'replace')
+            }
+
+        except Exception as e:
+            metrics.inc("castle_emails_failed_total")
+            return {"success": False, "recipient": recipient, "error": str(e)}
+
     def send_test_email(self, test_email, event_data, sample_guest_data, google_wallet_url, template_html):
         """Send a test email"""
 
@@ -220,20 +248,11 @@ class EmailSender:
             with open(event_info_path, 'r') as f:
                 event_data = json.load(f)
 
-            # Load CSV data
-            csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
-            with open(csv_path, 'r') as f:
-                reader = csv.DictReader(f)
-                guests = list(reader)
-
-            # Load Google Wallet passes
-            google_passes_file = os.path.join(event_dir, "google_passes", "google_wallet_passes.json")
-            google_passes = {}
-            if os.path.exists(google_passes_file):
-                with open(google_passes_file, 'r') as f:
-                    passes = json.load(f)
-                    for pass_data in passes:
-                        google_passes[pass_data['name']] = pass_data['wallet_url']
+            # Load guest list
+            guests = load_event_guests(event_dir)
+
+            # Wallet artefacts for each guest, keyed by pass_id
+            registry = load_pass_registry(event_dir)
 
             # Load email template
             template_path = os.path.join(os.path.dirname(__file__), "wallettest", "google_wallet", "email_template.html")
@@ -242,7 +261,6 @@ class EmailSender:
 
             # Email configuration
             subject_template = self.config.get('EMAIL', 'subject_template')
-            apple_passes_dir = os.path.join(event_dir, "apple_passes")
 
             results = {
                 "total": len(guests),
@@ -258,11 +276,11 @@ class EmailSender:
                         progress_callback(i, len(guests), f"Sending to {guest['name']}")
 
                     # Get Google Wallet URL
-                    google_url = google_passes.get(guest['name'], '#')
+                    google_url = registry.google_url(guest['pass_id'])
 
                     # Find Apple Wallet pass
-                    apple_pass_file = os.path.join(apple_passes_dir, f"{guest['pass_id']}.pkpass")
-                    apple_available = os.path.exists(apple_pass_file)
+                    apple_pass_file = registry.apple_pass_path(guest['pass_id'])
+                    apple_available = apple_pass_file is not None
 
                     # Personalize email
                     subject = subject_template.format(event_name=event_data.get('name', 'Private View'))
@@ -275,7 +293,7 @@ class EmailSender:
                         guest['email'],
                         subject,
                         personalized_html,
-                        apple_pass_file if apple_available else None
+                        apple_pass_file
                     )
 
                     send_result = self.send_email(message)
@@ -320,14 +338,11 @@ def main():
     if args.test_email:
         # Send test email
         event_info_path = os.path.join(args.event_dir, "event_info.json")
-        csv_path = os.path.join(args.event_dir, "csv", "guest_list.csv")
 
         with open(event_info_path, 'r') as f:
             event_data = json.load(f)
 
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            sample_guest = next(reader)
+        sample_guest = load_event_guests(args.event_dir)[0]
 
         template_path = os.path.join(os.path.dirname(__file__), "wallettest", "google_wallet", "email_template.html")
         with open(template_path, 'r') as f:
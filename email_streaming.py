@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Email Streaming
+Writes MIME messages as bytes straight to .eml files and SMTP connections
+"""
+
+import os
+import mmap
+import base64
+from email.generator import BytesGenerator
+from email.mime.base import MIMEBase
+from email.parser import BytesHeaderParser
+import metrics
+
+# Attachments are read in multiples of 57 bytes, which base64 to whole 76-character lines
+ATTACHMENT_CHUNK_SIZE = 57 * 1024
+SMTP_BUFFER_SIZE = 64 * 1024
+# Stored messages larger than this are memory-mapped rather than read
+MMAP_THRESHOLD = 1024 * 1024
+
+
+class FileAttachment(MIMEBase):
+    """Base64 attachment whose body is read from disk while the message is written,
+    so the file is never held in memory in full."""
+
+    def __init__(self, path, maintype, subtype, **params):
+        super().__init__(maintype, subtype, **params)
+        self.path = path
+        self['Content-Transfer-Encoding'] = 'base64'
+        # Non-empty marker so generators always ask get_payload() for the body
+        self._payload = ''
+
+    def get_payload(self, i=None, decode=False):
+        # Only used by code that serialises with as_string()/as_bytes()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return data if decode else base64.encodebytes(data).decode('ascii')
+
+
+class StreamingBytesGenerator(BytesGenerator):
+    """BytesGenerator that writes multipart messages part by part.
+
+    The stock generator renders every part into a buffer before writing
+    the headers, so it can pick a boundary that does not occur in the body.
+    Here the boundary is chosen up front (base64 bodies cannot contain it)
+    and multipart containers and file attachments are written straight to
+    the output; only small leaf parts such as the HTML body are buffered.
+    """
+
+    def _write(self, msg):
+        if not (msg.is_multipart() or isinstance(msg, FileAttachment)):
+            super()._write(msg)
+            return
+
+        if msg.is_multipart() and not msg.get_boundary():
+            msg.set_boundary(self._make_boundary())
+
+        meth = getattr(msg, '_write_headers', None)
+        if meth is None:
+            self._write_headers(msg)
+        else:
+            meth(self)
+        self._dispatch(msg)
+
+    def _handle_multipart(self, msg):
+        subparts = msg.get_payload()
+        if subparts is None:
+            subparts = []
+        elif isinstance(subparts, str):
+            self.write(subparts)
+            return
+        elif not isinstance(subparts, list):
+            subparts = [subparts]
+
+        boundary = msg.get_boundary()
+        if msg.preamble is not None:
+            self._write_lines(msg.preamble)
+            self.write(self._NL)
+
+        for index, part in enumerate(subparts):
+            self.write(('' if index == 0 else self._NL) + '--' + boundary + self._NL)
+            self.clone(self._fp).flatten(part, unixfrom=False, linesep=self._NL)
+        if not subparts:
+            self.write('--' + boundary + self._NL)
+
+        self.write(self._NL + '--' + boundary + '--' + self._NL)
+        if msg.epilogue is not None:
+            self._write_lines(msg.epilogue)
+
+    def _handle_application(self, msg):
+        if not isinstance(msg, FileAttachment):
+            self._writeBody(msg)
+            return
+
+        newline = self._NL.encode('ascii')
+        with open(msg.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(ATTACHMENT_CHUNK_SIZE), b''):
+                encoded = base64.encodebytes(chunk)
+                if newline != b'\n':
+                    encoded = encoded.replace(b'\n', newline)
+                self._fp.write(encoded)
+
+
+def write_message(message, path):
+    """Write message to path as bytes, atomically"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        StreamingBytesGenerator(f, mangle_from_=False).flatten(message)
+        metrics.inc("castle_bytes_written_total", f.tell(), kind="eml")
+    os.replace(temp_path, path)
+    return path
+
+
+class SMTPDataWriter:
+    """File-like writer for the body of an SMTP DATA command.
+
+    Converts line endings to CRLF and dot-stuffs lines as they pass
+    through, sending in SMTP_BUFFER_SIZE blocks.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._buffer = bytearray()
+        self._at_line_start = True
+        self._pending_cr = False
+
+    def write(self, data):
+        data = bytes(data)
+        if not data:
+            return 0
+        if self._pending_cr:
+            data = b'\r' + data
+            self._pending_cr = False
+        if data.endswith(b'\r'):
+            # Could be the first half of a CRLF split across writes
+            data = data[:-1]
+            self._pending_cr = True
+
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n').replace(b'\n', b'\r\n')
+        data = data.replace(b'\n.', b'\n..')
+        if self._at_line_start and data.startswith(b'.'):
+            data = b'.' + data
+        if data:
+            self._at_line_start = data.endswith(b'\n')
+
+        self._buffer += data
+        if len(self._buffer) >= SMTP_BUFFER_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self.server.send(bytes(self._buffer))
+            self._buffer.clear()
+
+    def close(self):
+        """Finish the message and return the server's (code, response)"""
+        if self._pending_cr:
+            self._buffer += b'\r\n'
+            self._pending_cr = False
+            self._at_line_start = True
+        if not self._at_line_start:
+            self._buffer += b'\r\n'
+        self._buffer += b'.\r\n'
+        self.flush()
+        return self.server.getreply()
+
+
+def open_data(server, from_addr, to_addrs):
+    """Send MAIL FROM / RCPT TO / DATA and return a writer for the message body"""
+    # Only needed once a connection exists; keeps smtplib out of start-up
+    import smtplib
+
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    server.ehlo_or_helo_if_needed()
+    code, response = server.mail(from_addr)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, response, from_addr)
+
+    refused = {}
+    for address in to_addrs:
+        code, response = server.rcpt(address)
+        if code not in (250, 251):
+            refused[address] = (code, response)
+    if len(refused) == len(to_addrs):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    server.putcmd("data")
+    code, response = server.getreply()
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return SMTPDataWriter(server)
+
+
+def send_message(server, message, from_addr=None, to_addrs=None):
+    """Stream message to an open SMTP connection, returning the server's (code, response)"""
+    with metrics.timed("smtp_send"):
+        writer = open_data(server, from_addr or message['From'], to_addrs or message['To'])
+        StreamingBytesGenerator(writer, mangle_from_=False).flatten(message, linesep='\r\n')
+        code, response = writer.close()
+    if code != 250:
+        import smtplib
+        raise smtplib.SMTPDataError(code, response)
+    return code, response
+
+
+def read_headers(path):
+    """Parse only the header block of a stored message"""
+    header_lines = []
+    with open(path, 'rb') as f:
+        for line in f:
+            if line in (b'\n', b'\r\n'):
+                break
+            header_lines.append(line)
+    return BytesHeaderParser().parsebytes(b''.join(header_lines))
+
+
+def send_raw(server, from_addr, to_addrs, path):
+    """Transmit a stored message's bytes verbatim, returning the server's (code, response)"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = f.read()
+
+        try:
+            with metrics.timed("smtp_send"):
+                writer = open_data(server, from_addr, to_addrs)
+                # Released on the way out, so closing the mmap can't mask an SMTP error
+                with memoryview(data) as view:
+                    for offset in range(0, size, SMTP_BUFFER_SIZE):
+                        with view[offset:offset + SMTP_BUFFER_SIZE] as chunk:
+                            writer.write(chunk)
+                code, response = writer.close()
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    if code != 250:
+        import smtplib
+        raise smtplib.SMTPDataError(code, response)
+    return code, response
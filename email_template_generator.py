@@ -6,7 +6,6 @@ Creates Outlook-compatible .msg template files for review before sending
 
 import os
 import json
-import csv
 import shutil
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -15,6 +14,9 @@ from email import encoders
 import configparser
 from datetime import datetime
 from email_sender import EmailSender
+from guest_list import load_event_guests
+from pass_registry import load_pass_registry
+from email_streaming import write_message
 
 class EmailTemplateGenerator:
     def __init__(self, config_file="email_config.ini"):
@@ -35,20 +37,11 @@ class EmailTemplateGenerator:
             with open(event_info_path, 'r') as f:
                 event_data = json.load(f)
 
-            # Load CSV data
-            csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
-            with open(csv_path, 'r') as f:
-                reader = csv.DictReader(f)
-                guests = list(reader)
-
-            # Load Google Wallet passes
-            google_passes_file = os.path.join(event_dir, "google_passes", "google_wallet_passes.json")
-            google_passes = {}
-            if os.path.exists(google_passes_file):
-                with open(google_passes_file, 'r') as f:
-                    passes = json.load(f)
-                    for pass_data in passes:
-                        google_passes[pass_data['name']] = pass_data['wallet_url']
+            # Load guest list
+            guests = load_event_guests(event_dir)
+
+            # Wallet artefacts for each guest, keyed by pass_id
+            registry = load_pass_registry(event_dir)
 
             # Load email template
             template_path = os.path.join(os.path.dirname(__file__), "wallettest", "google_wallet", "email_template.html")
@@ -60,7 +53,6 @@ class EmailTemplateGenerator:
 
             # Email configuration
             subject_template = self.email_sender.config.get('EMAIL', 'subject_template')
-            apple_passes_dir = os.path.join(event_dir, "apple_passes")
 
             results = {
                 "total": len(guests),
@@ -75,11 +67,11 @@ class EmailTemplateGenerator:
                     print(f"📧 Generating template for {guest['name']}...")
 
                     # Get Google Wallet URL
-                    google_url = google_passes.get(guest['name'], '#')
+                    google_url = registry.google_url(guest['pass_id'])
 
                     # Find Apple Wallet pass
-                    apple_pass_file = os.path.join(apple_passes_dir, f"{guest['pass_id']}.pkpass")
-                    apple_available = os.path.exists(apple_pass_file)
+                    apple_pass_file = registry.apple_pass_path(guest['pass_id'])
+                    apple_available = apple_pass_file is not None
 
                     # Personalize email
                     subject = subject_template.format(event_name=event_data.get('name', 'Private View'))
@@ -92,7 +84,7 @@ class EmailTemplateGenerator:
                         guest['email'],
                         subject,
                         personalized_html,
-                        apple_pass_file if apple_available else None
+                        apple_pass_file
                     )
 
                     # Save as .eml file (cross-platform email format)
@@ -100,8 +92,7 @@ class EmailTemplateGenerator:
                     template_filename = f"{guest['pass_id']}_{safe_name}.eml"
                     template_path = os.path.join(output_dir, template_filename)
 
-                    with open(template_path, 'w', encoding='utf-8') as f:
-                        f.write(message.as_string())
+                    write_message(message, template_path)
 
                     # Also create a preview HTML file
                     preview_filename = f"{guest['pass_id']}_{safe_name}_preview.html"
@@ -157,6 +148,8 @@ To review emails:
 To send all emails:
 1. Review the preview files first
 2. Run: python3 send_all_templates.py
+3. If a run is interrupted, run it again with --resume to skip emails already delivered
+   (delivery_ledger.jsonl records every send; --report summarises it)
 
 Total templates generated: {results['generated']}
 Total failures: {results['failed']}
@@ -189,10 +182,7 @@ Total failures: {results['failed']}
                 event_data = json.load(f)
 
             # Load first guest as sample
-            csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
-            with open(csv_path, 'r') as f:
-                reader = csv.DictReader(f)
-                sample_guest = next(reader)
+            sample_guest = load_event_guests(event_dir)[0].as_dict()
 
             # Load template
             template_path = "/Users/appleone/Documents/wallettest/google_wallet/email_template.html"
@@ -221,8 +211,7 @@ Total failures: {results['failed']}
 
             # Save test template
             template_path = os.path.join(output_dir, "TEST_EMAIL.eml")
-            with open(template_path, 'w', encoding='utf-8') as f:
-                f.write(message.as_string())
+            write_message(message, template_path)
 
             # Save preview
             preview_path = os.path.join(output_dir, "TEST_EMAIL_preview.html")
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - File Utilities
+Helpers shared by the pass registry, email sending and the coordinator
+"""
+
+import hashlib
+
+
+def file_digest(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
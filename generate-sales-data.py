@@ -1,65 +1,521 @@
 #!/usr/bin/env python3
+"""
+Castle Fine Art - Sales Data Export
+Converts Sales Data.csv into the dataset loaded by the sales chatbot
+(sales-chat.html), either as a compact columnar JSON file with pre-aggregated
+summary cubes or as the legacy sales-data-embedded.js script. Columnar
+exports are refreshed incrementally: only orders added or changed since the
+last run are ingested, into a small delta file the page merges
+"""
+
+import io
+import os
 import csv
 import json
+import gzip
+import hashlib
+import importlib.util
+from datetime import datetime, date, timedelta
+
+from sales_cubes import CUBES, build_cubes, item_prefix, month_key, round_amount
+from sales_store import SalesStore, WATERMARK, BASE, SUMMARY, SUMMARY_DELTA
+
+# brotli is optional; without it only the gzip copy is written
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+CSV_FILE = 'Sales Data.csv'
+EMBEDDED_JS_FILE = 'sales-data-embedded.js'
+COLUMNAR_FILE = 'sales-data.columnar.json'
+# Cubes too big for every page load, written to their own file and fetched on demand
+SEPARATE_CUBES = ("customer_month",)
+
+SALES_STORE_FILE = 'sales_data.db'
+
+COLUMNAR_FORMAT = "castle-sales-columnar"
+COLUMNAR_VERSION = 1
+DELTA_FORMAT = "castle-sales-delta"
+DELTA_VERSION = 1
 
-def convert_csv_to_js():
-    """Convert Sales Data.csv to JavaScript array for embedding"""
+# Once a delta holds this share of the columnar file's rows, the file is rewritten
+REBASE_FRACTION = 0.25
 
+# Columns stored once per distinct value (a customer is ID plus name) and referenced by index
+DICTIONARY_COLUMNS = [("CustID", "FirstName", "LastName"), ("ItemCode",)]
+NUMBER_COLUMNS = ["SOTotal"]
+DATE_COLUMNS = {"SODate": "%d/%m/%Y"}
+
+
+def load_sales_rows(csv_path=CSV_FILE):
+    """Rows of the sales CSV as dicts with cleaned field names and values"""
     sales_data = []
+    with open(csv_path, 'r', encoding='utf-8-sig') as file:
+        csv_reader = csv.DictReader(file)
+
+        for row in csv_reader:
+            # Clean and convert the data
+            cleaned_row = {}
+            for key, value in row.items():
+                # Remove BOM and clean field names
+                clean_key = key.strip().replace('\ufeff', '')
+                cleaned_row[clean_key] = value.strip() if value else ''
+
+            sales_data.append(cleaned_row)
+    return sales_data
+
+
+def parse_csv_tail(data, fields):
+    """Cleaned rows from CSV bytes that follow the header, as load_sales_rows reads them"""
+    rows = []
+    for values in csv.reader(io.StringIO(data.decode('utf-8'))):
+        if values:
+            values += [''] * (len(fields) - len(values))
+            rows.append({field: value.strip() for field, value in zip(fields, values)})
+    return rows
 
+
+def row_hash(row):
+    """Fingerprint of a cleaned row, to recognise it in a later export"""
+    return hashlib.blake2b('\x1f'.join(row.values()).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def print_summary(summary, top_customer=None):
+    """Quick stats to verify the export, read from the summary cubes.
+    top_customer is ([CustID, FirstName, LastName], total)"""
+    print(f"Total records: {summary['rows']}")
+    print(f"Valid sales records: {summary['valid']}")
+    print(f"Total sales value: £{summary['total']:,.2f}")
+
+    if top_customer:
+        (cust_id, first_name, last_name), total = top_customer
+        name = f"{first_name} {last_name}".strip()
+        print(f"Top customer: {name} ({cust_id}) - £{total:,.2f}")
+
+
+# --- Columnar export ------------------------------------------------------------
+
+def parse_number(value):
     try:
-        with open('Sales Data.csv', 'r', encoding='utf-8-sig') as file:
-            csv_reader = csv.DictReader(file)
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return int(number) if number.is_integer() else number
+
 
-            for row in csv_reader:
-                # Clean and convert the data
-                cleaned_row = {}
-                for key, value in row.items():
-                    # Remove BOM and clean field names
-                    clean_key = key.strip().replace('\ufeff', '')
-                    cleaned_row[clean_key] = value.strip() if value else ''
+def parse_date(value, date_format):
+    try:
+        return datetime.strptime(value, date_format).date()
+    except (ValueError, TypeError):
+        return None
 
-                sales_data.append(cleaned_row)
 
-        print(f"Successfully loaded {len(sales_data)} records")
+def dictionary_column(sales_data, fields):
+    """Distinct value tuples, most frequent first so common ones get short indexes"""
+    counts = {}
+    keys = []
+    for row in sales_data:
+        key = tuple(row.get(field, '') for field in fields)
+        keys.append(key)
+        counts[key] = counts.get(key, 0) + 1
+    dictionary = sorted(counts, key=lambda key: -counts[key])
+    index = {key: i for i, key in enumerate(dictionary)}
+    return {
+        "type": "dictionary",
+        "fields": list(fields),
+        "dictionary": [list(key) for key in dictionary],
+        "indexes": [index[key] for key in keys],
+    }
+
+
+def date_column(sales_data, field, date_format):
+    """Dates as whole days after the earliest one, null where unparseable"""
+    dates = [parse_date(row.get(field), date_format) for row in sales_data]
+    known = [value for value in dates if value is not None]
+    base = min(known) if known else date(1970, 1, 1)
+    return {
+        "type": "date",
+        "fields": [field],
+        "base": base.isoformat(),
+        "days": [(value - base).days if value is not None else None for value in dates],
+    }
+
+
+def build_columnar(sales_data):
+    """Columnar dataset: dictionary-encoded customers and item codes, typed
+    number and date columns, and plain strings for anything else"""
+    columns = []
+    covered = set()
+    for fields in DICTIONARY_COLUMNS:
+        columns.append(dictionary_column(sales_data, fields))
+        covered.update(fields)
+    for field in NUMBER_COLUMNS:
+        columns.append({"type": "number", "fields": [field],
+                        "values": [parse_number(row.get(field)) for row in sales_data]})
+        covered.add(field)
+    for field, date_format in DATE_COLUMNS.items():
+        columns.append(date_column(sales_data, field, date_format))
+        covered.add(field)
+
+    field_order = list(sales_data[0]) if sales_data else []
+    for field in field_order:
+        if field not in covered:
+            columns.append({"type": "string", "fields": [field],
+                            "values": [row.get(field, '') for row in sales_data]})
+
+    return {
+        "format": COLUMNAR_FORMAT,
+        "version": COLUMNAR_VERSION,
+        "rows": len(sales_data),
+        "fields": field_order,
+        "columns": columns,
+    }
+
+
+def top_customer(dataset):
+    """([CustID, FirstName, LastName], total) of the customer who spent most"""
+    top = dataset["cubes"]["customer"]
+    if not top["customer"]:
+        return None
+    return dataset["columns"][0]["dictionary"][top["customer"][0]], top["total"][0]
+
+
+def cube_path_for(output_path, name):
+    """sales-data.columnar.json -> sales-data.columnar.customer_month.json"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.{name}{ext}"
+
+
+def dataset_id(dataset):
+    """Content hash naming a columnar file, so a delta is only merged into its own base"""
+    data = json.dumps(dataset, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def write_columnar(dataset, output_path=COLUMNAR_FILE, compress=("gzip", "brotli")):
+    """Write a columnar dataset or cube file as JSON plus pre-compressed copies, returning {path: bytes}"""
+    data = json.dumps(dataset, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    written = {}
+
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    written[output_path] = len(data)
+
+    if "gzip" in compress:
+        # mtime=0 keeps the .gz byte-identical when the data has not changed
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(output_path + '.gz', 'wb') as f:
+            f.write(compressed)
+        written[output_path + '.gz'] = len(compressed)
+
+    if "brotli" in compress:
+        if BROTLI_AVAILABLE:
+            import brotli
+            compressed = brotli.compress(data, quality=11)
+            with open(output_path + '.br', 'wb') as f:
+                f.write(compressed)
+            written[output_path + '.br'] = len(compressed)
+        else:
+            print("⚠️  brotli not installed (pip install brotli), skipping .br")
+
+    return written
+
+
+# --- Incremental refresh -----------------------------------------------------------
+
+def delta_path_for(output_path):
+    """sales-data.columnar.json -> sales-data.columnar.delta.json"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}.delta{ext}"
+
 
-        # Calculate some quick stats to verify
-        total_sales = 0
-        valid_records = 0
-
-        for record in sales_data:
-            try:
-                so_total = float(record.get('SOTotal', 0))
-                total_sales += so_total
-                if so_total > 0:
-                    valid_records += 1
-            except (ValueError, TypeError):
-                continue
-
-        print(f"Total records: {len(sales_data)}")
-        print(f"Valid sales records: {valid_records}")
-        print(f"Total sales value: £{total_sales:,.2f}")
-
-        # Find highest customer
-        customer_totals = {}
-        for record in sales_data:
-            try:
-                so_total = float(record.get('SOTotal', 0))
-                customer_name = f"{record.get('FirstName', '')} {record.get('LastName', '')}".strip()
-
-                if customer_name and so_total > 0:
-                    if customer_name not in customer_totals:
-                        customer_totals[customer_name] = 0
-                    customer_totals[customer_name] += so_total
-            except (ValueError, TypeError):
-                continue
-
-        if customer_totals:
-            top_customer = max(customer_totals.items(), key=lambda x: x[1])
-            print(f"Top customer: {top_customer[0]} - £{top_customer[1]:,.2f}")
-
-        # Generate JavaScript code
-        js_output = f"""
+def csv_watermark(data, rows, hashes, last_date):
+    """How far into the CSV bytes the store has ingested.
+
+    offset is the end of the last complete line and prefix_sha256 covers
+    everything before it. A final line without a newline is still ingested;
+    pending_row keeps its [id, hash] so a later export that finishes or
+    changes that line is recognised.
+    """
+    offset = data.rfind(b'\n') + 1
+    pending = data[offset:].strip() and rows
+    return {
+        "offset": offset,
+        "prefix_sha256": hashlib.sha256(data[:offset]).hexdigest(),
+        "pending_row": [len(rows) - 1, hashes[-1]] if pending else None,
+        "last_date": last_date.isoformat() if last_date else None,
+        "last_row_hash": hashes[-1] if hashes else None,
+    }
+
+
+def rebuild(csv_path, output_path, compress, store):
+    """Full export: rewrite the columnar file and reset the store and delta to match it"""
+    sales_data = load_sales_rows(csv_path)
+    print(f"Successfully loaded {len(sales_data)} records")
+
+    # Typed columns and summary cubes are built once, for the summary and the export
+    dataset = build_columnar(sales_data)
+    cubes = build_cubes(dataset)
+    dataset["cubes"] = {name: cube for name, cube in cubes.items() if name not in SEPARATE_CUBES}
+    dataset["id"] = dataset_id(dataset)
+
+    dictionaries = [column for column in dataset["columns"] if column["type"] == "dictionary"]
+    dates = next(column for column in dataset["columns"] if column["type"] == "date")
+    known_days = [days for days in dates["days"] if days is not None]
+    last_date = date.fromisoformat(dates["base"]) + timedelta(days=max(known_days)) if known_days else None
+    print_summary(dataset["cubes"]["summary"], top_customer(dataset))
+
+    written = write_columnar(dataset, output_path, compress)
+    for name in SEPARATE_CUBES:
+        # Tagged with the columnar file's id, like a delta, so the page never mixes exports
+        cube_file = {"base": dataset["id"], "name": name, "cube": cubes[name]}
+        written.update(write_columnar(cube_file, cube_path_for(output_path, name), compress))
+
+    with open(csv_path, 'rb') as f:
+        data = f.read()
+    hashes = [row_hash(row) for row in sales_data]
+    store.reset(
+        sales_data, hashes,
+        [column["dictionary"] for column in dictionaries],
+        cubes,
+        base={
+            "id": dataset["id"],
+            "rows": len(sales_data),
+            "fields": dataset["fields"],
+            "dictionaries": [len(column["dictionary"]) for column in dictionaries],
+            "date_base": dates["base"],
+        },
+        watermark=csv_watermark(data, sales_data, hashes, last_date),
+    )
+    written.update(write_delta(store, delta_path_for(output_path)))
+    store.commit()
+    return written
+
+
+def read_changes(csv_path, store):
+    """(added rows, their hashes, removed row ids, watermark) since the last refresh,
+    or None when the CSV's columns changed and the export must be rebuilt"""
+    watermark = store.get_meta(WATERMARK)
+    fields = store.get_meta(BASE)["fields"]
+
+    with open(csv_path, 'rb') as f:
+        prefix = hashlib.sha256()
+        remaining = watermark["offset"]
+        while remaining > 0:
+            chunk = f.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            prefix.update(chunk)
+            remaining -= len(chunk)
+        appended = remaining == 0 and prefix.hexdigest() == watermark["prefix_sha256"]
+        tail = f.read() if appended else None
+
+    if appended:
+        # Everything up to the watermark is unchanged: only read what follows it
+        rows = parse_csv_tail(tail, fields)
+        hashes = [row_hash(row) for row in rows]
+        removed = []
+        pending = watermark["pending_row"]
+        if pending:
+            if hashes and hashes[0] == pending[1]:
+                rows, hashes = rows[1:], hashes[1:]
+            else:
+                removed.append(pending[0])
+                pending = None
+        end = tail.rfind(b'\n') + 1
+        prefix.update(tail[:end])
+        offset = watermark["offset"] + end
+        if not tail[end:].strip():
+            pending = None
+        elif rows:
+            pending = [store.row_count() + len(rows) - 1, hashes[-1]]
+        last_row_hash = hashes[-1] if hashes else watermark["last_row_hash"]
+    else:
+        # History was rewritten: diff every row against the store by hash
+        rows_now = load_sales_rows(csv_path)
+        if rows_now and list(rows_now[0]) != fields:
+            return None
+        existing = store.active_hashes()
+        next_id = store.row_count()
+        rows, hashes, ids = [], [], []
+        for row in rows_now:
+            row_id = row_hash(row)
+            matches = existing.get(row_id)
+            if matches:
+                ids.append(matches.pop(0))
+            else:
+                rows.append(row)
+                hashes.append(row_id)
+                ids.append(next_id)
+                next_id += 1
+        removed = sorted(row_id for matches in existing.values() for row_id in matches)
+        with open(csv_path, 'rb') as f:
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        prefix = hashlib.sha256(data[:end])
+        offset = end
+        last_row_hash = row_hash(rows_now[-1]) if rows_now else None
+        pending = [ids[-1], last_row_hash] if data[end:].strip() and rows_now else None
+
+    dates = [parse_date(row.get("SODate"), DATE_COLUMNS["SODate"]) for row in rows]
+    dates = [day for day in dates if day is not None]
+    if watermark["last_date"]:
+        dates.append(date.fromisoformat(watermark["last_date"]))
+    return rows, hashes, removed, {
+        "offset": offset,
+        "prefix_sha256": prefix.hexdigest(),
+        "pending_row": pending,
+        "last_date": max(dates).isoformat() if dates else None,
+        "last_row_hash": last_row_hash,
+    }
+
+
+def row_cells(store, row, sign):
+    """Cube cell changes (cube, key1, key2, total, count) for adding (sign 1) or
+    removing (sign -1) one row; also registers its dictionary entries"""
+    ids = [store.dictionary_id(col, [row.get(field, '') for field in fields])
+           for col, fields in enumerate(DICTIONARY_COLUMNS)]
+    if not row.get("CustID"):
+        return []
+    total = (parse_number(row.get("SOTotal")) or 0) * sign
+    customer = ids[0]
+    cells = [("customer", customer, 0, total, sign),
+             ("item_prefix", item_prefix(row.get("ItemCode", '')), 0, total, sign)]
+    day = parse_date(row.get("SODate"), DATE_COLUMNS["SODate"])
+    if day is not None:
+        cells += [("month", month_key(day), 0, total, sign),
+                  ("customer_month", customer, month_key(day), total, sign)]
+    return cells
+
+
+def apply_changes(store, rows, hashes, removed_ids, watermark):
+    """Update the store's rows, cubes and summaries with one refresh's changes"""
+    removed_rows = store.remove_rows(removed_ids)
+    store.add_rows(rows, hashes)
+
+    summary = store.get_meta(SUMMARY)
+    summary_delta = store.get_meta(SUMMARY_DELTA)
+    cells = []
+    for changed, sign in ((rows, 1), (removed_rows, -1)):
+        for row in changed:
+            row_changes = row_cells(store, row, sign)
+            cells += row_changes
+            change = {"rows": sign}
+            if row_changes:
+                total = row_changes[0][3]
+                change.update(orders=sign, valid=sign if total * sign > 0 else 0, total=total)
+            for totals in (summary, summary_delta):
+                for key, value in change.items():
+                    totals[key] = totals.get(key, 0) + value
+
+    store.adjust_cells(cells)
+    store.set_meta(SUMMARY, summary)
+    store.set_meta(SUMMARY_DELTA, summary_delta)
+    store.set_meta(WATERMARK, watermark)
+
+
+def build_delta(store):
+    """Rows and cube changes since the columnar file was written, encoded like it.
+
+    Dictionary columns list only the entries added since, numbered on from
+    the file's own; row positions continue from the file's last row, and
+    "removed" gives the positions of rows no longer in the CSV.
+    """
+    base = store.get_meta(BASE)
+    rows = [row for _, row in store.rows_from(base["rows"])]
+
+    columns = []
+    covered = set()
+    for col, fields in enumerate(DICTIONARY_COLUMNS):
+        columns.append({
+            "type": "dictionary",
+            "fields": list(fields),
+            "dictionary": store.dictionary_entries(col, base["dictionaries"][col]),
+            "indexes": [store.dictionary_id(col, [row.get(field, '') for field in fields]) for row in rows],
+        })
+        covered.update(fields)
+    for field in NUMBER_COLUMNS:
+        columns.append({"type": "number", "fields": [field],
+                        "values": [parse_number(row.get(field)) for row in rows]})
+        covered.add(field)
+    date_base = date.fromisoformat(base["date_base"])
+    for field, date_format in DATE_COLUMNS.items():
+        dates = [parse_date(row.get(field), date_format) for row in rows]
+        columns.append({"type": "date", "fields": [field], "base": base["date_base"],
+                        "days": [(day - date_base).days if day is not None else None for day in dates]})
+        covered.add(field)
+    for field in base["fields"]:
+        if field not in covered:
+            columns.append({"type": "string", "fields": [field],
+                            "values": [row.get(field, '') for row in rows]})
+
+    cubes = {}
+    for name, cells in store.delta_cells().items():
+        dimensions = CUBES[name]
+        cube = {"dimensions": list(dimensions)}
+        for i, dimension in enumerate(dimensions):
+            cube[dimension] = [cell[i] for cell in cells]
+        cube["total"] = [round_amount(cell[2]) for cell in cells]
+        cube["count"] = [cell[3] for cell in cells]
+        cubes[name] = cube
+    summary_delta = store.get_meta(SUMMARY_DELTA)
+    summary_delta["total"] = round_amount(summary_delta["total"])
+    cubes["summary"] = summary_delta
+
+    return {
+        "format": DELTA_FORMAT,
+        "version": DELTA_VERSION,
+        "base": base["id"],
+        "rows": len(rows),
+        "removed": store.removed_ids(),
+        "fields": base["fields"],
+        "columns": columns,
+        "cubes": cubes,
+    }
+
+
+def write_delta(store, delta_path):
+    data = json.dumps(build_delta(store), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    with open(delta_path, 'wb') as f:
+        f.write(data)
+    return {delta_path: len(data)}
+
+
+def refresh(csv_path, output_path, compress, store):
+    """Ingest only what changed in the CSV since the last run and rewrite the delta,
+    rebuilding everything when there is no usable store or the delta has grown too big"""
+    base = store.get_meta(BASE)
+    exported = [output_path] + [cube_path_for(output_path, name) for name in SEPARATE_CUBES]
+    if base is None or not all(os.path.exists(path) for path in exported):
+        print("🔄 No previous export to refresh, building it in full")
+        return rebuild(csv_path, output_path, compress, store)
+
+    changes = read_changes(csv_path, store)
+    if changes is None:
+        print("🔄 Sales CSV columns changed, rebuilding the export")
+        return rebuild(csv_path, output_path, compress, store)
+
+    rows, hashes, removed, watermark = changes
+    apply_changes(store, rows, hashes, removed, watermark)
+    print(f"Ingested {len(rows)} new or changed rows, {len(removed)} removed "
+          f"(watermark {watermark['last_date']})")
+
+    delta_rows = store.row_count() - base["rows"]
+    if delta_rows + len(store.removed_ids()) > REBASE_FRACTION * max(base["rows"], 1):
+        print(f"🔄 Delta holds {delta_rows} rows, rewriting the full export")
+        return rebuild(csv_path, output_path, compress, store)
+
+    top = store.top_cells("customer")
+    print_summary(store.get_meta(SUMMARY), (store.dictionary_entry(0, top[0][0]), top[0][2]) if top else None)
+
+    written = write_delta(store, delta_path_for(output_path))
+    store.commit()
+    return written
+
+
+# --- Legacy embedded script --------------------------------------------------------
+
+def write_embedded_js(sales_data, output_path=EMBEDDED_JS_FILE):
+    """Write the legacy loadEmbeddedSalesData() script"""
+    js_output = f"""
         function loadEmbeddedSalesData() {{
             // Full sales data - {len(sales_data)} records
             const salesDataArray = {json.dumps(sales_data, indent=2)};
@@ -92,16 +548,63 @@ def convert_csv_to_js():
         }}
         """
 
-        # Write the JavaScript function to a file
-        with open('sales-data-embedded.js', 'w') as js_file:
-            js_file.write(js_output)
+    # Write the JavaScript function to a file
+    with open(output_path, 'w') as js_file:
+        js_file.write(js_output)
+    return os.path.getsize(output_path)
+
+
+def main():
+    import argparse
 
-        print(f"\nGenerated sales-data-embedded.js with full dataset")
-        print("You can now replace the loadEmbeddedSalesData function in your HTML file")
+    parser = argparse.ArgumentParser(description='Export Sales Data.csv for the sales chatbot')
+    parser.add_argument('--format', choices=['columnar', 'embedded'], default='columnar',
+                        help='columnar JSON (default) or the legacy sales-data-embedded.js')
+    parser.add_argument('--csv', default=CSV_FILE, help='Sales CSV to read')
+    parser.add_argument('--output', help='Output file (default depends on --format)')
+    parser.add_argument('--compress', nargs='*', choices=['gzip', 'brotli'], default=['gzip', 'brotli'],
+                        help='Pre-compressed copies to write next to the columnar file (none with no values)')
+    parser.add_argument('--store', default=SALES_STORE_FILE,
+                        help='SQLite store of ingested rows used for incremental refreshes')
+    parser.add_argument('--full', action='store_true',
+                        help='Rewrite the whole columnar export instead of only a delta of new rows')
 
+    args = parser.parse_args()
+    csv_size = os.path.getsize(args.csv) if os.path.exists(args.csv) else 0
+
+    if args.format == 'embedded':
+        try:
+            sales_data = load_sales_rows(args.csv)
+        except Exception as e:
+            print(f"❌ Error reading CSV file: {e}")
+            exit(1)
+
+        print(f"Successfully loaded {len(sales_data)} records")
+        dataset = build_columnar(sales_data)
+        dataset["cubes"] = build_cubes(dataset)
+        print_summary(dataset["cubes"]["summary"], top_customer(dataset))
+
+        output = args.output or EMBEDDED_JS_FILE
+        size = write_embedded_js(sales_data, output)
+        print(f"\n✅ Generated {output} ({size / 1024:,.0f} KB from a {csv_size / 1024:,.0f} KB CSV)")
+        return
+
+    output = args.output or COLUMNAR_FILE
+    store = SalesStore(args.store)
+    try:
+        if args.full:
+            written = rebuild(args.csv, output, args.compress, store)
+        else:
+            written = refresh(args.csv, output, args.compress, store)
     except Exception as e:
-        print(f"Error reading CSV file: {e}")
-        return None
+        print(f"❌ Error exporting sales data: {e}")
+        exit(1)
+    finally:
+        store.close()
+    print()
+    for path, size in written.items():
+        print(f"✅ Generated {path} ({size / 1024:,.0f} KB, {csv_size / size:.1f}x smaller than the CSV)")
+
 
 if __name__ == "__main__":
-    convert_csv_to_js()
\ No newline at end of file
+    main()
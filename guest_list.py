@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Guest List
+Streaming ingestion of event guest list CSVs and a compact, cached guest table
+shared by every pipeline stage
+"""
+
+import os
+import io
+import csv
+import sys
+import tempfile
+import threading
+from array import array
+
+# Canonical column order written to csv/guest_list.csv
+GUEST_CSV_COLUMNS = ['name', 'email', 'guest_count', 'pass_id', 'host_gallery', 'art_consultant']
+REQUIRED_COLUMNS = ['name', 'email', 'guest_count', 'pass_id']
+
+# Only the first few row errors are reported back so the response stays small
+MAX_REPORTED_ERRORS = 100
+
+
+def normalize_guest_row(row, seen_pass_ids):
+    """Validate and clean a single guest row, returning (row, error)"""
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        cleaned[key] = value.strip() if value else ''
+
+    for column in GUEST_CSV_COLUMNS:
+        cleaned.setdefault(column, '')
+
+    if not cleaned['name']:
+        return None, "missing name"
+
+    if '@' not in cleaned['email']:
+        return None, f"invalid email '{cleaned['email']}'"
+
+    try:
+        guest_count = int(cleaned['guest_count'])
+    except ValueError:
+        return None, f"invalid guest_count '{cleaned['guest_count']}'"
+    if guest_count < 1:
+        return None, f"guest_count must be at least 1 (got {guest_count})"
+    cleaned['guest_count'] = str(guest_count)
+
+    if not cleaned['pass_id']:
+        return None, "missing pass_id"
+    if cleaned['pass_id'] in seen_pass_ids:
+        return None, f"duplicate pass_id '{cleaned['pass_id']}'"
+
+    return cleaned, None
+
+
+def ingest_guest_csv(stream, csv_path):
+    """Stream a raw guest list CSV into csv_path, one row at a time.
+
+    stream is a binary file-like object (an uploaded file or request body).
+    Rows are validated as they are read and written straight to disk, so
+    memory use does not grow with the size of the guest list. The target
+    file is only replaced once the whole upload has been written.
+    """
+    result = {
+        "success": False,
+        "rows_read": 0,
+        "rows_written": 0,
+        "rows_rejected": 0,
+        "errors": []
+    }
+
+    text_stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    temp_path = None
+
+    try:
+        reader = csv.DictReader(text_stream)
+        header = [column.strip() for column in (reader.fieldnames or [])]
+        reader.fieldnames = header
+
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            result["error"] = f"CSV is missing required columns: {', '.join(missing)}"
+            return result
+
+        fieldnames = GUEST_CSV_COLUMNS + [c for c in header if c and c not in GUEST_CSV_COLUMNS]
+        seen_pass_ids = set()
+
+        # Private temp file per upload, so concurrent uploads to one event cannot interleave
+        fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(csv_path) + '.', suffix='.partial',
+                                         dir=os.path.dirname(csv_path))
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+
+            for row in reader:
+                result["rows_read"] += 1
+                cleaned, error = normalize_guest_row(row, seen_pass_ids)
+
+                if error:
+                    result["rows_rejected"] += 1
+                    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                        result["errors"].append(f"Row {reader.line_num}: {error}")
+                    continue
+
+                seen_pass_ids.add(cleaned['pass_id'])
+                writer.writerow(cleaned)
+                result["rows_written"] += 1
+
+        os.replace(temp_path, csv_path)
+        result["success"] = True
+        result["csv_path"] = csv_path
+        return result
+
+    except (UnicodeDecodeError, csv.Error) as e:
+        result["error"] = f"Could not parse CSV: {str(e)}"
+        return result
+
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        # Leave the underlying upload stream open for the caller
+        text_stream.detach()
+
+
+class GuestRow:
+    """Lightweight read-only view of one guest in a GuestTable.
+
+    Behaves like the dicts csv.DictReader used to return (row['name'],
+    row.get('host_gallery')) without allocating a dict per guest.
+    """
+
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == 'guest_count':
+            return str(self._table.guest_counts[self._index])
+        return self._table.columns[key][self._index]
+
+    def __contains__(self, key):
+        return key in self._table.columns or key == 'guest_count'
+
+    def __iter__(self):
+        return iter(self._table.fieldnames)
+
+    def __len__(self):
+        return len(self._table.fieldnames)
+
+    def __repr__(self):
+        return f"GuestRow({self.as_dict()!r})"
+
+    @property
+    def index(self):
+        return self._index
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._table.fieldnames)
+
+    def items(self):
+        return [(key, self[key]) for key in self._table.fieldnames]
+
+    def as_dict(self):
+        """Return a mutable copy of this guest as a plain dict"""
+        return dict(self.items())
+
+    copy = as_dict
+
+
+class GuestTable:
+    """Column-oriented guest list parsed once from csv/guest_list.csv.
+
+    Each text column is a list of interned strings, so repeated values such
+    as host galleries and consultants share a single object, and guest counts
+    live in a typed array. Rows are exposed as GuestRow views. Rows that
+    cannot be used (e.g. a blank guest_count) are skipped and described in
+    warnings.
+    """
+
+    __slots__ = ('csv_path', 'fieldnames', 'columns', 'guest_counts', 'warnings',
+                 '_by_pass_id', '_by_email', '_by_name')
+
+    def __init__(self, csv_path, fieldnames):
+        self.csv_path = csv_path
+        self.fieldnames = tuple(fieldnames)
+        self.columns = {name: [] for name in self.fieldnames if name != 'guest_count'}
+        self.guest_counts = array('I')
+        self.warnings = []
+        self._by_pass_id = {}
+        self._by_email = {}
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self.guest_counts)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield GuestRow(self, index)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("guest index out of range")
+        return GuestRow(self, index)
+
+    def append(self, row, line_num=None):
+        """Add a guest row, returning False (with a warning) if it was skipped"""
+        index = len(self)
+        guest_count = (row.get('guest_count') or '').strip()
+        try:
+            count = int(guest_count)
+            self.guest_counts.append(count)
+        except (ValueError, OverflowError):
+            name = (row.get('name') or '').strip()
+            self.warnings.append(f"Row {line_num or index + 2}: skipped {name or 'guest'}, "
+                                 f"invalid guest_count '{guest_count}'")
+            return False
+
+        for name, values in self.columns.items():
+            value = (row.get(name) or '').strip()
+            values.append(sys.intern(value))
+
+        self._by_pass_id.setdefault(self.columns['pass_id'][index].lower(), index)
+        self._by_email.setdefault(self.columns['email'][index].lower(), index)
+        self._by_name.setdefault(self.columns['name'][index].lower(), index)
+        return True
+
+    def _row_or_none(self, index):
+        return GuestRow(self, index) if index is not None else None
+
+    def find_by_pass_id(self, pass_id):
+        return self._row_or_none(self._by_pass_id.get(pass_id.lower()))
+
+    def find_by_email(self, email):
+        return self._row_or_none(self._by_email.get(email.lower()))
+
+    def find_by_name(self, name):
+        return self._row_or_none(self._by_name.get(name.lower()))
+
+    def lookup(self, key):
+        """Find a guest by pass_id, email or name (case-insensitive, in that order)"""
+        key = key.strip().lower()
+        for index in (self._by_pass_id, self._by_email, self._by_name):
+            if key in index:
+                return GuestRow(self, index[key])
+        return None
+
+    def total_guests(self):
+        return sum(self.guest_counts)
+
+
+def parse_guest_table(csv_path):
+    """Parse a guest list CSV into a GuestTable"""
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        header = [column.strip() for column in (reader.fieldnames or [])]
+        reader.fieldnames = header
+        fieldnames = GUEST_CSV_COLUMNS + [c for c in header if c and c not in GUEST_CSV_COLUMNS]
+
+        table = GuestTable(csv_path, fieldnames)
+        for row in reader:
+            table.append(row, reader.line_num)
+
+    for warning in table.warnings:
+        print(f"⚠️  {csv_path}: {warning}")
+    return table
+
+
+# Parsed tables keyed by absolute CSV path, invalidated on mtime/size change
+_table_cache = {}
+_table_cache_lock = threading.Lock()
+
+
+def guest_csv_path(event_dir):
+    return os.path.join(event_dir, "csv", "guest_list.csv")
+
+
+def load_guest_table(csv_path):
+    """Return the cached GuestTable for csv_path, re-parsing if the file changed"""
+    csv_path = os.path.abspath(csv_path)
+    stat = os.stat(csv_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+
+    with _table_cache_lock:
+        cached = _table_cache.get(csv_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+    table = parse_guest_table(csv_path)
+
+    with _table_cache_lock:
+        _table_cache[csv_path] = (signature, table)
+    return table
+
+
+def load_event_guests(event_dir):
+    """Return the cached GuestTable for an event directory"""
+    return load_guest_table(guest_csv_path(event_dir))
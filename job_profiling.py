@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Job Profiling
+Runs a coordinator background job under cProfile and tracemalloc and saves the
+results into the event's profiles/ folder
+"""
+
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+# Set to "1"/"all" or a comma-separated list of job kinds to profile every run
+PROFILE_ENV = "COORDINATOR_PROFILE_JOBS"
+PROFILED_JOBS = ["apple_wallet", "google_wallet", "emails"]
+PROFILES_DIRNAME = "profiles"
+
+# Work these jobs hand to scripts, which cProfile sees only as time spent waiting
+JOB_SUBPROCESSES = {
+    "apple_wallet": "generate_passes.py and create_passes.sh",
+    "google_wallet": "google_wallet_generator.py",
+}
+
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+# cProfile and tracemalloc's peak are process-wide (Python 3.12 refuses a
+# second active profiler), so only one job is profiled at a time
+_profiling_lock = threading.Lock()
+
+
+def profiling_enabled_for(kind):
+    """Whether COORDINATOR_PROFILE_JOBS asks for every run of this job kind to be profiled"""
+    setting = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if not setting or setting in ("0", "false", "no"):
+        return False
+    if setting in ("1", "true", "yes", "all"):
+        return kind in PROFILED_JOBS
+    return kind in [item.strip() for item in setting.split(",")]
+
+
+def profiles_dir(event_dir):
+    return os.path.join(event_dir, PROFILES_DIRNAME)
+
+
+def run_profiled(handler, kind, event_name, event_dir):
+    """Run handler(event_name) under cProfile and tracemalloc.
+
+    Writes <kind>_<timestamp>.prof (open with snakeviz or pstats) and
+    <kind>_<timestamp>_report.txt (peak memory, top allocation sites and
+    slowest functions) to <event_dir>/profiles/, returning their paths.
+    If another job is already being profiled, the job runs unprofiled and
+    None is returned.
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        print(f"🔬 Another job is being profiled; running {kind} ({event_name}) without profiling")
+        handler(event_name)
+        return None
+    try:
+        return _run_profiled(handler, kind, event_name, event_dir)
+    finally:
+        _profiling_lock.release()
+
+
+def _run_profiled(handler, kind, event_name, event_dir):
+    output_dir = profiles_dir(event_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    stem = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    error = None
+    try:
+        profiler.enable()
+        try:
+            handler(event_name)
+        finally:
+            profiler.disable()
+    except Exception as e:
+        error = e
+    finally:
+        elapsed = time.perf_counter() - started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+    prof_path = os.path.join(output_dir, f"{stem}.prof")
+    profiler.dump_stats(prof_path)
+
+    report_path = os.path.join(output_dir, f"{stem}_report.txt")
+    with open(report_path, 'w') as f:
+        f.write(format_report(kind, event_name, elapsed, peak, snapshot, profiler, error))
+
+    print(f"🔬 Profile for {kind} ({event_name}) saved to {output_dir}")
+    if error is not None:
+        raise error
+    return {"prof": prof_path, "report": report_path}
+
+
+def format_report(kind, event_name, elapsed, peak, snapshot, profiler, error=None):
+    lines = [
+        f"Profile of {kind} for {event_name}",
+        f"Finished: {datetime.now().isoformat()}",
+        f"Wall time: {elapsed:.2f}s",
+        f"Peak traced memory: {peak / (1024 * 1024):.1f} MB",
+    ]
+    if error is not None:
+        lines.append(f"Job raised: {type(error).__name__}: {error}")
+    if kind in JOB_SUBPROCESSES:
+        lines.append(f"Note: {JOB_SUBPROCESSES[kind]} run as subprocesses; their time shows up "
+                     "as waiting, not as their own functions")
+
+    lines += ["", f"Top {TOP_ALLOCATIONS} allocation sites still held at the end of the job", "-" * 70]
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8} blocks  {frame.filename}:{frame.lineno}")
+
+    stats_text = io.StringIO()
+    pstats.Stats(profiler, stream=stats_text).strip_dirs().sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+    lines += ["", f"Top {TOP_FUNCTIONS} functions by cumulative time", "-" * 70, stats_text.getvalue()]
+    return '\n'.join(lines)
+
+
+def latest_profile(event_dir, kind=None):
+    """(prof_path, report_path) of the most recent profile, optionally of one job kind"""
+    output_dir = profiles_dir(event_dir)
+    if not os.path.isdir(output_dir):
+        return None
+    runs = sorted(
+        (name for name in os.listdir(output_dir)
+         if name.endswith('.prof') and (kind is None or name.startswith(f"{kind}_"))),
+        key=lambda name: os.path.getmtime(os.path.join(output_dir, name))
+    )
+    if not runs:
+        return None
+    prof_path = os.path.join(output_dir, runs[-1])
+    report_path = prof_path[:-len('.prof')] + '_report.txt'
+    return prof_path, report_path if os.path.exists(report_path) else None
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Coordinator Load Test
+Replays a realistic mix of coordinator API requests at a chosen concurrency and
+reports latency percentiles, error rates and throughput
+"""
+
+import os
+import sys
+import csv
+import time
+import random
+import shutil
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from urllib.parse import quote
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Typical .pkpass size with custom artwork
+FAKE_PASS_BYTES = 60 * 1024
+STATIC_PAGES = ["/", "/event-workflow.html", "/style.css", "/script.js"]
+
+# Endpoint weights, concurrency and default length of each scenario
+SCENARIOS = {
+    "staff": {
+        "description": "A dozen staff running an event: progress polling, page loads, occasional downloads",
+        "guests": 500,
+        "concurrency": 12,
+        "requests": 2000,
+        "mix": {"progress": 60, "static": 25, "apple_pass": 10, "bundle": 5},
+    },
+    "launch_day": {
+        "description": "Invitations just went out: thousands of guests tapping their pass links",
+        "guests": 5000,
+        "concurrency": 200,
+        "requests": 20000,
+        "mix": {"apple_pass": 90, "progress": 5, "static": 5},
+    },
+    "bundles": {
+        "description": "Several staff downloading the Apple pass ZIP at once",
+        "guests": 2000,
+        "concurrency": 8,
+        "requests": 40,
+        "mix": {"bundle": 100},
+    },
+}
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+# --- Fixture event ----------------------------------------------------------
+
+def create_fixture_event(events_dir, guests, seed=7):
+    """Event with a guest list and one dummy .pkpass per guest, returning (event_name, pass_ids)"""
+    from guest_list import ingest_guest_csv, guest_csv_path
+
+    event_name = f"LoadTest_{guests}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    event_dir = os.path.join(events_dir, event_name)
+    apple_dir = os.path.join(event_dir, "apple_passes")
+    os.makedirs(os.path.join(event_dir, "csv"), exist_ok=True)
+    os.makedirs(apple_dir, exist_ok=True)
+
+    rng = random.Random(seed)
+    pass_ids = [f"L{i:06d}" for i in range(guests)]
+
+    raw_csv = os.path.join(event_dir, "raw_guest_list.csv")
+    with open(raw_csv, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['name', 'email', 'guest_count', 'pass_id'])
+        for i, pass_id in enumerate(pass_ids):
+            writer.writerow([f"Load Guest {i}", f"guest{i}@example.com", rng.randint(1, 4), pass_id])
+    with open(raw_csv, 'rb') as stream:
+        ingest_guest_csv(stream, guest_csv_path(event_dir))
+    os.remove(raw_csv)
+
+    for pass_id in pass_ids:
+        with open(os.path.join(apple_dir, f"{pass_id}.pkpass"), 'wb') as f:
+            f.write(rng.randbytes(FAKE_PASS_BYTES))
+
+    return event_name, pass_ids
+
+
+def load_event_pass_ids(events_dir, event_name):
+    from guest_list import load_event_guests
+    return [guest['pass_id'] for guest in load_event_guests(os.path.join(events_dir, event_name))]
+
+
+# --- Clients ----------------------------------------------------------------
+
+class HTTPClient:
+    """Requests against a running coordinator"""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def get(self, path):
+        """(status, body_bytes)"""
+        try:
+            with urllib.request.urlopen(self.base_url + path, timeout=self.timeout) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+class TestClient:
+    """Requests straight into the Flask app, one test client per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def get(self, path):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.get(path)
+        try:
+            return response.status_code, len(response.get_data())
+        finally:
+            response.close()
+
+
+def request_paths(event_name, pass_ids, rng):
+    """Path generators for each kind of request in a scenario mix"""
+    event = quote(event_name)
+    return {
+        "progress": lambda: f"/api/events/{event}/progress",
+        "static": lambda: rng.choice(STATIC_PAGES),
+        "apple_pass": lambda: f"/api/events/{event}/apple-pass/{quote(rng.choice(pass_ids))}",
+        "bundle": lambda: f"/api/events/{event}/files/apple_passes",
+    }
+
+
+# --- Load generation ----------------------------------------------------------
+
+class LoadStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}     # kind -> [seconds]
+        self.errors = {}        # kind -> count
+        self.bytes = 0
+        self.error_samples = []
+
+    def record(self, kind, elapsed, status, size, error=None):
+        with self.lock:
+            self.latencies.setdefault(kind, []).append(elapsed)
+            self.bytes += size
+            if error or status >= 400:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+                if len(self.error_samples) < 10:
+                    self.error_samples.append(f"{kind}: {error or f'HTTP {status}'}")
+
+
+def run_load(client, scenario, event_name, pass_ids, concurrency, total_requests, duration=None, seed=1):
+    """Closed-loop load: each worker sends its next request as soon as the last one finishes"""
+    stats = LoadStats()
+    kinds = list(scenario["mix"])
+    weights = [scenario["mix"][kind] for kind in kinds]
+    remaining = [total_requests]
+    remaining_lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def take_ticket():
+        if deadline is not None:
+            return time.perf_counter() < deadline
+        with remaining_lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        paths = request_paths(event_name, pass_ids, rng)
+        while take_ticket():
+            kind = rng.choices(kinds, weights)[0]
+            started = time.perf_counter()
+            try:
+                status, size = client.get(paths[kind]())
+                stats.record(kind, time.perf_counter() - started, status, size)
+            except Exception as e:
+                stats.record(kind, time.perf_counter() - started, 0, 0, error=f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(stats, elapsed):
+    """Per-endpoint and overall latency percentiles (ms), error rate and throughput"""
+    summary = {}
+    all_latencies = []
+    for kind, latencies in stats.latencies.items():
+        all_latencies.extend(latencies)
+        summary[kind] = latency_summary(sorted(latencies), stats.errors.get(kind, 0), elapsed)
+    summary["all"] = latency_summary(sorted(all_latencies), sum(stats.errors.values()), elapsed)
+    summary["all"]["mb_per_s"] = round(stats.bytes / (1024 * 1024) / elapsed, 1) if elapsed else 0
+    return summary
+
+
+def latency_summary(latencies, errors, elapsed):
+    count = len(latencies)
+    result = {"requests": count, "errors": errors, "error_rate": round(errors / count, 4) if count else 0,
+              "throughput_per_s": round(count / elapsed, 1) if elapsed else 0}
+    for pct in PERCENTILES:
+        result[f"p{pct}_ms"] = round(percentile(latencies, pct) * 1000, 1)
+    result["max_ms"] = round(latencies[-1] * 1000, 1) if latencies else 0
+    return result
+
+
+def print_summary(summary):
+    print(f"{'endpoint':<12}{'requests':>9}{'errors':>8}{'req/s':>9}"
+          + ''.join(f"{f'p{pct}':>9}" for pct in PERCENTILES) + f"{'max':>9}")
+    for kind, result in summary.items():
+        print(f"{kind:<12}{result['requests']:>9,}{result['errors']:>8,}{result['throughput_per_s']:>9.1f}"
+              + ''.join(f"{result[f'p{pct}_ms']:>7.1f}ms" for pct in PERCENTILES)
+              + f"{result['max_ms']:>7.1f}ms")
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Load test the workflow coordinator API')
+    parser.add_argument('scenario', nargs='?', choices=list(SCENARIOS), default='staff', help='Traffic mix to replay')
+    parser.add_argument('--url', help='Coordinator to test, e.g. http://localhost:5001 (default: in-process test client)')
+    parser.add_argument('--event', help='Existing event to use instead of creating a synthetic one')
+    parser.add_argument('--guests', type=int, help='Guests in the synthetic event')
+    parser.add_argument('--concurrency', type=int, help='Simultaneous clients')
+    parser.add_argument('--requests', type=int, help='Total requests to send')
+    parser.add_argument('--duration', type=float, help='Run for this many seconds instead of a request count')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Exit non-zero above this error rate')
+    parser.add_argument('--keep', action='store_true', help='Keep the synthetic event afterwards')
+
+    args = parser.parse_args()
+    scenario = SCENARIOS[args.scenario]
+    concurrency = args.concurrency or scenario["concurrency"]
+    total_requests = args.requests or scenario["requests"]
+
+    sys.path.insert(0, BASE_DIR)
+    temp_root = None
+    if args.url:
+        client = HTTPClient(args.url)
+        # The server reads events from the repo's events/ folder
+        events_dir = os.path.join(BASE_DIR, "events")
+        target = args.url
+    else:
+        import workflow_coordinator
+        client = TestClient(workflow_coordinator.app)
+        if not args.event:
+            # Keep the synthetic event out of the real events folder
+            temp_root = tempfile.mkdtemp(prefix="castle_loadtest_")
+            workflow_coordinator.EVENTS_DIR = temp_root
+        events_dir = workflow_coordinator.EVENTS_DIR
+        target = "in-process test client"
+
+    print(f"🚦 Scenario '{args.scenario}': {scenario['description']}")
+    print(f"🎯 Target: {target}")
+
+    created_dir = None
+    if args.event:
+        event_name = args.event
+        pass_ids = load_event_pass_ids(events_dir, event_name)
+    else:
+        guests = args.guests or scenario["guests"]
+        print(f"🏗️  Creating synthetic event with {guests:,} guests...")
+        event_name, pass_ids = create_fixture_event(events_dir, guests)
+        created_dir = os.path.join(events_dir, event_name)
+
+    if not pass_ids:
+        print(f"❌ No guests found for event '{event_name}'")
+        exit(1)
+
+    length = f"{args.duration:.0f}s" if args.duration else f"{total_requests:,} requests"
+    print(f"🔥 {concurrency} clients, {length}, {len(pass_ids):,} passes")
+    print("-" * 75)
+
+    try:
+        stats, elapsed = run_load(client, scenario, event_name, pass_ids, concurrency, total_requests, args.duration)
+    finally:
+        if temp_root and not args.keep:
+            # The temporary events folder holds the synthetic event and nothing else
+            shutil.rmtree(temp_root, ignore_errors=True)
+        elif created_dir and not args.keep:
+            shutil.rmtree(created_dir, ignore_errors=True)
+
+    summary = summarize(stats, elapsed)
+    print_summary(summary)
+    print("-" * 75)
+    print(f"⏱️  {elapsed:.1f}s, {summary['all']['throughput_per_s']:.1f} req/s, {summary['all']['mb_per_s']:.1f} MB/s")
+
+    for sample in stats.error_samples:
+        print(f"❌ {sample}")
+
+    if summary["all"]["error_rate"] > args.max_error_rate:
+        print(f"❌ Error rate {summary['all']['error_rate']:.2%} is above {args.max_error_rate:.2%}")
+        exit(1)
+    print(f"✅ Error rate {summary['all']['error_rate']:.2%}")
+
+if __name__ == '__main__':
+    main()
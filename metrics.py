@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Metrics
+Stage timings, counters and gauges shared by the pipeline modules and exposed
+by the coordinator's /metrics endpoint in Prometheus text format
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Set by the coordinator so its worker processes and the scripts it runs
+# (generate_passes.py, google_wallet_generator.py, ...) report into one place
+METRICS_DIR_ENV = "COORDINATOR_METRICS_DIR"
+FLUSH_INTERVAL = 5  # seconds between snapshot writes while metrics are changing
+
+# Upper bounds in seconds, from a single template render up to a whole job
+DURATION_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                    1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+
+METRICS = {
+    "castle_stage_duration_seconds": ("histogram", "Time per item in each pipeline stage"),
+    "castle_job_duration_seconds": ("histogram", "Time per background job"),
+    "castle_passes_built_total": ("counter", "Wallet passes built"),
+    "castle_emails_sent_total": ("counter", "Emails accepted by the SMTP server"),
+    "castle_emails_failed_total": ("counter", "Emails that could not be sent"),
+    "castle_bytes_written_total": ("counter", "Bytes of generated files written"),
+}
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [bucket counts..., +Inf count, sum]
+_gauges = {}        # name -> (help, callback, label name)
+_state = {"dirty": False, "flusher": None, "snapshot_path": None}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        _state["dirty"] = True
+    _ensure_flusher()
+
+
+def observe(name, seconds, **labels):
+    """Record one duration in a histogram"""
+    key = _key(name, labels)
+    with _lock:
+        buckets = _histograms.get(key)
+        if buckets is None:
+            buckets = _histograms[key] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+        buckets[bisect_left(DURATION_BUCKETS, seconds)] += 1
+        buckets[-1] += seconds
+        _state["dirty"] = True
+    _ensure_flusher()
+
+
+@contextmanager
+def timed(stage, name="castle_stage_duration_seconds", **labels):
+    """Time the enclosed block as one item of a pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, stage=stage, **labels)
+
+
+def register_gauge(name, help_text, callback, label=None):
+    """Gauge whose value is read from callback() at scrape time.
+
+    With label, callback returns {label_value: number} instead of a number.
+    """
+    _gauges[name] = (help_text, callback, label)
+
+
+# --- Sharing between processes ----------------------------------------------
+# Each process writes its totals to <metrics dir>/<pid>-<start>.json and the
+# /metrics endpoint adds up every file, so counts from gunicorn workers, the
+# job worker and pipeline scripts all appear in one scrape. Snapshots of
+# processes that have exited are folded into cumulative.json at scrape time,
+# so one file per pipeline script run does not pile up.
+
+CUMULATIVE_FILENAME = "cumulative.json"
+
+
+def metrics_dir():
+    return os.environ.get(METRICS_DIR_ENV)
+
+
+def _snapshot_path():
+    if _state["snapshot_path"] is None:
+        _state["snapshot_path"] = os.path.join(metrics_dir(), f"{os.getpid()}-{time.time_ns()}.json")
+    return _state["snapshot_path"]
+
+
+def _ensure_flusher():
+    if _state["flusher"] is not None or not metrics_dir():
+        return
+    with _lock:
+        if _state["flusher"] is not None:
+            return
+        _state["flusher"] = threading.Thread(target=_flush_loop, daemon=True)
+    _state["flusher"].start()
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _to_snapshot(counters, histograms):
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), list(values)] for (name, labels), values in histograms.items()],
+    }
+
+
+def _write_snapshot(path, snapshot):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(temp_path, path)
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(counters, histograms, snapshot):
+    """Add a snapshot's values into counters and histograms"""
+    for name, labels, value in snapshot.get("counters", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in snapshot.get("histograms", []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        if key in histograms:
+            histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+        else:
+            histograms[key] = list(values)
+
+
+def flush():
+    """Write this process's metrics to the shared directory if they changed"""
+    directory = metrics_dir()
+    if not directory or not _state["dirty"]:
+        return
+    with _lock:
+        snapshot = _to_snapshot(_counters, _histograms)
+        _state["dirty"] = False
+
+    os.makedirs(directory, exist_ok=True)
+    _write_snapshot(_snapshot_path(), snapshot)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fold_dead_snapshots(directory):
+    """Merge snapshots of processes that have exited into cumulative.json and remove them"""
+    dead = []
+    for name in os.listdir(directory):
+        pid = name.split('-', 1)[0]
+        if name.endswith('.json') and pid.isdigit() and not _pid_alive(int(pid)):
+            dead.append(name)
+    if not dead:
+        return
+
+    import fcntl
+
+    # Serialise folding between the worker processes so nothing is counted twice
+    with open(os.path.join(directory, ".fold.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        cumulative_path = os.path.join(directory, CUMULATIVE_FILENAME)
+        counters, histograms = {}, {}
+        _merge(counters, histograms, _read_snapshot(cumulative_path) or {})
+        folded = []
+        for name in dead:
+            snapshot = _read_snapshot(os.path.join(directory, name))
+            if snapshot is not None:
+                _merge(counters, histograms, snapshot)
+                folded.append(name)
+        if folded:
+            _write_snapshot(cumulative_path, _to_snapshot(counters, histograms))
+            for name in folded:
+                os.remove(os.path.join(directory, name))
+
+
+def clear_shared():
+    """Remove snapshots left by a previous run of the coordinator"""
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            os.remove(os.path.join(directory, name))
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero with its own snapshot file and flush thread
+    global _lock
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _state.update(dirty=False, flusher=None, snapshot_path=None)
+
+
+atexit.register(flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# --- Exposition ----------------------------------------------------------------
+
+def collect():
+    """(counters, histograms) for this process plus every other process's snapshot"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        own_path = _state["snapshot_path"]
+
+    directory = metrics_dir()
+    if directory and os.path.isdir(directory):
+        _fold_dead_snapshots(directory)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not name.endswith('.json') or path == own_path:
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot is not None:
+                _merge(counters, histograms, snapshot)
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    counters, histograms = collect()
+    lines = []
+
+    for metric, (metric_type, help_text) in METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        if metric_type == "counter":
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_format_labels(labels)} {_format_number(value)}")
+        else:
+            for (name, labels), values in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ['+Inf'], values[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _format_number(float(bound))
+                    lines.append(f"{metric}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {_format_number(values[-1])}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {cumulative}")
+
+    for name, (help_text, callback, label) in sorted(_gauges.items()):
+        try:
+            value = callback()
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        if label:
+            for label_value, number in sorted(value.items()):
+                lines.append(f"{name}{_format_labels([(label, label_value)])} {_format_number(number)}")
+        else:
+            lines.append(f"{name} {_format_number(value)}")
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Pass Assets
+Content-addressed Apple Wallet artwork, with retina variants rendered in the background
+"""
+
+import os
+import io
+import fcntl
+import hashlib
+import shutil
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from pass_customization import BASE_DIR, ensure_upload_folder, load_current_config, save_config, config_service
+
+ASSET_WORKERS = 2
+RETINA_SCALES = [('@2x', 2), ('@3x', 3)]
+
+# Held while pass_config.json is read, modified and written back
+config_lock = config_service.lock
+
+# Render status and the latest upload per type live next to pass_config.json,
+# so every worker process serving the customizer sees the same state:
+#   <asset_id>.pending   pid of the process rendering it
+#   <asset_id>.failed    the render error
+#   latest-<image_type>  asset_id of the most recent upload for that slot
+STATUS_DIR = os.path.join(os.path.dirname(config_service.save_path), 'asset_status')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def asset_id_for(image_type, data):
+    """Asset ID from the artwork's content, so identical uploads share one set of files"""
+    return f"{image_type}_{hashlib.sha256(data).hexdigest()[:16]}"
+
+
+def asset_path(asset_id, variant=''):
+    return os.path.join(ensure_upload_folder(), f"{asset_id}{variant}.png")
+
+
+def render_asset_variants(data, upload_dir, asset_id):
+    """Write <asset_id>.png, @2x and @3x into upload_dir (runs in a worker process).
+
+    Each file is written under a temporary name and renamed into place, and
+    the base image is published last, so once <asset_id>.png exists the
+    retina variants are guaranteed to be complete.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+
+    outputs = [(variant, image.resize((image.width * scale, image.height * scale), Image.Resampling.LANCZOS))
+               for variant, scale in RETINA_SCALES]
+    outputs.append(('', image))
+
+    for variant, rendered in outputs:
+        path = os.path.join(upload_dir, f"{asset_id}{variant}.png")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        rendered.save(temp_path, "PNG", optimize=True)
+        os.replace(temp_path, path)
+
+
+def _status_path(name):
+    return os.path.join(STATUS_DIR, name)
+
+
+def _write_marker(name, text):
+    path = _status_path(name)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def _read_marker(name):
+    try:
+        with open(_status_path(name)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove_marker(name):
+    try:
+        os.remove(_status_path(name))
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _rendering(asset_id):
+    """Whether a live process is rendering asset_id; a marker left by one that died does not count"""
+    pid = _read_marker(f"{asset_id}.pending")
+    return pid is not None and pid.isdigit() and _pid_alive(int(pid))
+
+
+@contextmanager
+def _assets_locked():
+    """config_lock within this process, then an flock shared with the other workers.
+
+    Always taken in that order, so a publish from a render callback cannot
+    deadlock against a request that holds config_lock while submitting.
+    """
+    with config_lock:
+        os.makedirs(STATUS_DIR, exist_ok=True)
+        with open(_status_path('.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _executor = ProcessPoolExecutor(max_workers=ASSET_WORKERS)
+        return _executor
+
+
+def submit_asset(image_type, data):
+    """Store uploaded artwork, returning (asset_id, status) without waiting.
+
+    Artwork that has been rendered before is published immediately; new
+    artwork is rendered by a background process and published when ready.
+    """
+    asset_id = asset_id_for(image_type, data)
+
+    with _assets_locked():
+        _write_marker(f"latest-{image_type}", asset_id)
+        _remove_marker(f"{asset_id}.failed")
+        if _rendering(asset_id):
+            return asset_id, 'pending'
+
+        if not os.path.exists(asset_path(asset_id)):
+            _write_marker(f"{asset_id}.pending", str(os.getpid()))
+            future = _get_executor().submit(render_asset_variants, data, ensure_upload_folder(), asset_id)
+            future.add_done_callback(partial(_on_rendered, image_type, asset_id))
+            print(f"🖼️  Rendering {asset_id} in the background")
+            return asset_id, 'pending'
+
+        print(f"♻️  {asset_id} already rendered, reusing it")
+        publish_asset(image_type, asset_id)
+    return asset_id, 'ready'
+
+
+def _on_rendered(image_type, asset_id, future):
+    error = future.exception()
+    with _assets_locked():
+        _remove_marker(f"{asset_id}.pending")
+        if error is not None:
+            _write_marker(f"{asset_id}.failed", str(error))
+            print(f"❌ Error rendering {asset_id}: {error}")
+            return
+
+        # A newer upload for the same slot, from any worker, has replaced this one
+        if _read_marker(f"latest-{image_type}") == asset_id:
+            publish_asset(image_type, asset_id)
+
+
+def publish_asset(image_type, asset_id):
+    """Point pass builds at a rendered asset.
+
+    Copies the variants over wallettest/<type>.png for the default template
+    and switches pass_config.json to the asset in a single save.
+    """
+    wallettest_dir = os.path.join(BASE_DIR, 'wallettest')
+    for variant in [''] + [variant for variant, _ in RETINA_SCALES]:
+        target = os.path.join(wallettest_dir, f"{image_type}{variant}.png")
+        temp_path = target + '.tmp'
+        shutil.copy(asset_path(asset_id, variant), temp_path)
+        os.replace(temp_path, target)
+
+    with config_lock:
+        config = load_current_config()
+        config[image_type] = f"{asset_id}.png"
+        save_config(config)
+
+    print(f"✅ {image_type.title()} published: {asset_id}")
+
+
+def asset_status(asset_id):
+    """'pending', 'failed', 'ready' or 'missing'"""
+    if os.path.exists(asset_path(asset_id)):
+        return 'ready'
+    if _rendering(asset_id):
+        return 'pending'
+    if asset_error(asset_id) is not None:
+        return 'failed'
+    return 'missing'
+
+
+def asset_error(asset_id):
+    error = _read_marker(f"{asset_id}.failed")
+    if error is None and _read_marker(f"{asset_id}.pending") is not None and not _rendering(asset_id):
+        return "Rendering was interrupted, please upload the artwork again"
+    return error
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Pass Customization
+Apple Wallet colours and artwork, shared by the customizer app and the pass builders
+"""
+
+import os
+import json
+import shutil
+import threading
+from datetime import datetime
+
+UPLOAD_FOLDER = 'wallettest/custom_assets'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+
+# Apple Wallet image specifications
+IMAGE_SPECS = {
+    'logo': {'width': 160, 'height': 50, 'required': True},
+    'strip': {'width': 375, 'height': 123, 'required': True}, 
+    'background': {'width': 180, 'height': 220, 'required': True},
+    'icon': {'width': 29, 'height': 29, 'required': True}
+}
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def hex_to_rgb(hex_color):
+    """Convert hex color to rgb format for Apple Wallet"""
+    hex_color = hex_color.lstrip('#')
+    return f"rgb({int(hex_color[0:2], 16)}, {int(hex_color[2:4], 16)}, {int(hex_color[4:6], 16)})"
+
+def validate_image_dimensions(image_file, image_type):
+    """Validate image dimensions against Apple Wallet specs"""
+    from PIL import Image
+
+    try:
+        image = Image.open(image_file)
+        width, height = image.size
+        spec = IMAGE_SPECS.get(image_type)
+        
+        if not spec:
+            return False, f"Unknown image type: {image_type}"
+        
+        expected_width = spec['width']
+        expected_height = spec['height']
+        
+        if width != expected_width or height != expected_height:
+            return False, f"{image_type.title()} must be exactly {expected_width}x{expected_height}px (got {width}x{height}px)"
+        
+        return True, "Valid dimensions"
+    except Exception as e:
+        return False, f"Error validating image: {str(e)}"
+
+def ensure_upload_folder():
+    upload_path = os.path.join(BASE_DIR, UPLOAD_FOLDER)
+    os.makedirs(upload_path, exist_ok=True)
+    return upload_path
+
+DEFAULT_CONFIG = {
+    "backgroundColor": "rgb(0, 0, 0)",  # Default to black if no color specified
+    "foregroundColor": "rgb(255, 255, 255)",
+    "labelColor": "rgb(255, 255, 255)",
+    "logo": None,
+    "strip": None,
+    "background": None,
+    "lastUpdated": None
+}
+
+CONFIG_SEARCH_PATHS = [
+    os.path.join(BASE_DIR, 'wallettest', 'pass_config.json'),  # From main dir
+    os.path.join(os.path.dirname(BASE_DIR), 'wallettest', 'pass_config.json'),  # From wallettest dir
+    os.path.join('.', 'pass_config.json'),  # Same directory
+    os.path.join('..', 'wallettest', 'pass_config.json')  # Parent/wallettest
+]
+
+class PassConfigService:
+    """pass_config.json, parsed once and re-read only when the file changes.
+
+    version increases whenever the config is saved or changed on disk, so
+    callers can cache anything derived from it and rebuild only when the
+    version moves on; subscribe() registers a callback for each change.
+    """
+
+    def __init__(self, search_paths=CONFIG_SEARCH_PATHS):
+        self.search_paths = search_paths
+        self.save_path = search_paths[0]
+        self.lock = threading.RLock()
+        self.version = 0
+        self._path = None
+        self._config = None
+        self._stat = None
+        self._subscribers = []
+
+    @property
+    def path(self):
+        """The config file in use, resolved on first access"""
+        if self._path is None:
+            self._path = next((path for path in self.search_paths if os.path.exists(path)), self.save_path)
+        return self._path
+
+    def get(self):
+        """Current config merged with defaults (a copy the caller may modify)"""
+        with self.lock:
+            path = self.path
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stat = None
+            key = (stat.st_mtime_ns, stat.st_size) if stat else None
+
+            if self._config is None or key != self._stat:
+                self._config = self._read(path if stat else None)
+                self._stat = key
+                self._changed()
+
+            return dict(self._config)
+
+    def _read(self, path):
+        config = dict(DEFAULT_CONFIG)
+        if path is None:
+            print(f"⚠️ No config file found, using defaults. Searched: {self.search_paths}")
+            return config
+        try:
+            with open(path, 'r') as f:
+                # Merge with defaults to ensure all keys exist
+                config.update(json.load(f))
+            print(f"🎨 Config loaded from: {path}")
+        except Exception as e:
+            print(f"❌ Error loading config from {path}: {e}")
+        return config
+
+    def save(self, config_data):
+        config_data['lastUpdated'] = datetime.now().isoformat()
+        with self.lock:
+            temp_path = self.save_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(config_data, f, indent=4)
+            os.replace(temp_path, self.save_path)
+
+            stat = os.stat(self.save_path)
+            self._path = self.save_path
+            self._config = dict(DEFAULT_CONFIG, **config_data)
+            self._stat = (stat.st_mtime_ns, stat.st_size)
+            self._changed()
+
+    def subscribe(self, callback):
+        """Call callback(version, config) after every change"""
+        with self.lock:
+            self._subscribers.append(callback)
+
+    def _changed(self):
+        self.version += 1
+        for callback in list(self._subscribers):
+            try:
+                callback(self.version, dict(self._config))
+            except Exception as e:
+                print(f"❌ Config subscriber failed: {e}")
+
+config_service = PassConfigService()
+
+def load_current_config():
+    """Load current pass customization settings"""
+    return config_service.get()
+
+def save_config(config_data):
+    """Save pass customization settings"""
+    config_service.save(config_data)
+    return True
+
+def apply_customizations_to_pass(pass_json, config=None):
+    """Apply customizations to a pass JSON object"""
+    if config is None:
+        config = load_current_config()
+    
+    # Apply colors - use black as default if null
+    pass_json['backgroundColor'] = config.get('backgroundColor') or 'rgb(0, 0, 0)'
+    pass_json['foregroundColor'] = config.get('foregroundColor') or 'rgb(255, 255, 255)'
+    pass_json['labelColor'] = config.get('labelColor') or 'rgb(255, 255, 255)'
+    
+    return pass_json
+
+# Files to copy into every pass folder, keyed by the asset fields that produced them
+_asset_plans = {}
+
+config_service.subscribe(lambda version, config: _asset_plans.clear())
+
+def custom_asset_files(config):
+    """(source, target name) pairs for the custom artwork, icons included"""
+    key = tuple(config.get(asset_type) for asset_type in ['logo', 'strip', 'background'])
+    plan = _asset_plans.get(key)
+    if plan is not None:
+        return plan
+
+    plan = []
+    upload_path = os.path.join(BASE_DIR, UPLOAD_FOLDER)
+
+    # Custom assets if they exist (base resolution and retina variants)
+    for asset_type in ['logo', 'strip', 'background']:
+        if config.get(asset_type) and config.get(asset_type) != 'null':
+            src_file = os.path.join(upload_path, config[asset_type])
+            if os.path.exists(src_file):
+                plan.append((src_file, f'{asset_type}.png'))
+                base_name = os.path.splitext(src_file)[0]
+                for variant in ['@2x', '@3x']:
+                    variant_src = f"{base_name}{variant}.png"
+                    if os.path.exists(variant_src):
+                        plan.append((variant_src, f"{asset_type}{variant}.png"))
+        elif asset_type == 'background':
+            print(f"⚪ Skipping {asset_type} - not uploaded or is null")
+
+    # Also the icon and its variants if they exist in wallettest
+    icon_path = os.path.join(BASE_DIR, 'wallettest', 'icon.png')
+    if os.path.exists(icon_path):
+        plan.append((icon_path, 'icon.png'))
+        # Copy as icon@2x.png (required by Apple Wallet)
+        plan.append((icon_path, 'icon@2x.png'))
+        icon_3x_path = os.path.join(BASE_DIR, 'wallettest', 'icon@3x.png')
+        if os.path.exists(icon_3x_path):
+            plan.append((icon_3x_path, 'icon@3x.png'))
+
+    _asset_plans[key] = plan
+    return plan
+
+def copy_custom_assets_to_pass(pass_folder, config=None):
+    """Copy custom assets with retina variants to a pass folder"""
+    if config is None:
+        config = load_current_config()
+
+    for src_file, target_name in custom_asset_files(config):
+        try:
+            shutil.copy(src_file, os.path.join(pass_folder, target_name))
+        except Exception as e:
+            print(f"❌ Error copying {target_name}: {e}")
+    print(f"✅ Custom assets copied to {pass_folder}")
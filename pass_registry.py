@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Pass Registry
+Per-event record of every guest's wallet artefacts, keyed by the CSV pass_id
+"""
+
+import os
+import re
+import json
+import tempfile
+import threading
+
+from guest_list import load_event_guests
+from file_utils import file_digest
+
+REGISTRY_FILENAME = "pass_registry.json"
+
+# qrcreator.html names files "Row-07 - Guest Name - G2 - guest_example.com.png"
+QR_FILENAME_PATTERN = re.compile(r'^Row-(\d+) - .*? - G[^ ]*(?: - (.+))?\.png$', re.IGNORECASE)
+# Legacy Google Wallet output numbered passes by CSV row: GPASS001, GPASS002...
+LEGACY_GOOGLE_ID_PATTERN = re.compile(r'^GPASS(\d+)$')
+
+
+def qr_safe(value):
+    """Mirror qrcreator.html's filename sanitising so emails can be matched"""
+    return re.sub(r'[^a-z0-9\-_. ]', '_', str(value), flags=re.IGNORECASE)[:80]
+
+
+class PassRegistry:
+    """Apple pkpass, Google Wallet object and QR asset for each pass_id.
+
+    Paths are stored relative to the event directory so events can be moved.
+    Keys are lowercased pass_ids, matching the guest table's indexes. Hold
+    lock across a sync and the save that follows it, as the registry is
+    shared between request threads.
+    """
+
+    def __init__(self, event_dir, entries=None):
+        self.event_dir = event_dir
+        self.path = os.path.join(event_dir, REGISTRY_FILENAME)
+        self.entries = {}
+        for pass_id, fields in (entries or {}).items():
+            self.entries.setdefault(pass_id.lower(), {}).update(fields)
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def get(self, pass_id):
+        return self.entries.get(pass_id.lower(), {})
+
+    def update(self, pass_id, **fields):
+        with self.lock:
+            self.entries.setdefault(pass_id.lower(), {}).update(fields)
+            self.dirty = True
+
+    def google_url(self, pass_id, default='#'):
+        return self.get(pass_id).get('google_wallet_url') or default
+
+    def apple_pass_path(self, pass_id):
+        """Absolute path of the guest's .pkpass, or None if it has not been built"""
+        relative = self.get(pass_id).get('apple_pkpass') or os.path.join("apple_passes", f"{pass_id}.pkpass")
+        path = os.path.join(self.event_dir, relative)
+        return path if os.path.exists(path) else None
+
+    def qr_path(self, pass_id):
+        relative = self.get(pass_id).get('qr_asset')
+        if not relative:
+            return None
+        path = os.path.join(self.event_dir, relative)
+        return path if os.path.exists(path) else None
+
+    def save(self):
+        with self.lock:
+            fd, temp_path = tempfile.mkstemp(prefix=REGISTRY_FILENAME + '.', suffix='.tmp',
+                                             dir=self.event_dir)
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.entries, f, indent=2, sort_keys=True)
+                os.replace(temp_path, self.path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            self.dirty = False
+
+            # Keep serving this instance (and its lock) rather than re-reading our own write
+            with _registry_cache_lock:
+                _registry_cache[os.path.abspath(self.event_dir)] = (os.stat(self.path).st_mtime_ns, self)
+
+    def sync_apple_passes(self, apple_dir):
+        """Record every <pass_id>.pkpass in apple_dir, re-hashing only changed files"""
+        count = 0
+        for entry in os.scandir(apple_dir):
+            if not entry.name.endswith('.pkpass'):
+                continue
+            pass_id = entry.name[:-len('.pkpass')]
+            stat = entry.stat()
+            current = self.get(pass_id)
+            if (current.get('apple_mtime_ns') != stat.st_mtime_ns
+                    or current.get('apple_size') != stat.st_size):
+                self.update(
+                    pass_id,
+                    apple_pkpass=os.path.relpath(entry.path, self.event_dir),
+                    apple_sha256=file_digest(entry.path),
+                    apple_mtime_ns=stat.st_mtime_ns,
+                    apple_size=stat.st_size
+                )
+            count += 1
+        return count
+
+    def sync_google_passes(self, google_passes, guests):
+        """Record Google Wallet objects from google_wallet_passes.json"""
+        count = 0
+        for pass_data in google_passes:
+            guest = guests.find_by_pass_id(pass_data.get('pass_id', ''))
+            if guest is None:
+                legacy = LEGACY_GOOGLE_ID_PATTERN.match(pass_data.get('pass_id', ''))
+                if legacy and 0 < int(legacy.group(1)) <= len(guests):
+                    guest = guests[int(legacy.group(1)) - 1]
+            if guest is None:
+                print(f"⚠️  No guest found for Google pass {pass_data.get('pass_id')}")
+                continue
+
+            self.update(
+                guest['pass_id'],
+                google_object_id=pass_data.get('object_id', pass_data.get('pass_id')),
+                google_wallet_url=pass_data['wallet_url']
+            )
+            count += 1
+        return count
+
+    def sync_qr_codes(self, qr_dir, guests):
+        """Match QR images in qr_dir to guests by pass_id, email or row number"""
+        by_email = {}
+        for guest in guests:
+            by_email.setdefault(qr_safe(guest['email']).lower(), guest['pass_id'])
+
+        count = 0
+        for entry in os.scandir(qr_dir):
+            if not entry.name.lower().endswith('.png'):
+                continue
+
+            pass_id = None
+            stem = os.path.splitext(entry.name)[0]
+            guest = guests.find_by_pass_id(stem)
+            if guest is not None:
+                pass_id = guest['pass_id']
+            else:
+                match = QR_FILENAME_PATTERN.match(entry.name)
+                if match and match.group(2):
+                    pass_id = by_email.get(match.group(2).lower())
+                if pass_id is None and match and 0 < int(match.group(1)) <= len(guests):
+                    pass_id = guests[int(match.group(1)) - 1]['pass_id']
+
+            if pass_id is None:
+                print(f"⚠️  Could not match QR image to a guest: {entry.name}")
+                continue
+
+            self.update(
+                pass_id,
+                qr_asset=os.path.relpath(entry.path, self.event_dir),
+                qr_sha256=file_digest(entry.path)
+            )
+            count += 1
+        return count
+
+
+def build_pass_registry(event_dir):
+    """Create a registry from the artefacts already present in an event directory"""
+    registry = PassRegistry(event_dir)
+    guests = None
+    csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
+    if os.path.exists(csv_path):
+        guests = load_event_guests(event_dir)
+
+    apple_dir = os.path.join(event_dir, "apple_passes")
+    if os.path.isdir(apple_dir):
+        registry.sync_apple_passes(apple_dir)
+
+    google_file = os.path.join(event_dir, "google_passes", "google_wallet_passes.json")
+    if guests is not None and os.path.exists(google_file):
+        with open(google_file, 'r') as f:
+            registry.sync_google_passes(json.load(f), guests)
+
+    qr_dir = os.path.join(event_dir, "qr_codes")
+    if guests is not None and os.path.isdir(qr_dir):
+        registry.sync_qr_codes(qr_dir, guests)
+
+    return registry
+
+
+# Loaded registries keyed by event directory, invalidated on mtime change
+_registry_cache = {}
+_registry_cache_lock = threading.Lock()
+
+
+def load_pass_registry(event_dir):
+    """Return the event's PassRegistry, building it from disk on first use"""
+    event_dir = os.path.abspath(event_dir)
+    path = os.path.join(event_dir, REGISTRY_FILENAME)
+
+    if not os.path.exists(path):
+        registry = build_pass_registry(event_dir)
+        if registry.entries:
+            registry.save()
+        return registry
+
+    mtime = os.stat(path).st_mtime_ns
+    with _registry_cache_lock:
+        cached = _registry_cache.get(event_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    with open(path, 'r') as f:
+        registry = PassRegistry(event_dir, json.load(f))
+
+    with _registry_cache_lock:
+        _registry_cache[event_dir] = (mtime, registry)
+    return registry
@@ -1,24 +1,46 @@
 #!/usr/bin/env python3
 """
 Castle Fine Art - Event Email Processor
-Processes HTML email templates, fixes Apple Wallet links, and creates .eml files with attachments
+Renders each guest's invitation with the right Apple Wallet section and creates .eml files with attachments
 """
 
 import os
-import csv
 import json
 import glob
-import re
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from datetime import datetime
 import configparser
+from guest_list import load_guest_table
+from pass_registry import load_pass_registry
+from email_rendering import (
+    TEMPLATE_PATH, APPLE_SECTION_PATTERN, APPLE_ATTACHED_SECTION, APPLE_MISSING_SECTION,
+    load_email_template
+)
+from email_streaming import FileAttachment, write_message
+import tracing
+
+# Parsed JSON files keyed by path, invalidated on mtime change
+_json_cache = {}
+
+
+def load_json_cached(path):
+    """Load a JSON file, reusing the parsed result until the file changes"""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _json_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r') as f:
+        data = json.load(f)
+    _json_cache[path] = (mtime, data)
+    return data
 
 class EventEmailProcessor:
-    def __init__(self, event_dir, config_file="email_config.ini"):
+    def __init__(self, event_dir, config_file="email_config.ini", from_html=False, template_path=TEMPLATE_PATH):
         self.event_dir = event_dir
+        # from_html: start from the per-guest HTML files in emails/ instead of the template
+        self.from_html = from_html
+        self.template_path = template_path
         self.config = configparser.ConfigParser()
         self.config_file = config_file
         self.load_config()
@@ -27,7 +49,6 @@ class EventEmailProcessor:
         self.emails_dir = os.path.join(event_dir, "emails")
         self.apple_passes_dir = os.path.join(event_dir, "apple_passes") 
         self.csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
-        self.google_passes_path = os.path.join(event_dir, "google_passes", "google_wallet_passes.json")
         self.event_info_path = os.path.join(event_dir, "event_info.json")
         
         # Output directory for processed emails
@@ -50,56 +71,23 @@ class EventEmailProcessor:
     def load_event_data(self):
         """Load event and guest data"""
         # Load event info
-        with open(self.event_info_path, 'r') as f:
-            event_data = json.load(f)
+        event_data = load_json_cached(self.event_info_path)
         
-        # Load CSV guest data
-        guests = []
-        with open(self.csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            guests = list(reader)
+        # Load guest data
+        guests = load_guest_table(self.csv_path)
         
-        # Load Google Wallet passes
-        google_passes = {}
-        if os.path.exists(self.google_passes_path):
-            with open(self.google_passes_path, 'r') as f:
-                passes = json.load(f)
-                for pass_data in passes:
-                    google_passes[pass_data['name']] = pass_data['wallet_url']
+        # Wallet artefacts for each guest, keyed by pass_id
+        registry = load_pass_registry(self.event_dir)
         
-        return event_data, guests, google_passes
+        return event_data, guests, registry
 
     def fix_apple_wallet_section(self, html_content, guest_name, has_apple_pass=True):
         """Fix the Apple Wallet section in email HTML"""
         
-        if has_apple_pass:
-            # Replace the broken download link with attachment notice
-            apple_section = '''
-                <!-- Apple Wallet Button -->
-                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 8px; margin: 10px; text-align: center;">
-                    <div style="background: #000; color: white; padding: 12px 20px; border-radius: 8px; font-size: 14px; display: inline-block;">
-                        📱 Apple Wallet Pass (see attachment)
-                    </div>
-                    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">
-                        The .pkpass file is attached to this email. Open it to add to your Apple Wallet.
-                    </p>
-                </div>'''
-        else:
-            # No Apple Wallet pass available
-            apple_section = '''
-                <!-- Apple Wallet Button -->
-                <div style="background-color: #fff3cd; padding: 15px; border-radius: 8px; margin: 10px; text-align: center;">
-                    <div style="background: #666; color: white; padding: 12px 20px; border-radius: 8px; font-size: 14px; display: inline-block;">
-                        📱 Apple Wallet Pass (not available)
-                    </div>
-                    <p style="margin: 10px 0 0 0; font-size: 12px; color: #666;">
-                        Apple Wallet pass not found for this event.
-                    </p>
-                </div>'''
+        apple_section = APPLE_ATTACHED_SECTION if has_apple_pass else APPLE_MISSING_SECTION
 
         # Replace the Apple Wallet button section
-        pattern = r'<!-- Apple Wallet Button -->.*?</a>'
-        html_content = re.sub(pattern, apple_section, html_content, flags=re.DOTALL)
+        html_content = APPLE_SECTION_PATTERN.sub(lambda match: apple_section, html_content)
         
         # Also remove any remaining APPLE_WALLET_DOWNLOAD_LINK references
         html_content = html_content.replace('APPLE_WALLET_DOWNLOAD_LINK', '#')
@@ -134,11 +122,8 @@ class EventEmailProcessor:
         # Add Apple Wallet pass attachment if available
         if apple_pass_path and os.path.exists(apple_pass_path):
             try:
-                with open(apple_pass_path, 'rb') as f:
-                    attachment = MIMEBase('application', 'vnd.apple.pkpass')
-                    attachment.set_payload(f.read())
-                
-                encoders.encode_base64(attachment)
+                # Streamed from disk when the .eml is written
+                attachment = FileAttachment(apple_pass_path, 'application', 'vnd.apple.pkpass')
                 
                 # Create a descriptive filename
                 filename = f"{guest_data['name'].replace(' ', '_')}_AppleWallet.pkpass"
@@ -158,34 +143,41 @@ class EventEmailProcessor:
         
         return msg
 
-    def process_guest_email(self, guest_data, event_data, google_passes):
+    def process_guest_email(self, guest_data, event_data, registry):
         """Process a single guest's email"""
         
-        # Find the HTML email template
         name_file = guest_data['name'].replace(' ', '_')
-        html_file = os.path.join(self.emails_dir, f"{name_file}_email.html")
-        
-        if not os.path.exists(html_file):
-            return {"success": False, "error": f"Email template not found: {html_file}"}
         
         try:
-            # Load HTML content
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
             # Find Apple Wallet pass
-            apple_pass_path = os.path.join(self.apple_passes_dir, f"{guest_data['pass_id']}.pkpass")
-            has_apple_pass = os.path.exists(apple_pass_path)
-            
-            # Fix Apple Wallet section
-            html_content = self.fix_apple_wallet_section(
-                html_content, 
-                guest_data['name'], 
-                has_apple_pass
-            )
+            apple_pass_path = registry.apple_pass_path(guest_data['pass_id'])
+            has_apple_pass = apple_pass_path is not None
             
             # Get Google Wallet URL
-            google_wallet_url = google_passes.get(guest_data['name'], '#')
+            google_wallet_url = registry.google_url(guest_data['pass_id'])
+            
+            if self.from_html:
+                # Load the HTML written by generate_personalized_emails and fix its Apple Wallet section
+                html_file = os.path.join(self.emails_dir, f"{name_file}_email.html")
+                if not os.path.exists(html_file):
+                    return {"success": False, "error": f"Email template not found: {html_file}"}
+                
+                with open(html_file, 'r', encoding='utf-8') as f:
+                    html_content = f.read()
+                
+                html_content = self.fix_apple_wallet_section(
+                    html_content, 
+                    guest_data['name'], 
+                    has_apple_pass
+                )
+            else:
+                # Render the final HTML straight from the template
+                html_content = load_email_template(self.template_path).render(
+                    guest_data,
+                    event_data,
+                    google_url=google_wallet_url,
+                    apple_section=APPLE_ATTACHED_SECTION if has_apple_pass else APPLE_MISSING_SECTION
+                )
             
             # Create .eml message
             eml_message = self.create_eml_message(
@@ -193,15 +185,14 @@ class EventEmailProcessor:
                 event_data, 
                 html_content,
                 google_wallet_url,
-                apple_pass_path if has_apple_pass else None
+                apple_pass_path
             )
             
             # Save .eml file
             eml_filename = f"{name_file}_email.eml"
             eml_path = os.path.join(self.output_dir, eml_filename)
             
-            with open(eml_path, 'w', encoding='utf-8') as f:
-                f.write(eml_message.as_string())
+            write_message(eml_message, eml_path)
             
             return {
                 "success": True,
@@ -219,7 +210,7 @@ class EventEmailProcessor:
         print(f"🔄 Processing emails for event: {os.path.basename(self.event_dir)}")
         
         # Load data
-        event_data, guests, google_passes = self.load_event_data()
+        event_data, guests, registry = self.load_event_data()
         
         results = {
             "total": len(guests),
@@ -230,20 +221,26 @@ class EventEmailProcessor:
         }
         
         # Process each guest
-        for i, guest in enumerate(guests):
-            print(f"📧 Processing {i+1}/{len(guests)}: {guest['name']}")
-            
-            result = self.process_guest_email(guest, event_data, google_passes)
-            
-            if result['success']:
-                results['processed'] += 1
-                if result.get('has_apple_pass'):
-                    results['with_apple_pass'] += 1
-                print(f"✅ Created: {os.path.basename(result['eml_path'])}")
-            else:
-                results['failed'] += 1
-                results['errors'].append(f"{guest['name']}: {result['error']}")
-                print(f"❌ Failed: {guest['name']} - {result['error']}")
+        with tracing.trace(self.event_dir, "eml_build", guests=len(guests)):
+            for i, guest in enumerate(guests):
+                print(f"📧 Processing {i+1}/{len(guests)}: {guest['name']}")
+
+                with tracing.span("eml", kind="guest", pass_id=guest['pass_id']) as span:
+                    result = self.process_guest_email(guest, event_data, registry)
+                    if result['success']:
+                        span.set(has_apple_pass=result['has_apple_pass'], bytes=os.path.getsize(result['eml_path']))
+                    else:
+                        span.fail(result['error'])
+
+                if result['success']:
+                    results['processed'] += 1
+                    if result.get('has_apple_pass'):
+                        results['with_apple_pass'] += 1
+                    print(f"✅ Created: {os.path.basename(result['eml_path'])}")
+                else:
+                    results['failed'] += 1
+                    results['errors'].append(f"{guest['name']}: {result['error']}")
+                    print(f"❌ Failed: {guest['name']} - {result['error']}")
         
         # Create test email if requested
         if create_test and guests:
@@ -252,7 +249,7 @@ class EventEmailProcessor:
             test_guest['name'] = f"TEST - {test_guest['name']}"
             
             print(f"\n📧 Creating test email...")
-            test_result = self.process_guest_email(test_guest, event_data, google_passes)
+            test_result = self.process_guest_email(test_guest, event_data, registry)
             
             if test_result['success']:
                 # Rename test file
@@ -267,7 +264,7 @@ class EventEmailProcessor:
     def preview_email(self, guest_name_or_index=0):
         """Preview a single email (save as HTML for browser viewing)"""
         
-        event_data, guests, google_passes = self.load_event_data()
+        event_data, guests, registry = self.load_event_data()
         
         if isinstance(guest_name_or_index, int):
             if guest_name_or_index >= len(guests):
@@ -275,18 +272,14 @@ class EventEmailProcessor:
                 return None
             guest = guests[guest_name_or_index]
         else:
-            # Find by name
-            guest = None
-            for g in guests:
-                if g['name'].lower() == guest_name_or_index.lower():
-                    guest = g
-                    break
+            # Find by name, email or pass_id via the cached index
+            guest = guests.lookup(guest_name_or_index)
             if not guest:
                 print(f"❌ Guest not found: {guest_name_or_index}")
                 return None
         
         # Process the email
-        result = self.process_guest_email(guest, event_data, google_passes)
+        result = self.process_guest_email(guest, event_data, registry)
         
         if result['success']:
             # Create HTML preview
@@ -322,9 +315,11 @@ def main():
     
     parser = argparse.ArgumentParser(description='Process Castle Fine Art event emails')
     parser.add_argument('event_dir', help='Event directory path')
-    parser.add_argument('--preview', help='Preview email for guest (name or index)')
+    parser.add_argument('--preview', help='Preview email for guest (name, email, pass_id or index)')
     parser.add_argument('--no-test', action='store_true', help='Skip creating test email')
     parser.add_argument('--config', default='email_config.ini', help='Email config file')
+    parser.add_argument('--from-html', action='store_true',
+                        help='Use the per-guest HTML files in emails/ instead of rendering the template')
     
     args = parser.parse_args()
     
@@ -332,7 +327,7 @@ def main():
         print(f"❌ Event directory not found: {args.event_dir}")
         return 1
     
-    processor = EventEmailProcessor(args.event_dir, args.config)
+    processor = EventEmailProcessor(args.event_dir, args.config, from_html=args.from_html)
     
     if args.preview:
         # Preview mode
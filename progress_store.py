@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Progress Store
+SQLite-backed progress and job queue shared by every coordinator process
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# Live throughput: samples closer together than this are merged, and a
+# sample's weight halves every EWMA_HALF_LIFE seconds of newer data
+MIN_SAMPLE_SECONDS = 0.5
+EWMA_HALF_LIFE = 10.0
+
+# Historical throughput: EWMA over the last THROUGHPUT_HISTORY runs of a stage
+THROUGHPUT_HISTORY = 20
+HISTORY_ALPHA = 0.3
+
+
+class StageThroughput:
+    """Items per second for one stage of a running job, as a time-weighted EWMA.
+
+    Starts from prior_rate (the stage's historical throughput) so an ETA is
+    available before the first items complete.
+    """
+
+    def __init__(self, stage, total, prior_rate=None):
+        self.stage = stage
+        self.total = total
+        self.completed = 0
+        self.rate = prior_rate
+        self.first = None   # (monotonic time, completed) when items started completing
+        self.last = None    # last sample folded into the average
+        self.updated = None  # when completed last changed
+
+    def update(self, completed, now=None):
+        now = time.monotonic() if now is None else now
+        if completed != self.completed:
+            # Only real progress counts; every poll re-reports the same count for idle stages
+            self.updated = now
+        self.completed = completed
+        if self.first is None or self.first[1] == completed:
+            # Nothing finished yet, so the clock starts from the latest observation
+            self.first = self.last = (now, completed)
+            return
+
+        last_time, last_completed = self.last
+        elapsed = now - last_time
+        if elapsed < MIN_SAMPLE_SECONDS:
+            return
+        rate = (completed - last_completed) / elapsed
+        if self.rate is None:
+            self.rate = rate
+        else:
+            weight = 1 - 0.5 ** (elapsed / EWMA_HALF_LIFE)
+            self.rate += weight * (rate - self.rate)
+        self.last = (now, completed)
+
+    @property
+    def done(self):
+        return self.completed >= self.total
+
+    def measured(self):
+        """(items, seconds) actually observed, or None if too few samples"""
+        if self.first is None or self.last is None or self.last is self.first:
+            return None
+        items = self.last[1] - self.first[1]
+        seconds = self.last[0] - self.first[0]
+        return (items, seconds) if items > 0 and seconds > 0 else None
+
+    def eta_seconds(self):
+        if self.done:
+            return 0.0
+        if not self.rate or self.rate <= 0:
+            return None
+        return (self.total - self.completed) / self.rate
+
+    def snapshot(self):
+        eta = self.eta_seconds()
+        return {
+            "completed": min(self.completed, self.total),
+            "total": self.total,
+            "items_per_second": round(self.rate, 2) if self.rate else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+
+class ProgressStore:
+    """Per-event progress dicts persisted in SQLite.
+
+    Keeps the dict-style usage the coordinator has always had:
+
+        progress_data[event_name] = {"step": ..., "progress": 0}
+        progress_data[event_name]["status"] = "..."
+        save_progress_data(progress_data)
+
+    Entries read or written with [] are held by this process until save()
+    writes them back; get() always reads the latest value from the database,
+    so any worker process can answer progress requests.
+    """
+
+    def __init__(self, db_path, legacy_json_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._touched = set()
+        self._trackers = {}     # event_name -> {stage: StageThroughput} for jobs running here
+        self._init_db(legacy_json_path)
+
+    def _connect(self):
+        # One connection per thread, and never reuse one across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self, legacy_json_path):
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS progress (
+            event_name TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated REAL NOT NULL
+        )""")
+        conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            event_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            profile INTEGER NOT NULL DEFAULT 0
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS throughput (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            stage TEXT NOT NULL,
+            event_name TEXT NOT NULL,
+            items INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            finished REAL NOT NULL
+        )""")
+        conn.execute("CREATE INDEX IF NOT EXISTS throughput_stage ON throughput (stage, id)")
+        # Databases created before jobs could be profiled
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+        if 'profile' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN profile INTEGER NOT NULL DEFAULT 0")
+
+        # One-off import of the old progress_data.json
+        if legacy_json_path and os.path.exists(legacy_json_path):
+            if conn.execute("SELECT COUNT(*) FROM progress").fetchone()[0] == 0:
+                try:
+                    with open(legacy_json_path, 'r') as f:
+                        legacy = json.load(f)
+                    now = time.time()
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO progress (event_name, data, updated) VALUES (?, ?, ?)",
+                        [(name, json.dumps(data), now) for name, data in legacy.items()]
+                    )
+                except (ValueError, OSError):
+                    pass
+
+    def _read(self, event_name):
+        row = self._connect().execute(
+            "SELECT data FROM progress WHERE event_name = ?", (event_name,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, items):
+        """Store (event_name, JSON text) pairs"""
+        now = time.time()
+        self._connect().executemany(
+            "INSERT INTO progress (event_name, data, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(event_name) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+            [(name, data, now) for name, data in items]
+        )
+
+    def __getitem__(self, event_name):
+        with self._lock:
+            if event_name not in self._entries:
+                data = self._read(event_name)
+                if data is None:
+                    raise KeyError(event_name)
+                self._entries[event_name] = data
+            self._touched.add(event_name)
+            return self._entries[event_name]
+
+    def __setitem__(self, event_name, data):
+        with self._lock:
+            self._entries[event_name] = data
+            self._touched.discard(event_name)
+            self._write([(event_name, json.dumps(data))])
+
+    def __contains__(self, event_name):
+        return self._read(event_name) is not None
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM progress").fetchone()[0]
+
+    def get(self, event_name, default=None):
+        data = self._read(event_name)
+        return data if data is not None else default
+
+    def save(self):
+        """Write back every entry this process has modified since the last save"""
+        # Entries are shared with the threads updating them, so encode them under the lock
+        with self._lock:
+            snapshot = [(name, json.dumps(self._entries[name])) for name in self._touched]
+            self._touched.clear()
+        if snapshot:
+            self._write(snapshot)
+
+    # Job queue
+
+    def enqueue_job(self, kind, event_name, profile=False):
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (kind, event_name, status, created, profile) VALUES (?, ?, 'queued', ?, ?)",
+            (kind, event_name, time.time(), int(profile))
+        )
+        return cursor.lastrowid
+
+    def claim_job(self):
+        """Atomically take the oldest queued job, returning (id, kind, event_name, profile) or None"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, kind, event_name, profile FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                    (time.time(), row[0])
+                )
+            conn.execute("COMMIT")
+            return row
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def finish_job(self, job_id, error=None):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+            ('failed' if error else 'done', error, time.time(), job_id)
+        )
+
+    def fail_running_jobs(self, reason):
+        """Mark jobs left 'running' by a dead worker as failed, and their events' progress
+        as finished with reason as the error. Returns the affected event names."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            events = sorted({name for (name,) in conn.execute(
+                "SELECT event_name FROM jobs WHERE status = 'running'"
+            )})
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE status = 'running'",
+                (reason, time.time())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        for event_name in events:
+            with self._lock:
+                data = self._read(event_name) or {}
+                data.update(status=f"Error: {reason}", error=reason, completed=True)
+                self._entries[event_name] = data
+                self._touched.discard(event_name)
+                self._write([(event_name, json.dumps(data))])
+        return events
+
+    def job_counts(self):
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+        ).fetchall()
+        counts = {'queued': 0, 'running': 0}
+        counts.update(dict(rows))
+        return counts
+
+    # Throughput and ETA
+
+    def start_stages(self, event_name, stages, total):
+        """Track items per second for a job's stages, each over total items,
+        starting from their historical throughput"""
+        trackers = {stage: StageThroughput(stage, total, self.stage_rate(stage)) for stage in stages}
+        with self._lock:
+            self._trackers[event_name] = trackers
+        self._publish(event_name, trackers)
+
+    def record_throughput(self, event_name, stage, completed):
+        """Update a stage's completed item count and the event's ETA (written on the next save)"""
+        trackers = self._trackers.get(event_name)
+        if not trackers or stage not in trackers:
+            return
+        trackers[stage].update(completed)
+        self._publish(event_name, trackers)
+
+    def finish_stages(self, event_name):
+        """Stop tracking an event's job and keep each stage's measured throughput for future estimates"""
+        with self._lock:
+            trackers = self._trackers.pop(event_name, None)
+        if not trackers:
+            return
+        now = time.time()
+        rows = []
+        for stage, tracker in trackers.items():
+            measured = tracker.measured()
+            if measured:
+                rows.append((stage, event_name, measured[0], measured[1], now))
+        if rows:
+            self._connect().executemany(
+                "INSERT INTO throughput (stage, event_name, items, seconds, finished) VALUES (?, ?, ?, ?, ?)", rows
+            )
+
+    def _publish(self, event_name, trackers):
+        try:
+            entry = self[event_name]
+        except KeyError:
+            return
+        stages = {stage: tracker.snapshot() for stage, tracker in trackers.items()}
+        remaining = [tracker.eta_seconds() for tracker in trackers.values()]
+
+        # Throughput of the stage that most recently made progress, else the next one due
+        pending = [tracker for tracker in trackers.values() if not tracker.done]
+        active = [tracker for tracker in pending if tracker.updated is not None]
+        current = max(active, key=lambda tracker: tracker.updated) if active else (pending[0] if pending else None)
+
+        # Keys are added here, so keep save() from encoding the entry mid-update
+        with self._lock:
+            entry["stages"] = stages
+            entry["eta_seconds"] = round(sum(remaining), 1) if None not in remaining else None
+            entry["items_per_second"] = round(current.rate, 2) if current and current.rate else None
+
+    def throughput_history(self, stage, limit=THROUGHPUT_HISTORY):
+        """Recent runs of a stage, oldest first"""
+        rows = self._connect().execute(
+            "SELECT event_name, items, seconds, finished FROM throughput WHERE stage = ? ORDER BY id DESC LIMIT ?",
+            (stage, limit)
+        ).fetchall()
+        return [
+            {"event_name": name, "items": items, "seconds": round(seconds, 3),
+             "items_per_second": round(items / seconds, 2), "finished": finished}
+            for name, items, seconds, finished in reversed(rows)
+        ]
+
+    def stage_rate(self, stage):
+        """EWMA of a stage's items per second over its recent runs, or None without history"""
+        rate = None
+        for run in self.throughput_history(stage):
+            rate = run["items_per_second"] if rate is None else rate + HISTORY_ALPHA * (run["items_per_second"] - rate)
+        return rate
+
+    def estimate(self, stages, items):
+        """Expected seconds for a job over items, from each stage's historical throughput"""
+        estimates = {}
+        for stage in stages:
+            rate = self.stage_rate(stage)
+            estimates[stage] = {
+                "items_per_second": round(rate, 2) if rate else None,
+                "eta_seconds": round(items / rate, 1) if rate else None,
+                "history": self.throughput_history(stage),
+            }
+        seconds = [estimate["eta_seconds"] for estimate in estimates.values()]
+        return {
+            "items": items,
+            "eta_seconds": round(sum(seconds), 1) if None not in seconds else None,
+            "stages": estimates,
+        }
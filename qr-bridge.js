@@ -363,6 +363,30 @@ class WorkflowAPI {
         return await response.json();
     }
 
+    async uploadGuestList(eventName, csvFile, eventData = null) {
+        // Streams the raw CSV to the backend instead of a parsed JSON array
+        const formData = new FormData();
+        formData.append('csv_file', csvFile);
+        if (eventData) {
+            formData.append('event_data', JSON.stringify(eventData));
+        }
+
+        const response = await fetch(`${this.baseUrl}/api/events/${encodeURIComponent(eventName)}/guests`, {
+            method: 'POST',
+            body: formData
+        });
+
+        return await response.json();
+    }
+
+    async generateQRCodes(eventName) {
+        const response = await fetch(`${this.baseUrl}/api/events/${encodeURIComponent(eventName)}/qr-generate`, {
+            method: 'POST'
+        });
+
+        return await response.json();
+    }
+
     async generateAppleWallet(eventName, passConfig = null) {
         // If we have pass customization, save it first
         if (passConfig) {
@@ -438,6 +462,13 @@ class WorkflowAPI {
         return await response.json();
     }
 
+    async getTrace(eventName, traceId = null) {
+        // Spans of the latest job run, or of traceId, for the timeline view
+        const query = traceId ? `?trace_id=${encodeURIComponent(traceId)}` : '';
+        const response = await fetch(`${this.baseUrl}/api/events/${encodeURIComponent(eventName)}/trace${query}`);
+        return await response.json();
+    }
+
     async downloadFiles(eventName, fileType) {
         const response = await fetch(`${this.baseUrl}/api/events/${eventName}/files/${fileType}`);
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - QR Code Generator
+Renders each guest's entry QR code server-side, straight into the event directory
+"""
+
+import os
+import io
+import json
+import hashlib
+import importlib.util
+
+# qrcode (and PIL behind it) is imported by the render workers only
+QRCODE_AVAILABLE = importlib.util.find_spec("qrcode") is not None
+
+from guest_list import load_event_guests
+from pass_registry import load_pass_registry
+import tracing
+
+# Matches the defaults used by qrcreator.html and the mobile scanner
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+
+def qr_payload(guest):
+    """Scanner payload for a guest, identical to the Apple/Google pass barcodes"""
+    return json.dumps({
+        "name": guest['name'],
+        "guests": int(guest['guest_count'])
+    })
+
+
+def render_qr_png(payload):
+    """Render a QR code PNG for payload; callers render each distinct payload once"""
+    import qrcode
+
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer)
+    return buffer.getvalue()
+
+
+def generate_event_qr_codes(event_dir, workers=None, progress_callback=None):
+    """Render QR codes for every guest into <event>/qr_codes/<pass_id>.png
+
+    Identical payloads are rendered once, unique payloads are rendered in
+    parallel worker processes, and each image is recorded in the event's
+    pass registry so later stages join by pass_id.
+    """
+    if not QRCODE_AVAILABLE:
+        return {"success": False, "error": "qrcode package not installed (pip install qrcode)"}
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    try:
+        guests = load_event_guests(event_dir)
+        qr_dir = os.path.join(event_dir, "qr_codes")
+        os.makedirs(qr_dir, exist_ok=True)
+
+        # payload -> pass_ids sharing it
+        payloads = {}
+        for guest in guests:
+            payloads.setdefault(qr_payload(guest), []).append(guest['pass_id'])
+
+        registry = load_pass_registry(event_dir)
+        unique_payloads = list(payloads)
+        total = len(guests)
+        written = 0
+
+        # Held across the updates and the save, like the registry syncs
+        with registry.lock:
+            with tracing.span("qr_render", guests=total, unique_payloads=len(unique_payloads)), \
+                    ProcessPoolExecutor(max_workers=workers) as executor:
+                images = executor.map(render_qr_png, unique_payloads, chunksize=64)
+                for payload, png in zip(unique_payloads, images):
+                    digest = hashlib.sha256(png).hexdigest()
+                    for n, pass_id in enumerate(payloads[payload]):
+                        # Guests after the first with this payload reuse the rendered image
+                        with tracing.span("qr_write", kind="guest", pass_id=pass_id, bytes=len(png),
+                                          cache="hit" if n else "miss"):
+                            qr_path = os.path.join(qr_dir, f"{pass_id}.png")
+                            with open(qr_path, 'wb') as f:
+                                f.write(png)
+                            registry.update(
+                                pass_id,
+                                qr_asset=os.path.relpath(qr_path, registry.event_dir),
+                                qr_sha256=digest
+                            )
+                        written += 1
+
+                    if progress_callback:
+                        progress_callback(written, total)
+
+            registry.save()
+
+        return {
+            "success": True,
+            "qr_count": written,
+            "unique_payloads": len(unique_payloads)
+        }
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate Castle Fine Art guest QR codes')
+    parser.add_argument('--event-dir', required=True, help='Event directory path')
+    parser.add_argument('--workers', type=int, help='Number of render processes')
+
+    args = parser.parse_args()
+
+    def progress_callback(current, total):
+        print(f"🔳 Progress: {current}/{total}")
+
+    result = generate_event_qr_codes(args.event_dir, args.workers, progress_callback)
+
+    if result['success']:
+        print(f"✅ Generated {result['qr_count']} QR codes ({result['unique_payloads']} unique)")
+    else:
+        print(f"❌ Failed: {result['error']}")
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Sales Summary Cubes
+Pre-aggregated sales totals per customer, item code prefix, month and
+customer x month, computed over typed columns of the columnar sales export
+"""
+
+import importlib.util
+from array import array
+from datetime import date, timedelta
+
+# numpy is optional; without it the same grouping runs as a single Python pass
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+
+CUSTOMER_FIELDS = ("CustID", "FirstName", "LastName")
+ITEM_FIELDS = ("ItemCode",)
+TOTAL_FIELD = "SOTotal"
+DATE_FIELD = "SODate"
+
+# Cube name -> dimensions it is grouped by
+CUBES = {
+    "customer": ("customer",),
+    "item_prefix": ("item_prefix",),
+    "month": ("month",),
+    "customer_month": ("customer", "month"),
+}
+
+NO_CODE = -1
+
+
+def item_prefix(item_code):
+    """Range part of an item code, e.g. BDY for BDY-SLE-POR-34651F"""
+    return item_code.split('-', 1)[0].strip()
+
+
+def month_key(day):
+    """Month as a sortable integer, e.g. 202506"""
+    return day.year * 100 + day.month
+
+
+def _column(dataset, fields):
+    for column in dataset["columns"]:
+        if tuple(column["fields"]) == tuple(fields):
+            return column
+    raise KeyError(f"columnar dataset has no {'/'.join(fields)} column")
+
+
+class SalesArrays:
+    """Typed columns of a columnar sales dataset, decoded once for grouping.
+
+    Every grouping dimension is an array of integer codes (NO_CODE where a
+    row has no value); the customer code is the row's index into the
+    dataset's customer dictionary. Rows without a CustID are left out,
+    as the chatbot does when it loads the data.
+    """
+
+    def __init__(self, dataset):
+        customer = _column(dataset, CUSTOMER_FIELDS)
+        item = _column(dataset, ITEM_FIELDS)
+        totals = _column(dataset, (TOTAL_FIELD,))
+        dates = _column(dataset, (DATE_FIELD,))
+
+        self.rows = dataset["rows"]
+        self.customers = customer["dictionary"]
+        known = [bool(entry[0]) for entry in self.customers]
+        self.customer = array('q', (index if known[index] else NO_CODE for index in customer["indexes"]))
+
+        # Prefixes and months are coded per distinct item / day, not per row
+        self.prefixes = []
+        prefix_codes = {}
+        item_to_prefix = []
+        for (code,) in item["dictionary"]:
+            prefix = item_prefix(code)
+            if prefix not in prefix_codes:
+                prefix_codes[prefix] = len(self.prefixes)
+                self.prefixes.append(prefix)
+            item_to_prefix.append(prefix_codes[prefix])
+        self.prefix = array('q', (item_to_prefix[index] if code != NO_CODE else NO_CODE
+                                  for index, code in zip(item["indexes"], self.customer)))
+
+        base = date.fromisoformat(dates["base"])
+        day_months = {}
+        for days in set(dates["days"]):
+            if days is not None:
+                day_months[days] = month_key(base + timedelta(days=days))
+        self.months = sorted(set(day_months.values()))
+        month_codes = {month: i for i, month in enumerate(self.months)}
+        self.month = array('q', (month_codes[day_months[days]] if days is not None and code != NO_CODE else NO_CODE
+                                 for days, code in zip(dates["days"], self.customer)))
+
+        self.total = array('d', (value or 0 for value in totals["values"]))
+
+    def combine(self, outer, inner, inner_size):
+        """Codes for the pair of two dimensions, NO_CODE where either is missing"""
+        return array('q', (a * inner_size + b if a != NO_CODE and b != NO_CODE else NO_CODE
+                           for a, b in zip(outer, inner)))
+
+
+def group_sums(codes, size, values):
+    """(totals, counts) per code in range(size), skipping NO_CODE"""
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        codes = np.frombuffer(codes, dtype=np.int64)
+        keep = codes != NO_CODE
+        kept = codes[keep]
+        totals = np.bincount(kept, weights=np.frombuffer(values, dtype=np.float64)[keep], minlength=size)
+        counts = np.bincount(kept, minlength=size)
+        return totals.tolist(), counts.tolist()
+
+    totals = [0.0] * size
+    counts = [0] * size
+    for code, value in zip(codes, values):
+        if code != NO_CODE:
+            totals[code] += value
+            counts[code] += 1
+    return totals, counts
+
+
+def round_amount(value):
+    """Sum of amounts rounded to pence, as an int when whole"""
+    value = round(float(value), 2)
+    return int(value) if value.is_integer() else value
+
+
+def _cube(dimensions, keys, totals, counts, order):
+    """Columnar cube of the non-empty cells, in the given order of cell indexes"""
+    cells = [cell for cell in order if counts[cell]]
+    cube = {"dimensions": list(dimensions)}
+    for dimension, key in zip(dimensions, keys):
+        cube[dimension] = [key(cell) for cell in cells]
+    cube["total"] = [round_amount(totals[cell]) for cell in cells]
+    cube["count"] = [counts[cell] for cell in cells]
+    return cube
+
+
+def build_cubes(dataset):
+    """Summary cubes for a columnar dataset, to be stored under its "cubes" key.
+
+    Each cube lists its non-empty cells column by column: one array per
+    dimension ("customer" holds indexes into the customer dictionary column,
+    "item_prefix" the prefix, "month" a YYYYMM integer) plus "total" and
+    "count". Customers and prefixes are ordered by total, highest first;
+    months oldest first.
+    """
+    arrays = SalesArrays(dataset)
+    customers, prefixes, months = len(arrays.customers), len(arrays.prefixes), len(arrays.months)
+
+    def by_total(totals, size):
+        return sorted(range(size), key=lambda cell: -totals[cell])
+
+    cubes = {}
+    totals, counts = group_sums(arrays.customer, customers, arrays.total)
+    cubes["customer"] = _cube(CUBES["customer"], [lambda cell: cell], totals, counts,
+                              by_total(totals, customers))
+
+    totals, counts = group_sums(arrays.prefix, prefixes, arrays.total)
+    cubes["item_prefix"] = _cube(CUBES["item_prefix"], [lambda cell: arrays.prefixes[cell]], totals, counts,
+                                 by_total(totals, prefixes))
+
+    totals, counts = group_sums(arrays.month, months, arrays.total)
+    cubes["month"] = _cube(CUBES["month"], [lambda cell: arrays.months[cell]], totals, counts, range(months))
+
+    # Cells are customer * months + month; within a month, highest total first
+    pairs = arrays.combine(arrays.customer, arrays.month, months)
+    totals, counts = group_sums(pairs, customers * months, arrays.total)
+    order = sorted((cell for cell in range(customers * months) if counts[cell]),
+                   key=lambda cell: (cell % months, -totals[cell]))
+    cubes["customer_month"] = _cube(
+        CUBES["customer_month"],
+        [lambda cell: cell // months, lambda cell: arrays.months[cell % months]],
+        totals, counts, order
+    )
+
+    orders = [value for code, value in zip(arrays.customer, arrays.total) if code != NO_CODE]
+    cubes["summary"] = {
+        "rows": arrays.rows,
+        "orders": len(orders),
+        "valid": sum(1 for value in orders if value > 0),
+        "total": round_amount(sum(orders)),
+    }
+    return cubes
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Sales Store
+SQLite copy of the exported sales rows, dictionaries and summary cubes, so a
+refresh of the chatbot data only has to ingest the orders added since the
+last export
+"""
+
+import json
+import sqlite3
+
+# Meta keys
+WATERMARK = "watermark"     # how far into the CSV has been ingested
+BASE = "base"               # the columnar file the current delta applies to
+SUMMARY = "summary"         # cubes["summary"] as of now
+SUMMARY_DELTA = "summary_delta"
+
+
+class SalesStore:
+    """Rows, dictionary entries and cube cells of the sales export.
+
+    Row ids are positions in the columnar file (the base) followed by the
+    rows added since, so the page can apply a delta by position. Cube cells
+    hold the current totals; delta_cells hold only the change since the base
+    was written.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._init_db()
+
+    def _init_db(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dictionary (
+                col INTEGER NOT NULL,
+                id INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                PRIMARY KEY (col, id)
+            );
+            CREATE INDEX IF NOT EXISTS dictionary_entry ON dictionary (col, entry);
+            CREATE TABLE IF NOT EXISTS rows (
+                id INTEGER PRIMARY KEY,
+                hash TEXT NOT NULL,
+                data TEXT NOT NULL,
+                active INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS rows_hash ON rows (hash);
+            CREATE TABLE IF NOT EXISTS cube_cells (
+                cube TEXT NOT NULL,
+                key1 NOT NULL,
+                key2 NOT NULL DEFAULT 0,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (cube, key1, key2)
+            );
+            CREATE TABLE IF NOT EXISTS delta_cells (
+                cube TEXT NOT NULL,
+                key1 NOT NULL,
+                key2 NOT NULL DEFAULT 0,
+                total REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (cube, key1, key2)
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    # Meta
+
+    def get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value))
+        )
+
+    # Rebuilding
+
+    def reset(self, rows, hashes, dictionaries, cubes, base, watermark):
+        """Replace the store with a freshly written columnar file.
+
+        rows and hashes are the file's rows in order, dictionaries its
+        dictionary columns' entries, cubes the cubes stored in it.
+        """
+        with self.conn:
+            for table in ("meta", "dictionary", "rows", "cube_cells", "delta_cells"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.conn.executemany(
+                "INSERT INTO rows (id, hash, data) VALUES (?, ?, ?)",
+                ((i, row_hash, json.dumps(row)) for i, (row, row_hash) in enumerate(zip(rows, hashes)))
+            )
+            self.conn.executemany(
+                "INSERT INTO dictionary (col, id, entry) VALUES (?, ?, ?)",
+                ((col, i, json.dumps(entry)) for col, entries in enumerate(dictionaries)
+                 for i, entry in enumerate(entries))
+            )
+            cells = []
+            for name, cube in cubes.items():
+                if name == "summary":
+                    continue
+                keys = [cube[dimension] for dimension in cube["dimensions"]]
+                for i, (total, count) in enumerate(zip(cube["total"], cube["count"])):
+                    cells.append((name, keys[0][i], keys[1][i] if len(keys) > 1 else 0, total, count))
+            self.conn.executemany(
+                "INSERT INTO cube_cells (cube, key1, key2, total, count) VALUES (?, ?, ?, ?, ?)", cells
+            )
+            self.set_meta(BASE, base)
+            self.set_meta(SUMMARY, cubes["summary"])
+            self.set_meta(SUMMARY_DELTA, {key: 0 for key in cubes["summary"]})
+            self.set_meta(WATERMARK, watermark)
+
+    # Incremental updates
+
+    def row_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def active_hashes(self):
+        """{row hash: [row ids]} of every row still in the CSV"""
+        hashes = {}
+        for row_id, row_hash in self.conn.execute("SELECT id, hash FROM rows WHERE active = 1 ORDER BY id"):
+            hashes.setdefault(row_hash, []).append(row_id)
+        return hashes
+
+    def dictionary_id(self, col, entry):
+        """Id of a dictionary entry, adding it after the existing ones if new"""
+        encoded = json.dumps(entry)
+        row = self.conn.execute(
+            "SELECT id FROM dictionary WHERE col = ? AND entry = ?", (col, encoded)
+        ).fetchone()
+        if row:
+            return row[0]
+        next_id = self.conn.execute(
+            "SELECT COALESCE(MAX(id) + 1, 0) FROM dictionary WHERE col = ?", (col,)
+        ).fetchone()[0]
+        self.conn.execute("INSERT INTO dictionary (col, id, entry) VALUES (?, ?, ?)", (col, next_id, encoded))
+        return next_id
+
+    def dictionary_entry(self, col, entry_id):
+        (entry,) = self.conn.execute(
+            "SELECT entry FROM dictionary WHERE col = ? AND id = ?", (col, entry_id)
+        ).fetchone()
+        return json.loads(entry)
+
+    def dictionary_entries(self, col, start):
+        """Entries of a dictionary column from id start on"""
+        return [json.loads(entry) for (entry,) in self.conn.execute(
+            "SELECT entry FROM dictionary WHERE col = ? AND id >= ? ORDER BY id", (col, start)
+        )]
+
+    def add_rows(self, rows, hashes):
+        """Append rows, returning their ids"""
+        start = self.row_count()
+        self.conn.executemany(
+            "INSERT INTO rows (id, hash, data) VALUES (?, ?, ?)",
+            ((start + i, row_hash, json.dumps(row)) for i, (row, row_hash) in enumerate(zip(rows, hashes)))
+        )
+        return list(range(start, start + len(rows)))
+
+    def remove_rows(self, row_ids):
+        """Mark rows no longer in the CSV, returning their data"""
+        removed = []
+        for row_id in row_ids:
+            (data,) = self.conn.execute("SELECT data FROM rows WHERE id = ?", (row_id,)).fetchone()
+            removed.append(json.loads(data))
+        self.conn.executemany("UPDATE rows SET active = 0 WHERE id = ?", ((row_id,) for row_id in row_ids))
+        return removed
+
+    def rows_from(self, start):
+        """(id, row) of every row from id start on, removed or not"""
+        return [(row_id, json.loads(data)) for row_id, data in self.conn.execute(
+            "SELECT id, data FROM rows WHERE id >= ? ORDER BY id", (start,)
+        )]
+
+    def removed_ids(self):
+        return [row_id for (row_id,) in self.conn.execute("SELECT id FROM rows WHERE active = 0 ORDER BY id")]
+
+    def adjust_cells(self, cells):
+        """Add (cube, key1, key2, total, count) changes to the current cubes and to the delta"""
+        for table in ("cube_cells", "delta_cells"):
+            self.conn.executemany(
+                f"INSERT INTO {table} (cube, key1, key2, total, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(cube, key1, key2) DO UPDATE SET "
+                "total = total + excluded.total, count = count + excluded.count",
+                cells
+            )
+
+    def delta_cells(self):
+        """{cube: [(key1, key2, total, count)]} changed since the base was written"""
+        cubes = {}
+        for cube, key1, key2, total, count in self.conn.execute(
+            "SELECT cube, key1, key2, total, count FROM delta_cells "
+            "WHERE count != 0 OR ABS(total) > 0.001 ORDER BY cube, key1, key2"
+        ):
+            cubes.setdefault(cube, []).append((key1, key2, total, count))
+        return cubes
+
+    def top_cells(self, cube, limit=1):
+        return self.conn.execute(
+            "SELECT key1, key2, total, count FROM cube_cells WHERE cube = ? AND count > 0 "
+            "ORDER BY total DESC LIMIT ?", (cube, limit)
+        ).fetchall()
+
+    def commit(self):
+        self.conn.commit()
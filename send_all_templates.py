@@ -6,15 +6,16 @@ Sends all the pre-generated email templates
 
 import os
 import glob
-import email
 import time
 from email_sender import EmailSender
+from delivery_ledger import DeliveryLedger, LEDGER_FILENAME
+from file_utils import file_digest
 
-def send_all_templates(templates_dir):
+def send_all_templates(templates_dir, resume=False):
     """Send all .eml template files in the directory"""
 
     # Find all .eml files
-    eml_files = glob.glob(os.path.join(templates_dir, "*.eml"))
+    eml_files = sorted(glob.glob(os.path.join(templates_dir, "*.eml")))
     eml_files = [f for f in eml_files if not f.endswith("TEST_EMAIL.eml")]  # Skip test email
 
     if not eml_files:
@@ -23,6 +24,20 @@ def send_all_templates(templates_dir):
 
     print(f"📧 Found {len(eml_files)} email templates to send")
 
+    ledger = DeliveryLedger(templates_dir)
+    digests = {eml_file: file_digest(eml_file) for eml_file in eml_files}
+    already_sent = [f for f in eml_files if ledger.is_delivered(digests[f])]
+
+    if resume:
+        eml_files = [f for f in eml_files if f not in already_sent]
+        print(f"⏭️  Skipping {len(already_sent)} already delivered, {len(eml_files)} left to send")
+        if not eml_files:
+            print("✅ Nothing left to send")
+            return
+    elif already_sent:
+        print(f"\n⚠️  {len(already_sent)} of these have already been delivered according to {LEDGER_FILENAME}.")
+        print("   They will be sent AGAIN. Use --resume to skip them.")
+
     # Confirm before sending
     print("\n⚠️  You are about to send emails to real recipients!")
     print("   Make sure you've reviewed the preview files first.")
@@ -38,48 +53,73 @@ def send_all_templates(templates_dir):
     failed = 0
     errors = []
 
-    for eml_file in eml_files:
-        try:
-            print(f"\n📤 Sending: {os.path.basename(eml_file)}")
-
-            # Load the .eml file
-            with open(eml_file, 'r', encoding='utf-8') as f:
-                msg_content = f.read()
-
-            # Parse the email message
-            message = email.message_from_string(msg_content)
-
-            # Send using the email sender
-            result = sender.send_email(message)
-
-            if result['success']:
-                sent += 1
-                recipient = message.get('To', 'Unknown')
-                print(f"✅ Sent to {recipient}")
-            else:
+    try:
+        for eml_file in eml_files:
+            try:
+                print(f"\n📤 Sending: {os.path.basename(eml_file)}")
+
+                # Send the reviewed file byte-for-byte
+                result = sender.send_eml_file(eml_file)
+                recipient = result['recipient']
+                ledger.record(eml_file, digests[eml_file], recipient, result)
+
+                if result['success']:
+                    sent += 1
+                    print(f"✅ Sent to {recipient}")
+                else:
+                    failed += 1
+                    errors.append(f"{recipient}: {result['error']}")
+                    print(f"❌ Failed to send to {recipient}: {result['error']}")
+
+                # Small delay to avoid overwhelming SMTP
+                time.sleep(1)
+
+            except Exception as e:
                 failed += 1
-                recipient = message.get('To', 'Unknown')
-                errors.append(f"{recipient}: {result['error']}")
-                print(f"❌ Failed to send to {recipient}: {result['error']}")
+                errors.append(f"{os.path.basename(eml_file)}: {str(e)}")
+                print(f"❌ Error processing {os.path.basename(eml_file)}: {str(e)}")
 
-            # Small delay to avoid overwhelming SMTP
-            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n⏹️  Interrupted - run again with --resume to continue where this left off")
 
-        except Exception as e:
-            failed += 1
-            errors.append(f"{os.path.basename(eml_file)}: {str(e)}")
-            print(f"❌ Error processing {os.path.basename(eml_file)}: {str(e)}")
+    finally:
+        ledger.close()
 
     print(f"\n📊 Send Summary:")
     print(f"   Total: {len(eml_files)}")
     print(f"   Sent: {sent}")
     print(f"   Failed: {failed}")
+    if resume:
+        print(f"   Skipped (already delivered): {len(already_sent)}")
 
     if errors:
         print(f"\n❌ Errors:")
         for error in errors:
             print(f"   {error}")
 
+def print_delivery_report(templates_dir):
+    """Summarise past sends from the delivery ledger"""
+
+    ledger = DeliveryLedger(templates_dir)
+    report = ledger.summary()
+
+    if not report['attempts']:
+        print(f"📭 No deliveries recorded in {ledger.path}")
+        return
+
+    print(f"📊 Delivery Report ({LEDGER_FILENAME})")
+    print(f"   Send attempts: {report['attempts']}")
+    print(f"   Messages: {report['messages']}")
+    print(f"   Delivered: {report['sent']}")
+    print(f"   Not delivered: {len(report['failed'])}")
+    print(f"   First attempt: {report['first_attempt']}")
+    print(f"   Last attempt: {report['last_attempt']}")
+
+    if report['failed']:
+        print(f"\n❌ Not delivered (latest attempt):")
+        for entry in report['failed']:
+            print(f"   {entry['file']} → {entry['recipient']}: {entry['smtp_response']}")
+
 def send_test_email(templates_dir):
     """Send only the test email template"""
 
@@ -94,15 +134,10 @@ def send_test_email(templates_dir):
     sender = EmailSender()
 
     try:
-        with open(test_file, 'r', encoding='utf-8') as f:
-            msg_content = f.read()
-
-        message = email.message_from_string(msg_content)
-        result = sender.send_email(message)
+        result = sender.send_eml_file(test_file)
 
         if result['success']:
-            recipient = message.get('To', 'Unknown')
-            print(f"✅ Test email sent to {recipient}")
+            print(f"✅ Test email sent to {result['recipient']}")
         else:
             print(f"❌ Test email failed: {result['error']}")
 
@@ -115,6 +150,8 @@ def main():
     parser = argparse.ArgumentParser(description='Send pre-generated email templates')
     parser.add_argument('templates_dir', help='Directory containing .eml template files')
     parser.add_argument('--test-only', action='store_true', help='Send only the test email')
+    parser.add_argument('--resume', action='store_true', help='Skip messages already delivered according to the ledger')
+    parser.add_argument('--report', action='store_true', help='Summarise past sends from the ledger without sending')
 
     args = parser.parse_args()
 
@@ -122,10 +159,12 @@ def main():
         print(f"❌ Directory not found: {args.templates_dir}")
         return
 
-    if args.test_only:
+    if args.report:
+        print_delivery_report(args.templates_dir)
+    elif args.test_only:
         send_test_email(args.templates_dir)
     else:
-        send_all_templates(args.templates_dir)
+        send_all_templates(args.templates_dir, resume=args.resume)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Startup Benchmark
+Checks that the coordinator and CLI modules import without their heavy
+dependencies (python -X importtime), and reports cold import times
+"""
+
+import os
+import sys
+import subprocess
+import statistics
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Set to enforce IMPORT_BUDGETS_MS; timings depend on the machine, so by
+# default they are only reported
+CHECK_BUDGETS_ENV = "CASTLE_CHECK_IMPORT_BUDGETS"
+
+# Module -> cold import budget in milliseconds, on a developer laptop
+IMPORT_BUDGETS_MS = {
+    "guest_list": 60,
+    "pass_registry": 80,
+    "progress_store": 80,
+    "bundle_cache": 80,
+    "qr_generator": 100,
+    "pass_customization": 80,
+    "metrics": 40,
+    "tracing": 40,
+    "job_profiling": 100,
+    "process_event_emails": 150,
+    "workflow_coordinator": 400,
+}
+
+# Dependencies that must only be imported when they are actually used
+HEAVY_MODULES = ["PIL", "qrcode", "smtplib", "email.mime", "gunicorn", "google.auth", "jwt", "requests"]
+
+# Heavy dependencies a module legitimately needs for everything it does
+ALLOWED_HEAVY = {
+    "process_event_emails": ["email.mime"],
+}
+
+# Modules that need an extra directory on sys.path
+MODULE_PATHS = {
+    "google_wallet_generator": os.path.join(BASE_DIR, "wallettest", "google_wallet"),
+}
+
+
+def measure_import(module, path=None):
+    """Import module in a fresh interpreter.
+
+    Returns (cumulative_us, imported_module_names), or (None, error) if
+    the module could not be imported here (e.g. flask not installed).
+    """
+    setup = f"import sys; sys.path.insert(0, {path!r}); " if path else ""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"{setup}import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+
+    cumulative = None
+    imported = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        name = name.strip()
+        imported.append(name)
+        if name == module:
+            cumulative = int(total)
+    return cumulative, imported
+
+
+def heavy_imports(module, imported):
+    heavy_modules = [m for m in HEAVY_MODULES if m not in ALLOWED_HEAVY.get(module, [])]
+    return sorted({
+        name for name in imported
+        for heavy in heavy_modules
+        if name == heavy or name.startswith(heavy + ".")
+    })
+
+
+def benchmark(modules, repeat=5):
+    """Median cold import time and heavy imports for each module"""
+    results = {}
+    for module in modules:
+        path = MODULE_PATHS.get(module)
+        timings = []
+        imported = []
+        error = None
+        for _ in range(repeat):
+            cumulative, imported = measure_import(module, path)
+            if cumulative is None:
+                error = imported
+                break
+            timings.append(cumulative / 1000)
+
+        if error:
+            results[module] = {"error": error}
+        else:
+            results[module] = {
+                "median_ms": statistics.median(timings),
+                "heavy": heavy_imports(module, imported)
+            }
+    return results
+
+
+def test_startup_imports(check_budgets=None):
+    """Every module imports without heavy dependencies (and within its budget, if checked)"""
+    if check_budgets is None:
+        check_budgets = bool(os.environ.get(CHECK_BUDGETS_ENV))
+    modules = list(IMPORT_BUDGETS_MS) + list(MODULE_PATHS)
+    failures = []
+    for module, result in benchmark(modules, repeat=3 if check_budgets else 1).items():
+        if "error" in result:
+            print(f"⚠️  {module}: skipped ({result['error']})")
+            continue
+        budget = IMPORT_BUDGETS_MS.get(module)
+        if check_budgets and budget and result["median_ms"] > budget:
+            failures.append(f"{module} took {result['median_ms']:.1f}ms (budget {budget}ms)")
+        if result["heavy"]:
+            failures.append(f"{module} imports {', '.join(result['heavy'])} at startup")
+    assert not failures, "; ".join(failures)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark cold start-up of Castle Fine Art tools')
+    parser.add_argument('modules', nargs='*', help='Modules to measure (default: all)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per module (median is reported)')
+    parser.add_argument('--check-budgets', action='store_true', default=bool(os.environ.get(CHECK_BUDGETS_ENV)),
+                        help=f'Fail modules over their import time budget (or set {CHECK_BUDGETS_ENV})')
+
+    args = parser.parse_args()
+    modules = args.modules or list(IMPORT_BUDGETS_MS) + list(MODULE_PATHS)
+
+    print(f"⏱️  Cold import times (median of {args.repeat} runs)")
+    print("-" * 60)
+
+    failed = False
+    for module, result in benchmark(modules, args.repeat).items():
+        if "error" in result:
+            print(f"⚠️  {module:<26} skipped: {result['error']}")
+            continue
+
+        budget = IMPORT_BUDGETS_MS.get(module)
+        over_budget = budget is not None and result["median_ms"] > budget
+        status = "❌" if (over_budget and args.check_budgets) or result["heavy"] else "✅"
+        budget_text = f" (budget {budget}ms{', over' if over_budget else ''})" if budget else ""
+        print(f"{status} {module:<26} {result['median_ms']:8.1f}ms{budget_text}")
+        if result["heavy"]:
+            print(f"   heavy imports: {', '.join(result['heavy'])}")
+        failed = failed or status == "❌"
+
+    if failed:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
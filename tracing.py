@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Castle Fine Art - Tracing
+Lightweight spans per event, stage and guest, appended to <event>/trace.jsonl
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+import contextvars
+from contextlib import contextmanager
+
+TRACE_FILENAME = "trace.jsonl"
+# When a new job starts on a trace file larger than this, it is moved to
+# trace.jsonl.1 (replacing the previous one) and a fresh file is started
+MAX_TRACE_BYTES = 32 * 1024 * 1024
+
+# Passed to pipeline scripts so their spans join the coordinator's trace
+TRACE_FILE_ENV = "CASTLE_TRACE_FILE"
+TRACE_PARENT_ENV = "CASTLE_TRACE_PARENT"   # "<trace_id>:<span_id>"
+
+# Spans are buffered and appended in batches, at most this far apart
+FLUSH_EVERY_SPANS = 64
+FLUSH_EVERY_SECONDS = 0.5
+
+_current = contextvars.ContextVar("castle_trace_span", default=None)
+
+
+class Span:
+    __slots__ = ('path', 'trace_id', 'span_id', 'parent_id', 'name', 'kind', 'attrs', 'start', 'status')
+
+    def __init__(self, path, trace_id, span_id, parent_id, name, kind, attrs):
+        self.path = path
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attrs = attrs
+        self.start = time.time()
+        self.status = "ok"
+
+    def set(self, **attrs):
+        """Add attributes (pass_id, bytes, cache hit/miss, ...) before the span ends"""
+        self.attrs.update(attrs)
+
+    def fail(self, error):
+        """Mark the span as failed without raising"""
+        self.status = "error"
+        self.attrs["error"] = str(error)
+
+    def record(self, end=None):
+        end = time.time() if end is None else end
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": round(self.start, 6),
+            "end": round(end, 6),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "status": self.status,
+            "pid": os.getpid(),
+            "attrs": self.attrs,
+        }
+
+
+class _NoSpan:
+    """Stands in for a span when nothing is being traced"""
+
+    def set(self, **attrs):
+        pass
+
+    def fail(self, error):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def _new_id():
+    return os.urandom(8).hex()
+
+
+def trace_path(event_dir):
+    return os.path.join(event_dir, TRACE_FILENAME)
+
+
+def _rotate_if_large(path):
+    try:
+        if os.path.getsize(path) <= MAX_TRACE_BYTES:
+            return
+    except OSError:
+        return
+    _writer(path).flush()
+    os.replace(path, path + '.1')
+
+
+def current_span():
+    """The innermost open span, or the parent handed down by the coordinator"""
+    span = _current.get()
+    if span is not None:
+        return span
+
+    path = os.environ.get(TRACE_FILE_ENV)
+    parent = os.environ.get(TRACE_PARENT_ENV)
+    if not path or not parent or ':' not in parent:
+        return None
+    trace_id, span_id = parent.split(':', 1)
+    return Span(path, trace_id, span_id, None, None, None, {})
+
+
+@contextmanager
+def _open_span(span):
+    token = _current.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.fail(e)
+        raise
+    finally:
+        _current.reset(token)
+        _writer(span.path).add(span.record())
+
+
+@contextmanager
+def trace(event_dir, name, **attrs):
+    """Root span for one job or run over an event.
+
+    Inside another trace (e.g. a script run by a traced job) it becomes a
+    stage span of that trace instead.
+    """
+    if current_span() is not None:
+        with span(name, **attrs) as child:
+            yield child
+        return
+    _rotate_if_large(trace_path(event_dir))
+    root = Span(trace_path(event_dir), _new_id(), _new_id(), None, name, "event", attrs)
+    try:
+        with _open_span(root):
+            yield root
+    finally:
+        _writer(root.path).flush()
+
+
+@contextmanager
+def span(name, kind="stage", **attrs):
+    """Child span of the current one; a no-op when nothing is being traced"""
+    parent = current_span()
+    if parent is None:
+        yield NO_SPAN
+        return
+    with _open_span(Span(parent.path, parent.trace_id, _new_id(), parent.span_id, name, kind, attrs)) as child:
+        yield child
+
+
+def record_span(name, start, end, kind="guest", **attrs):
+    """Record a span that was timed elsewhere (e.g. by create_passes.sh)"""
+    parent = current_span()
+    if parent is None:
+        return
+    child = Span(parent.path, parent.trace_id, _new_id(), parent.span_id, name, kind, attrs)
+    child.start = start
+    _writer(parent.path).add(child.record(end))
+
+
+def subprocess_env():
+    """Environment for a pipeline script whose spans belong under the current span"""
+    env = os.environ.copy()
+    parent = current_span()
+    if parent is not None:
+        env[TRACE_FILE_ENV] = parent.path
+        env[TRACE_PARENT_ENV] = f"{parent.trace_id}:{parent.span_id}"
+    return env
+
+
+# --- Writing ---------------------------------------------------------------
+
+class _TraceWriter:
+    """Appends buffered span lines to one trace file.
+
+    Each batch is a single O_APPEND write, so the coordinator and the
+    scripts it runs can add to the same file without interleaving lines.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.lines = []
+        self.last_flush = time.monotonic()
+
+    def add(self, record):
+        line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+        with self.lock:
+            self.lines.append(line)
+            due = (len(self.lines) >= FLUSH_EVERY_SPANS
+                   or time.monotonic() - self.last_flush >= FLUSH_EVERY_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.lines:
+                return
+            data = ''.join(self.lines).encode('utf-8')
+            self.lines = []
+            self.last_flush = time.monotonic()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _writer(path):
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _TraceWriter(path)
+        return writer
+
+
+def flush_all():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush()
+
+
+def _reset_after_fork():
+    # Lines still buffered belong to the parent, which will write them itself
+    global _writers_lock
+    _writers_lock = threading.Lock()
+    _writers.clear()
+
+
+atexit.register(flush_all)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# --- Reading -------------------------------------------------------------------
+
+class TraceProgress:
+    """Job progress from guest spans completed so far in a trace.
+
+    weights maps span names to their share of the job, e.g.
+    {"pass_generate": 40, "sign": 25, "zip": 25, ...}; each share fills as
+    spans of that name complete for total guests.
+    """
+
+    def __init__(self, path, trace_id, total, weights):
+        self.path = path
+        self.trace_id = trace_id
+        self.total = total
+        self.weights = weights
+        self.counts = {name: 0 for name in weights}
+        self.offset = os.path.getsize(path) if os.path.exists(path) else 0
+        self.partial = b''
+        self.polled_at = 0.0
+
+    def poll(self):
+        """Read newly written spans and return the progress percentage"""
+        self.polled_at = time.monotonic()
+        flush_all()
+        if os.path.exists(self.path):
+            if os.path.getsize(self.path) < self.offset:
+                # Rotated by another job starting on this event
+                self.offset = 0
+                self.partial = b''
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+            self.offset += len(data)
+            lines = (self.partial + data).split(b'\n')
+            self.partial = lines.pop()
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("trace_id") == self.trace_id and record.get("name") in self.counts:
+                    self.counts[record["name"]] += 1
+        return self.percent()
+
+    def percent(self):
+        if not self.total:
+            return 0
+        done = sum(weight * min(1.0, self.counts[name] / self.total) for name, weight in self.weights.items())
+        return int(done)
+
+
+def follow_progress(total, weights):
+    """TraceProgress for the current trace, or None when nothing is being traced"""
+    parent = current_span()
+    if parent is None:
+        return None
+    return TraceProgress(parent.path, parent.trace_id, total, weights)
+
+
+def read_spans(event_dir):
+    """Every span recorded for an event, oldest first"""
+    path = trace_path(event_dir)
+    if not os.path.exists(path):
+        return []
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                spans.append(json.loads(line))
+            except ValueError:
+                continue
+    return spans
+
+
+# --- Timeline ------------------------------------------------------------------
+
+# Guest spans sent to the timeline view; the slowest are always included
+MAX_TIMELINE_GUEST_SPANS = 2000
+SLOWEST_GUEST_SPANS = 20
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def list_traces(spans):
+    """One entry per trace (job run), newest first"""
+    traces = {}
+    for record in spans:
+        entry = traces.get(record["trace_id"])
+        if entry is None:
+            entry = traces[record["trace_id"]] = {
+                "trace_id": record["trace_id"], "name": None, "start": record["start"],
+                "end": record["end"], "spans": 0, "status": "running",
+            }
+        entry["start"] = min(entry["start"], record["start"])
+        entry["end"] = max(entry["end"], record["end"])
+        entry["spans"] += 1
+        if record.get("kind") == "event":
+            entry.update(name=record["name"], status=record["status"], attrs=record.get("attrs", {}))
+    for entry in traces.values():
+        entry["duration_ms"] = round((entry["end"] - entry["start"]) * 1000, 3)
+    return sorted(traces.values(), key=lambda entry: entry["start"], reverse=True)
+
+
+def timeline(spans, trace_id=None, max_guest_spans=MAX_TIMELINE_GUEST_SPANS):
+    """Data for the timeline chart: event and stage spans, a sample of guest
+    spans and per-stage duration summaries for one trace (the newest by default)"""
+    traces = list_traces(spans)
+    if trace_id is None and traces:
+        trace_id = traces[0]["trace_id"]
+    members = [record for record in spans if record["trace_id"] == trace_id]
+    guests = [record for record in members if record.get("kind") == "guest"]
+
+    stages = {}
+    for record in guests:
+        stages.setdefault(record["name"], []).append(record)
+    guest_stages = {}
+    for name, records in stages.items():
+        durations = sorted(record["duration_ms"] for record in records)
+        guest_stages[name] = {
+            "count": len(records),
+            "errors": sum(1 for record in records if record["status"] != "ok"),
+            "total_ms": round(sum(durations), 3),
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "max_ms": durations[-1],
+            "bytes": sum(record["attrs"].get("bytes", 0) for record in records),
+            "cache_hits": sum(1 for record in records if record["attrs"].get("cache") == "hit"),
+        }
+
+    slowest = sorted(guests, key=lambda record: record["duration_ms"], reverse=True)
+    if len(guests) > max_guest_spans:
+        # Keep the outliers plus an even sample of the rest
+        keep = {record["span_id"] for record in slowest[:max_guest_spans // 4]}
+        step = len(guests) / (max_guest_spans - len(keep))
+        keep.update(guests[int(i * step)]["span_id"] for i in range(max_guest_spans - len(keep)))
+        sampled = [record for record in guests if record["span_id"] in keep]
+    else:
+        sampled = guests
+
+    return {
+        "traces": traces,
+        "trace_id": trace_id,
+        "spans": [record for record in members if record.get("kind") != "guest"],
+        "guest_spans": sorted(sampled, key=lambda record: record["start"]),
+        "guest_span_count": len(guests),
+        "guest_stages": guest_stages,
+        "slowest": slowest[:SLOWEST_GUEST_SPANS],
+    }
@@ -34,6 +34,14 @@ if [[ ! -f "$WWDR_PEM" ]]; then
   echo "❌ Missing Apple WWDR PEM: $WWDR_PEM"; exit 1
 fi
 
+# --- Helper: per-pass timings picked up by the coordinator's /metrics (needs bash 5's EPOCHREALTIME) ---
+report_timing() {
+  local stage="$1" started="$2"
+  if [[ -n "$started" ]]; then
+    echo "⏱️  $stage $(basename "$folder") ${started/,/.} ${EPOCHREALTIME/,/.}"
+  fi
+}
+
 # --- Helper: build manifest with a stabilization loop ---
 build_and_sign() {
   local folder="$1"
@@ -62,11 +70,13 @@ with open(os.path.join(folder,'manifest.json'),'w') as fp:
 PY
 
     # sign the manifest
+    sign_started="${EPOCHREALTIME:-}"
     openssl smime -binary -sign \
       -signer "$CERT_PEM" \
       -inkey "$KEY_PEM" \
       -certfile "$WWDR_PEM" \
       -in manifest.json -out signature -outform DER >/dev/null 2>&1
+    report_timing sign "$sign_started"
 
     # re-enumerate after signing; if anything changed (e.g., background.png arrived late), loop
     after_list="$(ls -1A | grep -v -E '^(manifest\.json|signature)$' | LC_ALL=C sort || true)"
@@ -103,7 +113,9 @@ PY
 
   # zip to pkpass (root files only, strip mac attrs)
   rm -f "$OUTPUT_DIR/$(basename "$folder").pkpass"
+  zip_started="${EPOCHREALTIME:-}"
   zip -r -X "$OUTPUT_DIR/$(basename "$folder").pkpass" . -x "*.DS_Store" >/dev/null
+  report_timing zip "$zip_started"
   popd >/dev/null
   echo "✅ Packed $(basename "$folder").pkpass"
 }
@@ -1,20 +1,25 @@
 import os
-import csv
 import json
+import time
 import shutil
 from datetime import datetime, timedelta
 import sys
 
-# Add parent directory to path to import customizer
+# Add parent directory to path to import the customization helpers
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from apple_pass_customizer import load_current_config, apply_customizations_to_pass, copy_custom_assets_to_pass
+    from pass_customization import load_current_config, copy_custom_assets_to_pass
     CUSTOMIZER_AVAILABLE = True
     print("🎨 Pass customization features enabled")
 except ImportError:
     CUSTOMIZER_AVAILABLE = False
     print("⚠️ Pass customization not available - using default settings")
 
+from guest_list import load_guest_table
+from pass_registry import load_pass_registry
+import metrics
+import tracing
+
 # Base directory = project folder where this script lives
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -23,7 +28,6 @@ csv_path = "/Users/marcdelaney/Documents/GitHub/castlecomms/events/Boy George_20
 output_base = os.path.join(BASE_DIR, "passtest")
 strip_image_path = os.path.join(BASE_DIR, "strip.png")
 background_image_path = os.path.join(BASE_DIR, "screenshot_background.png")
-qr_folder = os.path.join(BASE_DIR, "qr_exports")
 
 # Format date as e.g., 12 Sep 2025
 event_date_human = (datetime.now() + timedelta(days=1)).strftime('%d %b %Y')
@@ -58,39 +62,38 @@ base_pass_json = {
     }
 }
 
-# Load and sort QR images
-qr_images = sorted([
-    f for f in os.listdir(qr_folder)
-    if f.lower().endswith('.png')
-])
-
 # Ensure output directory exists
 os.makedirs(output_base, exist_ok=True)
 
-with open(csv_path, newline='', encoding='utf-8-sig') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for idx, row in enumerate(reader):
-        name = row['name'].strip()
-        email = row['email'].strip()
-        guest_count = row['guest_count'].strip()
-        pass_id = row['pass_id'].strip()
-        host_gallery = row['host_gallery'].strip()
-        art_consultant = row['art_consultant'].strip()
+guests = load_guest_table(csv_path)
+
+# QR images are matched to guests by pass_id in the event's pass registry,
+# which is built from the event's qr_codes folder
+event_dir = os.path.dirname(os.path.dirname(os.path.abspath(csv_path)))
+registry = load_pass_registry(event_dir)
+
+with tracing.span("pass_folders", guests=len(guests)):
+    for row in guests:
+        started = time.perf_counter()
+        span_started = time.time()
+        name = row['name']
+        email = row['email']
+        guest_count = row['guest_count']
+        pass_id = row['pass_id']
+        host_gallery = row['host_gallery']
+        art_consultant = row['art_consultant']
 
         pass_folder = os.path.join(output_base, pass_id)
         os.makedirs(pass_folder, exist_ok=True)
 
-        # Use matching QR image (by order)
-        if idx < len(qr_images):
-            qr_source = os.path.join(qr_folder, qr_images[idx])
-            qr_target = os.path.join(pass_folder, "qr.png")
-            if not os.path.exists(qr_target):
-                shutil.copy(qr_source, qr_target)
-                print(f"✅ QR imported for {pass_id} → {qr_images[idx]}")
-            else:
-                print(f"🟡 QR already exists for {pass_id}, skipping import")
+        registry_qr = registry.qr_path(pass_id)
+        if registry_qr:
+            shutil.copy(registry_qr, os.path.join(pass_folder, "qr.png"))
+            qr_origin = "registry"
+            print(f"✅ QR imported for {pass_id} → {os.path.basename(registry_qr)}")
         else:
             print(f"❌ No QR available for {pass_id}, skipped")
+            tracing.record_span("pass_generate", span_started, time.time(), pass_id=pass_id, skipped="no_qr")
             continue
 
         # Copy custom assets if customizer is available, otherwise use defaults
@@ -161,5 +164,8 @@ with open(csv_path, newline='', encoding='utf-8-sig') as csvfile:
         # Write pass.json
         with open(os.path.join(pass_folder, "pass.json"), "w") as f:
             json.dump(pass_json, f, indent=4)
+        metrics.observe("castle_stage_duration_seconds", time.perf_counter() - started, stage="pass_generate")
+        tracing.record_span("pass_generate", span_started, time.time(), pass_id=pass_id, qr=qr_origin,
+                            bytes=os.path.getsize(os.path.join(pass_folder, "pass.json")))
 
 print("\n🎟️ All passes generated with correct QR data, fields, optional strip, and background image.")
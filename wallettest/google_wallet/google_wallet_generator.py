@@ -4,15 +4,18 @@ Google Wallet Event Ticket Generator
 Converts CSV guest data into Google Wallet event tickets
 """
 
+import os
+import sys
 import json
-import csv
 import base64
 import time
-import jwt
 from datetime import datetime
-import requests
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
+
+# Repo root holds the shared guest list module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from guest_list import load_guest_table
+import metrics
+import tracing
 
 # Configuration
 ISSUER_ID = "3388000000023012606"
@@ -24,6 +27,10 @@ BASE_URL = "https://walletobjects.googleapis.com/walletobjects/v1"
 
 class GoogleWalletGenerator:
     def __init__(self):
+        # google-auth is slow to import, so load it only when passes are generated
+        from google.auth.transport.requests import Request
+        from google.oauth2 import service_account
+
         # Load service account credentials
         self.credentials = service_account.Credentials.from_service_account_file(
             SERVICE_ACCOUNT_FILE,
@@ -98,6 +105,7 @@ class GoogleWalletGenerator:
         }
 
         url = f"{BASE_URL}/genericClass"
+        import requests
         response = requests.post(url, headers=headers, json=generic_class)
 
         if response.status_code == 200:
@@ -207,6 +215,7 @@ class GoogleWalletGenerator:
         }
 
         # Sign JWT with private key
+        import jwt
         token = jwt.encode(payload, private_key, algorithm='RS256')
 
         return token
@@ -214,45 +223,52 @@ class GoogleWalletGenerator:
     def generate_passes(self):
         """Generate all passes from CSV data"""
         # First create the generic class
-        if not self.create_generic_class():
+        with tracing.span("google_class"):
+            class_created = self.create_generic_class()
+        if not class_created:
             return
 
         generated_passes = []
 
-        with open(CSV_FILE, 'r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
+        guests = load_guest_table(CSV_FILE)
 
-            for i, row in enumerate(reader, 1):
-                pass_id = f"GPASS{i:03d}"
+        for row in guests:
+            # Use the CSV pass_id so Google objects join to the same guest as the Apple pass
+            pass_id = row['pass_id']
 
-                guest_data = {
-                    'name': row['name'],
-                    'guest_count': row['guest_count'],
-                    'email': row['email'],
-                    'host_gallery': row['host_gallery'],
-                    'art_consultant': row['art_consultant']
-                }
+            guest_data = {
+                'name': row['name'],
+                'guest_count': row['guest_count'],
+                'email': row['email'],
+                'host_gallery': row['host_gallery'],
+                'art_consultant': row['art_consultant']
+            }
 
+            with tracing.span("google_pass", kind="guest", pass_id=pass_id) as span:
                 # Create generic object
                 generic_object = self.create_generic_object(guest_data, pass_id)
 
                 # Create JWT token
-                jwt_token = self.create_jwt_token(generic_object)
-
-                # Create Google Wallet URL
-                wallet_url = f"https://pay.google.com/gp/v/save/{jwt_token}"
-
-                pass_info = {
-                    'pass_id': pass_id,
-                    'name': guest_data['name'],
-                    'email': guest_data['email'],
-                    'guest_count': guest_data['guest_count'],
-                    'jwt_token': jwt_token,
-                    'wallet_url': wallet_url
-                }
+                with metrics.timed("google_jwt"):
+                    jwt_token = self.create_jwt_token(generic_object)
+                span.set(bytes=len(jwt_token))
+            metrics.inc("castle_passes_built_total", wallet="google")
+
+            # Create Google Wallet URL
+            wallet_url = f"https://pay.google.com/gp/v/save/{jwt_token}"
+
+            pass_info = {
+                'pass_id': pass_id,
+                'object_id': generic_object['id'],
+                'name': guest_data['name'],
+                'email': guest_data['email'],
+                'guest_count': guest_data['guest_count'],
+                'jwt_token': jwt_token,
+                'wallet_url': wallet_url
+            }
 
-                generated_passes.append(pass_info)
-                print(f"✅ Generated Google Wallet pass for {guest_data['name']} - {pass_id}")
+            generated_passes.append(pass_info)
+            print(f"✅ Generated Google Wallet pass for {guest_data['name']} - {pass_id}")
 
         # Save pass URLs to file
         with open('google_wallet_passes.json', 'w') as f:
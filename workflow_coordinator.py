@@ -4,9 +4,10 @@ Castle Fine Art - Event Workflow Coordinator
 Orchestrates QR generation, Apple Wallet, Google Wallet, and email sending
 """
 
-from flask import Flask, request, jsonify, send_file, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
+import io
 import shutil
 import subprocess
 import json
@@ -15,14 +16,24 @@ import zipfile
 import tempfile
 import threading
 import time
-from datetime import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 import glob
-from email_template_generator import EmailTemplateGenerator
+import re
+import importlib.util
+from urllib.parse import quote
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import safe_join
+from guest_list import ingest_guest_csv, load_guest_table, load_event_guests
+from pass_registry import load_pass_registry
+from file_utils import file_digest
+from qr_generator import generate_event_qr_codes
+from bundle_cache import get_bundle
+from progress_store import ProgressStore
+from email_rendering import load_email_template
+import metrics
+import tracing
+
+# gunicorn is only imported for --production, keeping normal start-up fast
+GUNICORN_AVAILABLE = importlib.util.find_spec("gunicorn") is not None
 
 app = Flask(__name__)
 CORS(app)
@@ -34,26 +45,109 @@ EVENTS_DIR = os.path.join(BASE_DIR, "events")          # inside repo
 QR_EXPORTS_DIR = os.path.join(WALLETTEST_DIR, "qr_exports")
 GOOGLE_WALLET_DIR = os.path.join(WALLETTEST_DIR, "google_wallet")
 
-# Progress tracking with file persistence
-PROGRESS_FILE = os.path.join(BASE_DIR, "progress_data.json")
+# QR ZIP upload limits (guards against zip bombs)
+MAX_QR_IMAGE_BYTES = 2 * 1024 * 1024          # per PNG, uncompressed
+MAX_QR_ZIP_TOTAL_BYTES = 512 * 1024 * 1024    # whole archive, uncompressed
+MAX_QR_COMPRESSION_RATIO = 100
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
 
-def load_progress_data():
-    if os.path.exists(PROGRESS_FILE):
-        try:
-            with open(PROGRESS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    return {}
+# Per-pass timing lines printed by create_passes.sh: "⏱️  sign PASS001 <start> <end>"
+SCRIPT_TIMING_PATTERN = re.compile(r'^⏱️\s+(sign|zip) (\S+) ([\d.]+) ([\d.]+)$')
+
+# Share of a job's progress filled by each kind of completed guest span
+APPLE_PROGRESS_WEIGHTS = {"pass_generate": 40, "sign": 25, "zip": 25, "pass_copy": 10}
+GOOGLE_PROGRESS_WEIGHTS = {"google_pass": 100}
+PROGRESS_POLL_INTERVAL = 0.5  # seconds between reads of the trace file
+
+# Per-guest stages of each background job, tracked for throughput and ETA
+JOB_STAGES = {
+    "qr_codes": ["qr_write"],
+    "apple_wallet": list(APPLE_PROGRESS_WEIGHTS),
+    "google_wallet": list(GOOGLE_PROGRESS_WEIGHTS),
+    "emails": ["email_send"],
+}
+
+# Progress tracking, shared through SQLite so every worker process sees the same state
+PROGRESS_DB = os.path.join(BASE_DIR, "progress_data.db")
+PROGRESS_FILE = os.path.join(BASE_DIR, "progress_data.json")    # legacy, imported once
 
 def save_progress_data(data):
     try:
-        with open(PROGRESS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-    except:
-        pass
+        data.save()
+    except Exception as e:
+        print(f"⚠️  Could not save progress: {e}")
+
+progress_data = ProgressStore(PROGRESS_DB, legacy_json_path=PROGRESS_FILE)
+
+# Metrics from every worker process and pipeline script are collected here for /metrics
+os.environ.setdefault(metrics.METRICS_DIR_ENV, os.path.join(BASE_DIR, "metrics_data"))
+metrics.register_gauge("castle_jobs", "Background jobs by state", progress_data.job_counts, label="state")
+metrics.register_gauge("castle_progress_store_events", "Events in the progress store", lambda: len(progress_data))
+
+# Static assets with a content hash in their name (e.g. app.3f9c2b1a.js) never change
+HASHED_ASSET_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.[a-z0-9]+$', re.IGNORECASE)
+
+# Content digests used as ETags, keyed by path and invalidated on mtime/size change
+_etag_cache = {}
+
+def file_etag(path):
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _etag_cache.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    etag = file_digest(path)
+    _etag_cache[path] = (signature, etag)
+    return etag
+
+def cache_control_for(path):
+    """Cache-Control policy for a served file, by file class"""
+    extension = os.path.splitext(path)[1].lower()
+    if HASHED_ASSET_PATTERN.search(os.path.basename(path)):
+        return "public, max-age=31536000, immutable"
+    if extension == '.pkpass':
+        # Personal and regenerated in place, so always revalidate
+        return "private, no-cache"
+    if extension in ('.html', '.htm', '.json'):
+        return "no-cache"
+    return "public, max-age=300"
+
+def send_cached_file(path, **kwargs):
+    """send_file with a strong content ETag, If-None-Match/304 and Range support"""
+    response = send_file(path, etag=file_etag(path), conditional=True, **kwargs)
+    response.headers['Cache-Control'] = cache_control_for(path)
+    return response
+
+def attachment_disposition(filename):
+    """Content-Disposition for a download, quoted as send_file(download_name=...) does"""
+    simple = ''.join(c for c in filename if c.isascii() and c.isprintable() and c not in '"\\')
+    header = f'attachment; filename="{simple}"'
+    if simple != filename:
+        header += f"; filename*=UTF-8''{quote(filename, safe='')}"
+    return header
+
+def observe_script_timing(line):
+    """Record a create_passes.sh timing line as a metric and a span, returning True if line was one"""
+    match = SCRIPT_TIMING_PATTERN.match(line)
+    if not match:
+        return False
+    stage, folder, started, finished = match.groups()
+    metrics.observe("castle_stage_duration_seconds", float(finished) - float(started), stage=stage)
+    tracing.record_span(stage, float(started), float(finished), pass_id=os.path.basename(folder))
+    return True
+
+def report_span_progress(event_name, progress, force=False):
+    """Copy a job's span-based progress and stage throughput into progress_data,
+    at most every PROGRESS_POLL_INTERVAL"""
+    if not event_name or progress is None:
+        return
+    if not force and time.monotonic() - progress.polled_at < PROGRESS_POLL_INTERVAL:
+        return
+    progress_data[event_name]["progress"] = progress.poll()
+    for stage, completed in progress.counts.items():
+        progress_data.record_throughput(event_name, stage, completed)
+    save_progress_data(progress_data)
 
-progress_data = load_progress_data()
 
 class EventCoordinator:
     def __init__(self, event_name):
@@ -83,34 +177,120 @@ class EventCoordinator:
                 writer.writerows(csv_data)
         return csv_path
 
-    def extract_qr_codes(self, qr_zip_path):
+    def ingest_csv_upload(self, stream):
+        """Stream a raw CSV upload into the event's guest list"""
+        csv_path = os.path.join(self.event_dir, "csv", "guest_list.csv")
+        return ingest_guest_csv(stream, csv_path)
+
+    def extract_qr_codes(self, qr_zip):
+        """Stream PNG members of a QR ZIP straight into the event's qr_codes folder.
+
+        qr_zip may be a path or a seekable file object (e.g. the upload's
+        spooled buffer). Member paths are flattened as they are written, and
+        non-PNG, oversized or colliding entries are rejected without being
+        extracted. Images are staged until the whole archive has been read,
+        so a bad upload leaves the existing QR codes in place.
+        """
+        with metrics.timed("qr_extract"):
+            return self._extract_qr_codes(qr_zip)
+
+    def _extract_qr_codes(self, qr_zip):
+        qr_event_dir = os.path.join(self.event_dir, "qr_codes")
+        staging_dir = tempfile.mkdtemp(prefix=".qr_upload-", dir=self.event_dir)
         try:
-            for file in glob.glob(os.path.join(QR_EXPORTS_DIR, "*.png")):
-                os.remove(file)
-            with zipfile.ZipFile(qr_zip_path, 'r') as zip_ref:
-                zip_ref.extractall(QR_EXPORTS_DIR)
-            for root, dirs, files in os.walk(QR_EXPORTS_DIR):
-                for file in files:
-                    if file.endswith('.png') and root != QR_EXPORTS_DIR:
-                        shutil.move(os.path.join(root, file), os.path.join(QR_EXPORTS_DIR, file))
-            for root, dirs, files in os.walk(QR_EXPORTS_DIR, topdown=False):
-                for dir in dirs:
-                    dir_path = os.path.join(root, dir)
-                    if not os.listdir(dir_path):
-                        os.rmdir(dir_path)
-            qr_event_dir = os.path.join(self.event_dir, "qr_codes")
-            for file in glob.glob(os.path.join(QR_EXPORTS_DIR, "*.png")):
-                shutil.copy2(file, qr_event_dir)
-            qr_count = len(glob.glob(os.path.join(QR_EXPORTS_DIR, "*.png")))
-            return {"success": True, "qr_count": qr_count}
+            written = {}     # lowercased name -> name, as flattened names may collide
+            collided = set()
+            rejected = []
+            total_bytes = 0
+
+            with zipfile.ZipFile(qr_zip, 'r') as zip_ref:
+                for info in zip_ref.infolist():
+                    filename = os.path.basename(info.filename)
+                    if info.is_dir() or not filename or filename.startswith('.') or '__MACOSX' in info.filename:
+                        continue
+                    if not filename.lower().endswith('.png'):
+                        rejected.append(f"{info.filename}: not a PNG")
+                        continue
+                    if info.file_size > MAX_QR_IMAGE_BYTES:
+                        rejected.append(f"{info.filename}: larger than {MAX_QR_IMAGE_BYTES} bytes")
+                        continue
+                    if info.compress_size and info.file_size / info.compress_size > MAX_QR_COMPRESSION_RATIO:
+                        rejected.append(f"{info.filename}: suspicious compression ratio")
+                        continue
+                    if total_bytes + info.file_size > MAX_QR_ZIP_TOTAL_BYTES:
+                        return {"success": False, "error": f"ZIP expands beyond {MAX_QR_ZIP_TOTAL_BYTES} bytes"}
+
+                    # Header sizes can lie, so the limit is enforced on the bytes actually read
+                    with zip_ref.open(info) as member:
+                        data = member.read(MAX_QR_IMAGE_BYTES + 1)
+                    if len(data) > MAX_QR_IMAGE_BYTES:
+                        rejected.append(f"{info.filename}: larger than {MAX_QR_IMAGE_BYTES} bytes")
+                        continue
+                    if not data.startswith(PNG_SIGNATURE):
+                        rejected.append(f"{info.filename}: not a valid PNG")
+                        continue
+                    if filename.lower() in written:
+                        rejected.append(f"{info.filename}: duplicate file name {filename}")
+                        collided.add(filename.lower())
+                        continue
+
+                    total_bytes += len(data)
+                    with open(os.path.join(staging_dir, filename), 'wb') as f:
+                        f.write(data)
+                    written[filename.lower()] = filename
+
+            # Neither copy of a colliding name can be trusted to be the right guest's
+            for key in collided:
+                filename = written.pop(key)
+                os.remove(os.path.join(staging_dir, filename))
+                rejected.append(f"{filename}: duplicate file name")
+
+            if not written:
+                return {"success": False, "error": "ZIP contains no valid PNG images",
+                        "errors": rejected[:100]}
+
+            # The archive is good: swap the staged images in, then drop the old ones
+            os.makedirs(qr_event_dir, exist_ok=True)
+            for filename in written.values():
+                os.replace(os.path.join(staging_dir, filename), os.path.join(qr_event_dir, filename))
+            keep = set(written.values())
+            for file in glob.glob(os.path.join(qr_event_dir, "*.png")):
+                if os.path.basename(file) not in keep:
+                    os.remove(file)
+
+            qr_count = len(written)
+            metrics.inc("castle_bytes_written_total", total_bytes, kind="qr_code")
+
+            # Map each QR image to its guest's pass_id
+            registry = load_pass_registry(self.event_dir)
+            with registry.lock:
+                matched = registry.sync_qr_codes(qr_event_dir, load_event_guests(self.event_dir))
+                registry.save()
+
+            return {
+                "success": True,
+                "qr_count": qr_count,
+                "qr_matched": matched,
+                "rejected": len(rejected),
+                "errors": rejected[:100]
+            }
         except Exception as e:
             return {"success": False, "error": str(e)}
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def generate_qr_codes(self, progress_callback=None):
+        """Render guest QR codes directly into the event directory"""
+        return generate_event_qr_codes(self.event_dir, progress_callback=progress_callback)
 
     def generate_apple_wallet_passes(self, csv_path, event_name=None):
         """Run Apple Wallet generation with live debug logs"""
         try:
             self.update_generate_passes_csv_path(csv_path)
 
+            # Progress comes from per-guest spans written by the scripts and the copy step
+            progress = tracing.follow_progress(len(load_event_guests(self.event_dir)), APPLE_PROGRESS_WEIGHTS)
+
             def run_subprocess(cmd, cwd, step_name):
                 import select
                 import time
@@ -118,6 +298,7 @@ class EventCoordinator:
                 process = subprocess.Popen(
                     cmd,
                     cwd=cwd,
+                    env=tracing.subprocess_env(),
                     stdout=subprocess.PIPE,
                     stderr=subprocess.PIPE,
                     text=True,
@@ -147,28 +328,14 @@ class EventCoordinator:
                         line = process.stdout.readline()
                         if line:
                             line = line.strip()
-                            logs.append(line)
-                            print(f"[{step_name}] {line}")
-                            if event_name:
-                                progress_data[event_name]["status"] = f"{step_name}: {line}"
-                                save_progress_data(progress_data)
-                                
-                                # Extract progress from create_passes.sh output
-                                if step_name == "create_passes.sh" and "Processing PASS" in line and "/" in line:
-                                    try:
-                                        # Extract current/total from "Processing PASS001... (1/50)"
-                                        parts = line.split("(")[1].split(")")[0].split("/")
-                                        current = int(parts[0])
-                                        total = int(parts[1])
-                                        # Map progress from 50% to 90% based on pass processing
-                                        base_progress = 50
-                                        max_progress = 90
-                                        progress_range = max_progress - base_progress
-                                        pass_progress = int(base_progress + (current / total) * progress_range)
-                                        progress_data[event_name]["progress"] = pass_progress
-                                        save_progress_data(progress_data)
-                                    except (IndexError, ValueError):
-                                        pass  # Ignore parsing errors
+                            if not observe_script_timing(line):
+                                logs.append(line)
+                                print(f"[{step_name}] {line}")
+                                if event_name:
+                                    progress_data[event_name]["status"] = f"{step_name}: {line}"
+                                    save_progress_data(progress_data)
+                            report_span_progress(event_name, progress)
+                            continue
                         
                         time.sleep(0.1)  # Small delay to prevent busy waiting
                     
@@ -177,7 +344,7 @@ class EventCoordinator:
                     if remaining_stdout:
                         for line in remaining_stdout.splitlines():
                             line = line.strip()
-                            if line:
+                            if line and not observe_script_timing(line):
                                 logs.append(line)
                                 print(f"[{step_name}] {line}")
                                 if event_name:
@@ -205,48 +372,58 @@ class EventCoordinator:
             # Step 1
             if event_name:
                 progress_data[event_name]["status"] = "Starting generate_passes.py..."
-                progress_data[event_name]["progress"] = 10
                 save_progress_data(progress_data)
-            code1, logs1 = run_subprocess(
-                ["python3", os.path.join(WALLETTEST_DIR, "generate_passes.py")],
-                cwd=WALLETTEST_DIR,
-                step_name="generate_passes.py"
-            )
+            with tracing.span("generate_passes.py"):
+                code1, logs1 = run_subprocess(
+                    ["python3", os.path.join(WALLETTEST_DIR, "generate_passes.py")],
+                    cwd=WALLETTEST_DIR,
+                    step_name="generate_passes.py"
+                )
             if code1 != 0:
                 return {"success": False, "error": f"generate_passes.py failed:\n{logs1}"}
 
             # Step 2
             if event_name:
                 progress_data[event_name]["status"] = "Starting create_passes.sh..."
-                progress_data[event_name]["progress"] = 50
                 save_progress_data(progress_data)
-            code2, logs2 = run_subprocess(
-                ["bash", os.path.join(WALLETTEST_DIR, "create_passes.sh")],
-                cwd=WALLETTEST_DIR,
-                step_name="create_passes.sh"
-            )
+            report_span_progress(event_name, progress, force=True)
+            with tracing.span("create_passes.sh"):
+                code2, logs2 = run_subprocess(
+                    ["bash", os.path.join(WALLETTEST_DIR, "create_passes.sh")],
+                    cwd=WALLETTEST_DIR,
+                    step_name="create_passes.sh"
+                )
             if code2 != 0:
                 return {"success": False, "error": f"create_passes.sh failed:\n{logs2}"}
                 
             # Step 3 - Copying files
             if event_name:
                 progress_data[event_name]["status"] = "Copying passes to event directory..."
-                progress_data[event_name]["progress"] = 90
                 save_progress_data(progress_data)
+            report_span_progress(event_name, progress, force=True)
 
             pkpass_dir = os.path.join(WALLETTEST_DIR, "pkpasses")
             event_apple_dir = os.path.join(self.event_dir, "apple_passes")
             os.makedirs(event_apple_dir, exist_ok=True)  # ensure it exists
 
             if os.path.exists(pkpass_dir):
-                for file in glob.glob(os.path.join(pkpass_dir, "*.pkpass")):
-                    try:
-                        shutil.copy2(file, event_apple_dir)
-                        print(f"[Apple Wallet] Copied {os.path.basename(file)} → {event_apple_dir}")
-                    except Exception as e:
-                        print(f"[Apple Wallet ERROR] Failed copying {file}: {e}")
-
-            pass_count = len(glob.glob(os.path.join(event_apple_dir, "*.pkpass")))
+                with tracing.span("copy_passes"):
+                    for file in glob.glob(os.path.join(pkpass_dir, "*.pkpass")):
+                        try:
+                            size = os.path.getsize(file)
+                            with tracing.span("pass_copy", kind="guest", pass_id=os.path.basename(file)[:-len('.pkpass')], bytes=size):
+                                shutil.copy2(file, event_apple_dir)
+                            metrics.inc("castle_passes_built_total", wallet="apple")
+                            metrics.inc("castle_bytes_written_total", size, kind="apple_pass")
+                            print(f"[Apple Wallet] Copied {os.path.basename(file)} → {event_apple_dir}")
+                        except Exception as e:
+                            print(f"[Apple Wallet ERROR] Failed copying {file}: {e}")
+                        report_span_progress(event_name, progress)
+
+            registry = load_pass_registry(self.event_dir)
+            with registry.lock:
+                pass_count = registry.sync_apple_passes(event_apple_dir)
+                registry.save()
             print(f"[Apple Wallet] Final pass count: {pass_count}")
             return {"success": True, "pass_count": pass_count}
         except Exception as e:
@@ -273,22 +450,32 @@ class EventCoordinator:
             shutil.copy2(backup, script)
             os.remove(backup)
 
-    def generate_google_wallet_passes(self, csv_path):
+    def generate_google_wallet_passes(self, csv_path, event_name=None):
         """Run Google Wallet generation script"""
         try:
             # Update CSV path in google_wallet_generator.py
             self.update_google_wallet_csv_path(csv_path)
 
-            # Run google_wallet_generator.py
-            result = subprocess.run(
-                ["python3", os.path.join(GOOGLE_WALLET_DIR, "google_wallet_generator.py")],
-                cwd=GOOGLE_WALLET_DIR,
-                capture_output=True,
-                text=True
-            )
+            # Run google_wallet_generator.py, following its per-guest spans for progress
+            progress = tracing.follow_progress(len(load_event_guests(self.event_dir)), GOOGLE_PROGRESS_WEIGHTS)
+            with tracing.span("google_wallet_generator.py"):
+                process = subprocess.Popen(
+                    ["python3", os.path.join(GOOGLE_WALLET_DIR, "google_wallet_generator.py")],
+                    cwd=GOOGLE_WALLET_DIR,
+                    env=tracing.subprocess_env(),
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True
+                )
+                while True:
+                    try:
+                        _, stderr_output = process.communicate(timeout=PROGRESS_POLL_INTERVAL)
+                        break
+                    except subprocess.TimeoutExpired:
+                        report_span_progress(event_name, progress)
 
-            if result.returncode != 0:
-                return {"success": False, "error": f"Google Wallet generation failed: {result.stderr}"}
+            if process.returncode != 0:
+                return {"success": False, "error": f"Google Wallet generation failed: {stderr_output}"}
 
             # Copy generated URLs to event directory
             urls_file = os.path.join(GOOGLE_WALLET_DIR, "google_wallet_passes.json")
@@ -296,10 +483,15 @@ class EventCoordinator:
                 event_google_dir = os.path.join(self.event_dir, "google_passes")
                 shutil.copy2(urls_file, event_google_dir)
 
-                # Load and count passes
+                # Load and count passes, then join them to guests by pass_id
                 with open(urls_file, 'r') as f:
                     passes = json.load(f)
                     pass_count = len(passes)
+
+                registry = load_pass_registry(self.event_dir)
+                with registry.lock:
+                    registry.sync_google_passes(passes, load_event_guests(self.event_dir))
+                    registry.save()
             else:
                 pass_count = 0
 
@@ -340,68 +532,50 @@ class EventCoordinator:
             shutil.copy2(backup_script, google_script)
             os.remove(backup_script)
 
-    def generate_personalized_emails(self, event_data, csv_data):
-        """Generate personalized emails for each guest"""
+    def generate_personalized_emails(self, event_data, csv_data, save_html=False):
+        """Generate personalized emails for each guest (save_html also writes emails/<name>_email.html)"""
         try:
-            # Load email template
-            template_path = os.path.join(GOOGLE_WALLET_DIR, "email_template.html")
-            with open(template_path, 'r') as f:
-                template = f.read()
-
-            # Load Google Wallet passes
-            google_passes_file = os.path.join(self.event_dir, "google_passes", "google_wallet_passes.json")
-            google_passes = {}
-            if os.path.exists(google_passes_file):
-                with open(google_passes_file, 'r') as f:
-                    passes = json.load(f)
-                    for pass_data in passes:
-                        google_passes[pass_data['name']] = pass_data['wallet_url']
+            # Load email template (parsed once and cached until it changes)
+            template = load_email_template(os.path.join(GOOGLE_WALLET_DIR, "email_template.html"))
 
-            # Get Apple Wallet passes
-            apple_passes_dir = os.path.join(self.event_dir, "apple_passes")
+            # Wallet artefacts for each guest, keyed by pass_id
+            registry = load_pass_registry(self.event_dir)
+            encoded_event_name = quote(self.event_name)
 
             emails = []
 
             for i, row in enumerate(csv_data):
-                # Personalize email content
-                personalized_email = template.replace("Trevor Cooper", row['name'])
-                personalized_email = personalized_email.replace("4 people", f"{row['guest_count']} people" if int(row['guest_count']) != 1 else "1 person")
-                personalized_email = personalized_email.replace("Sunday, 15 December 2024", event_data.get('date', 'TBD'))
-                personalized_email = personalized_email.replace("6:00 PM - 10:00 PM", f"{event_data.get('time', 'TBD')} onwards")
-                personalized_email = personalized_email.replace("Castle Fine Art, The Mailbox, Birmingham", event_data.get('location', 'TBD'))
-
-                # Update Apple Wallet download link
-                from urllib.parse import quote
-                encoded_event_name = quote(self.event_name)
+                google_url = registry.google_url(row['pass_id'])
                 apple_download_url = f"http://localhost:5001/api/events/{encoded_event_name}/apple-pass/{row['pass_id']}"
-                personalized_email = personalized_email.replace('APPLE_WALLET_DOWNLOAD_LINK', apple_download_url)
-                
-                # Update Google Wallet URL
-                google_url = google_passes.get(row['name'], '#')
-                if google_url != '#':
-                    # Find and replace the entire href attribute for Google Wallet button
-                    import re
-                    google_pattern = r'href="https://pay\.google\.com/gp/v/save/[^"]*"'
-                    personalized_email = re.sub(google_pattern, f'href="{google_url}"', personalized_email)
+
+                # Personalize email content, Apple and Google Wallet links included
+                with tracing.span("email_render", kind="guest", pass_id=row['pass_id']) as span:
+                    personalized_email = template.render(
+                        row, event_data,
+                        google_url=google_url,
+                        apple_download_url=apple_download_url
+                    )
+                    span.set(bytes=len(personalized_email))
 
                 # Find corresponding Apple Wallet pass
-                apple_pass_file = os.path.join(apple_passes_dir, f"{row['pass_id']}.pkpass")
+                apple_pass_file = registry.apple_pass_path(row['pass_id'])
 
                 email_data = {
                     'to': row['email'],
                     'name': row['name'],
                     'guest_count': row['guest_count'],
                     'html_content': personalized_email,
-                    'apple_pass_file': apple_pass_file if os.path.exists(apple_pass_file) else None,
+                    'apple_pass_file': apple_pass_file,
                     'google_wallet_url': google_url
                 }
 
                 emails.append(email_data)
 
-                # Save individual email HTML
-                email_file = os.path.join(self.event_dir, "emails", f"{row['name'].replace(' ', '_')}_email.html")
-                with open(email_file, 'w') as f:
-                    f.write(personalized_email)
+                # Save individual email HTML for review or process_event_emails --from-html
+                if save_html:
+                    email_file = os.path.join(self.event_dir, "emails", f"{row['name'].replace(' ', '_')}_email.html")
+                    with open(email_file, 'w') as f:
+                        f.write(personalized_email)
 
             return {"success": True, "emails": emails}
 
@@ -440,6 +614,77 @@ def create_event():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/events/<event_name>/guests', methods=['POST'])
+def upload_guest_list(event_name):
+    """Upload a raw guest list CSV (multipart 'csv_file' or a text/csv body)"""
+    try:
+        event_info = None
+        if 'csv_file' in request.files:
+            csv_file = request.files['csv_file']
+            if csv_file.filename == '':
+                return jsonify({"error": "No file selected"}), 400
+            stream = csv_file.stream
+
+            # Optional event details sent alongside the multipart upload, checked
+            # before the guest list is replaced
+            event_data = request.form.get('event_data')
+            if event_data:
+                try:
+                    event_info = json.loads(event_data)
+                except ValueError as e:
+                    return jsonify({"error": f"Invalid event_data JSON: {e}"}), 400
+                if not isinstance(event_info, dict):
+                    return jsonify({"error": "event_data must be a JSON object"}), 400
+        elif request.mimetype == 'text/csv':
+            stream = request.stream
+        else:
+            return jsonify({"error": "No CSV file uploaded"}), 400
+
+        coordinator = EventCoordinator(event_name)
+        result = coordinator.ingest_csv_upload(stream)
+
+        if not result["success"]:
+            return jsonify(result), 400
+
+        if event_info is not None:
+            event_info_path = os.path.join(coordinator.event_dir, "event_info.json")
+            with open(event_info_path, 'w') as f:
+                json.dump(event_info, f, indent=2)
+
+        result["event_name"] = event_name
+        result["guest_count"] = result["rows_written"]
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/events/<event_name>/guests/<key>', methods=['GET'])
+def get_guest(event_name, key):
+    """Look up a single guest by pass_id, email or name"""
+    try:
+        event_dir = os.path.join(EVENTS_DIR, event_name)
+        csv_path = os.path.join(event_dir, "csv", "guest_list.csv")
+        if not os.path.exists(csv_path):
+            return jsonify({"error": "Event not found"}), 404
+
+        guest = load_guest_table(csv_path).lookup(key)
+        if guest is None:
+            return jsonify({"error": "Guest not found"}), 404
+
+        apple_pass_file = os.path.join(event_dir, "apple_passes", f"{guest['pass_id']}.pkpass")
+        return jsonify({
+            "success": True,
+            "guest": guest.as_dict(),
+            "index": guest.index,
+            "has_apple_pass": os.path.exists(apple_pass_file),
+            "apple_pass_url": f"/api/events/{quote(event_name)}/apple-pass/{quote(guest['pass_id'])}"
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/events/<event_name>/qr-extract', methods=['POST'])
 def extract_qr_codes(event_name):
     """Extract QR codes from uploaded ZIP"""
@@ -452,16 +697,9 @@ def extract_qr_codes(event_name):
         return jsonify({"error": "No file selected"}), 400
 
     try:
-        # Save uploaded ZIP temporarily
-        temp_zip = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-        qr_zip.save(temp_zip.name)
-        temp_zip.close()
-
+        # Read members straight from the upload's spooled buffer
         coordinator = EventCoordinator(event_name)
-        result = coordinator.extract_qr_codes(temp_zip.name)
-
-        # Clean up temp file
-        os.unlink(temp_zip.name)
+        result = coordinator.extract_qr_codes(qr_zip.stream)
 
         return jsonify(result)
 
@@ -469,88 +707,221 @@ def extract_qr_codes(event_name):
         return jsonify({"error": str(e)}), 500
 
 
-@app.route('/api/events/<event_name>/apple-wallet', methods=['POST'])
-def generate_apple_wallet(event_name):
-    def generate_async():
-        progress_data[event_name] = {"step": "apple_wallet", "progress": 0, "status": "Starting..."}
+def record_skipped_guests(event_name, guests):
+    """Put guest rows the guest list skipped (e.g. an invalid guest_count) in the job's progress"""
+    if guests.warnings:
+        progress_data[event_name]["warnings"] = list(guests.warnings)
+        progress_data[event_name]["skipped_guests"] = len(guests.warnings)
+
+
+def skipped_guests_note(event_name):
+    skipped = progress_data[event_name].get("skipped_guests")
+    return f" ({skipped} guest rows skipped, see warnings)" if skipped else ""
+
+
+def run_qr_codes_job(event_name):
+    """Render guest QR codes and record progress"""
+    progress_data[event_name] = {"step": "qr_codes", "progress": 0, "status": "Rendering QR codes..."}
+    save_progress_data(progress_data)
+    try:
+        coordinator = EventCoordinator(event_name)
+        guests = load_event_guests(coordinator.event_dir)
+        record_skipped_guests(event_name, guests)
+        progress_data.start_stages(event_name, JOB_STAGES["qr_codes"], len(guests))
+
+        def progress_callback(current, total):
+            progress_data[event_name]["progress"] = int(current / total * 100) if total else 100
+            progress_data[event_name]["status"] = f"Rendered {current}/{total} QR codes"
+            progress_data.record_throughput(event_name, "qr_write", current)
+            save_progress_data(progress_data)
+
+        result = coordinator.generate_qr_codes(progress_callback)
+        progress_data[event_name]["progress"] = 100
+        if result["success"]:
+            progress_data[event_name]["status"] = f"Generated {result['qr_count']} QR codes" + skipped_guests_note(event_name)
+            progress_data[event_name]["completed"] = True
+            progress_data[event_name]["qr_count"] = result['qr_count']
+        else:
+            progress_data[event_name]["status"] = f"Error: {result['error']}"
+            progress_data[event_name]["error"] = result['error']
         save_progress_data(progress_data)
-        try:
-            coordinator = EventCoordinator(event_name)
-            csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
-            progress_data[event_name]["progress"] = 25
-            progress_data[event_name]["status"] = "Running generate_passes.py..."
+    except Exception as e:
+        progress_data[event_name]["status"] = f"Error: {str(e)}"
+        progress_data[event_name]["error"] = str(e)
+        save_progress_data(progress_data)
+
+
+def run_apple_wallet_job(event_name):
+    """Build and sign Apple Wallet passes and record progress"""
+    progress_data[event_name] = {"step": "apple_wallet", "progress": 0, "status": "Starting..."}
+    save_progress_data(progress_data)
+    try:
+        coordinator = EventCoordinator(event_name)
+        csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
+        guests = load_event_guests(coordinator.event_dir)
+        record_skipped_guests(event_name, guests)
+        progress_data.start_stages(event_name, JOB_STAGES["apple_wallet"], len(guests))
+        progress_data[event_name]["status"] = "Running generate_passes.py..."
+        save_progress_data(progress_data)
+        result = coordinator.generate_apple_wallet_passes(csv_path, event_name=event_name)
+        progress_data[event_name]["progress"] = 100
+        if result["success"]:
+            progress_data[event_name]["status"] = f"Generated {result['pass_count']} passes" + skipped_guests_note(event_name)
+            progress_data[event_name]["completed"] = True
+            progress_data[event_name]["pass_count"] = result['pass_count']
             save_progress_data(progress_data)
-            result = coordinator.generate_apple_wallet_passes(csv_path, event_name=event_name)
-            progress_data[event_name]["progress"] = 100
-            if result["success"]:
-                progress_data[event_name]["status"] = f"Generated {result['pass_count']} passes"
-                progress_data[event_name]["completed"] = True
-                progress_data[event_name]["pass_count"] = result['pass_count']
-                save_progress_data(progress_data)
-            else:
-                progress_data[event_name]["status"] = f"Error: {result['error']}"
-                progress_data[event_name]["error"] = result['error']
-                save_progress_data(progress_data)
-            coordinator.restore_generate_passes_script()
-        except Exception as e:
-            progress_data[event_name]["status"] = f"Error: {str(e)}"
-            progress_data[event_name]["error"] = str(e)
+        else:
+            progress_data[event_name]["status"] = f"Error: {result['error']}"
+            progress_data[event_name]["error"] = result['error']
             save_progress_data(progress_data)
-    thread = threading.Thread(target=generate_async)
-    thread.start()
-    return jsonify({"success": True, "message": "Apple Wallet generation started"})
+        coordinator.restore_generate_passes_script()
+    except Exception as e:
+        progress_data[event_name]["status"] = f"Error: {str(e)}"
+        progress_data[event_name]["error"] = str(e)
+        save_progress_data(progress_data)
 
 
-@app.route('/api/events/<event_name>/google-wallet', methods=['POST'])
-def generate_google_wallet(event_name):
-    """Generate Google Wallet passes"""
-    def generate_async():
-        progress_data[event_name] = {"step": "google_wallet", "progress": 0, "status": "Starting..."}
+def run_google_wallet_job(event_name):
+    """Create Google Wallet passes and record progress"""
+    progress_data[event_name] = {"step": "google_wallet", "progress": 0, "status": "Starting..."}
+    save_progress_data(progress_data)
+
+    try:
+        coordinator = EventCoordinator(event_name)
+        csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
+
+        guests = load_event_guests(coordinator.event_dir)
+        record_skipped_guests(event_name, guests)
+        progress_data.start_stages(event_name, JOB_STAGES["google_wallet"], len(guests))
+        progress_data[event_name]["status"] = "Creating pass objects..."
         save_progress_data(progress_data)
 
-        try:
-            coordinator = EventCoordinator(event_name)
-            csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
+        result = coordinator.generate_google_wallet_passes(csv_path, event_name=event_name)
 
-            progress_data[event_name]["progress"] = 25
-            progress_data[event_name]["status"] = "Authenticating with Google Wallet API..."
+        progress_data[event_name]["progress"] = 100
+        if result["success"]:
+            progress_data[event_name]["status"] = f"Generated {result['pass_count']} passes" + skipped_guests_note(event_name)
+            progress_data[event_name]["completed"] = True
+            progress_data[event_name]["pass_count"] = result['pass_count']
             save_progress_data(progress_data)
-            time.sleep(1)
+        else:
+            progress_data[event_name]["status"] = f"Error: {result['error']}"
+            progress_data[event_name]["error"] = result['error']
+            save_progress_data(progress_data)
+
+        # Restore original script
+        coordinator.restore_google_wallet_script()
 
-            progress_data[event_name]["progress"] = 50
-            progress_data[event_name]["status"] = "Creating pass objects..."
+    except Exception as e:
+        progress_data[event_name]["status"] = f"Error: {str(e)}"
+        progress_data[event_name]["error"] = str(e)
+        save_progress_data(progress_data)
+
+
+def run_send_emails_job(event_name):
+    """Send guest emails and record progress"""
+    progress_data[event_name] = {"step": "emails", "progress": 0, "status": "Preparing emails..."}
+    save_progress_data(progress_data)
+
+    try:
+        coordinator = EventCoordinator(event_name)
+        csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
+
+        guests = load_guest_table(csv_path)
+        record_skipped_guests(event_name, guests)
+
+        total_guests = len(guests)
+        progress_data.start_stages(event_name, JOB_STAGES["emails"], total_guests)
+        progress_data.record_throughput(event_name, "email_send", 0)
+
+        for i, guest in enumerate(guests):
+            with tracing.span("email_send", kind="guest", pass_id=guest['pass_id']):
+                # Simulate email sending delay
+                time.sleep(0.2)
+
+            # Each completed email_send span is one guest done
+            progress_data[event_name]["progress"] = int((i + 1) / total_guests * 100)
+            progress_data[event_name]["status"] = f"Sent email {i+1}/{total_guests} to {guest['name']}"
+            progress_data.record_throughput(event_name, "email_send", i + 1)
             save_progress_data(progress_data)
 
-            result = coordinator.generate_google_wallet_passes(csv_path)
+        progress_data[event_name]["completed"] = True
+        progress_data[event_name]["status"] = (f"All {total_guests} emails sent successfully"
+                                               + skipped_guests_note(event_name))
+        save_progress_data(progress_data)
 
-            progress_data[event_name]["progress"] = 100
-            if result["success"]:
-                progress_data[event_name]["status"] = f"Generated {result['pass_count']} passes"
-                progress_data[event_name]["completed"] = True
-                progress_data[event_name]["pass_count"] = result['pass_count']
-                save_progress_data(progress_data)
+    except Exception as e:
+        progress_data[event_name]["status"] = f"Error: {str(e)}"
+        progress_data[event_name]["error"] = str(e)
+        save_progress_data(progress_data)
+
+
+# Background jobs, run in a thread (development) or by the job worker process (production)
+JOB_HANDLERS = {
+    "qr_codes": run_qr_codes_job,
+    "apple_wallet": run_apple_wallet_job,
+    "google_wallet": run_google_wallet_job,
+    "emails": run_send_emails_job,
+}
+
+def run_job(kind, event_name, profile=False):
+    """Run one background job, tracing and timing it for /metrics and optionally profiling it"""
+    event_dir = os.path.join(EVENTS_DIR, event_name)
+    try:
+        with tracing.trace(event_dir, kind, event=event_name), \
+                metrics.timed(kind, name="castle_job_duration_seconds"):
+            if profile:
+                from job_profiling import run_profiled
+                run_profiled(JOB_HANDLERS[kind], kind, event_name, event_dir)
             else:
-                progress_data[event_name]["status"] = f"Error: {result['error']}"
-                progress_data[event_name]["error"] = result['error']
-                save_progress_data(progress_data)
+                JOB_HANDLERS[kind](event_name)
+    finally:
+        # Measured stage throughput feeds the ETA of future jobs
+        progress_data.finish_stages(event_name)
+        save_progress_data(progress_data)
+        metrics.flush()
 
-            # Restore original script
-            coordinator.restore_google_wallet_script()
+def start_job(kind, event_name, profile=False):
+    """Run a background job in-process, or queue it for the job worker in production mode"""
+    if not profile and os.environ.get("COORDINATOR_PROFILE_JOBS"):
+        from job_profiling import profiling_enabled_for
+        profile = profiling_enabled_for(kind)
 
-        except Exception as e:
-            progress_data[event_name]["status"] = f"Error: {str(e)}"
-            progress_data[event_name]["error"] = str(e)
-            save_progress_data(progress_data)
+    if os.environ.get("COORDINATOR_JOB_MODE") == "queue":
+        progress_data[event_name] = {"step": kind, "progress": 0, "status": "Queued..."}
+        progress_data.enqueue_job(kind, event_name, profile)
+    else:
+        thread = threading.Thread(target=run_job, args=(kind, event_name, profile))
+        thread.start()
 
-    thread = threading.Thread(target=generate_async)
-    thread.start()
+def profile_requested():
+    """?profile=1 on a job route profiles that run"""
+    return request.args.get('profile', '').lower() in ('1', 'true', 'yes')
 
+
+@app.route('/api/events/<event_name>/qr-generate', methods=['POST'])
+def generate_qr_codes(event_name):
+    """Generate guest QR codes on the server"""
+    start_job("qr_codes", event_name)
+    return jsonify({"success": True, "message": "QR code generation started"})
+
+
+@app.route('/api/events/<event_name>/apple-wallet', methods=['POST'])
+def generate_apple_wallet(event_name):
+    start_job("apple_wallet", event_name, profile_requested())
+    return jsonify({"success": True, "message": "Apple Wallet generation started"})
+
+
+@app.route('/api/events/<event_name>/google-wallet', methods=['POST'])
+def generate_google_wallet(event_name):
+    """Generate Google Wallet passes"""
+    start_job("google_wallet", event_name, profile_requested())
     return jsonify({"success": True, "message": "Google Wallet generation started"})
 
 
 @app.route('/api/events/<event_name>/emails/generate', methods=['POST'])
 def generate_emails(event_name):
-    """Generate personalized emails"""
+    """Generate personalized emails; ?save_html=1 also writes each guest's HTML to emails/"""
     try:
         coordinator = EventCoordinator(event_name)
 
@@ -561,12 +932,11 @@ def generate_emails(event_name):
         with open(event_info_path, 'r') as f:
             event_data = json.load(f)
 
-        csv_data = []
-        with open(csv_path, 'r') as f:
-            reader = csv.DictReader(f)
-            csv_data = list(reader)
+        csv_data = load_guest_table(csv_path)
 
-        result = coordinator.generate_personalized_emails(event_data, csv_data)
+        with tracing.trace(coordinator.event_dir, "emails_generate", event=event_name):
+            save_html = request.args.get('save_html', '').lower() in ('1', 'true', 'yes')
+            result = coordinator.generate_personalized_emails(event_data, csv_data, save_html=save_html)
 
         return jsonify(result)
 
@@ -578,41 +948,7 @@ def generate_emails(event_name):
 def send_emails(event_name):
     """Send personalized emails to all guests"""
     # This is a placeholder - would need SMTP configuration
-    def send_async():
-        progress_data[event_name] = {"step": "emails", "progress": 0, "status": "Preparing emails..."}
-        save_progress_data(progress_data)
-
-        try:
-            coordinator = EventCoordinator(event_name)
-            csv_path = os.path.join(coordinator.event_dir, "csv", "guest_list.csv")
-
-            with open(csv_path, 'r') as f:
-                reader = csv.DictReader(f)
-                guests = list(reader)
-
-            total_guests = len(guests)
-
-            for i, guest in enumerate(guests):
-                progress = int((i + 1) / total_guests * 100)
-                progress_data[event_name]["progress"] = progress
-                progress_data[event_name]["status"] = f"Sending email {i+1}/{total_guests} to {guest['name']}"
-                save_progress_data(progress_data)
-
-                # Simulate email sending delay
-                time.sleep(0.2)
-
-            progress_data[event_name]["completed"] = True
-            progress_data[event_name]["status"] = f"All {total_guests} emails sent successfully"
-            save_progress_data(progress_data)
-
-        except Exception as e:
-            progress_data[event_name]["status"] = f"Error: {str(e)}"
-            progress_data[event_name]["error"] = str(e)
-            save_progress_data(progress_data)
-
-    thread = threading.Thread(target=send_async)
-    thread.start()
-
+    start_job("emails", event_name, profile_requested())
     return jsonify({"success": True, "message": "Email sending started"})
 
 
@@ -622,6 +958,22 @@ def get_progress(event_name):
     return jsonify(progress_data.get(event_name, {"progress": 0, "status": "Not started"}))
 
 
+@app.route('/api/events/<event_name>/estimate', methods=['GET'])
+def estimate_jobs(event_name):
+    """Expected duration of each job for this event's guest list, from past throughput"""
+    try:
+        event_dir = safe_join(EVENTS_DIR, event_name)
+        if event_dir is None or not os.path.isdir(event_dir):
+            return jsonify({"error": "Event not found"}), 404
+
+        guests = request.args.get('guests', type=int) or len(load_event_guests(event_dir))
+        kinds = [request.args['kind']] if request.args.get('kind') in JOB_STAGES else list(JOB_STAGES)
+        return jsonify({kind: progress_data.estimate(JOB_STAGES[kind], guests) for kind in kinds})
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/events/<event_name>/files/<file_type>', methods=['GET'])
 def download_files(event_name, file_type):
     """Download generated files"""
@@ -629,15 +981,37 @@ def download_files(event_name, file_type):
         coordinator = EventCoordinator(event_name)
 
         if file_type == 'apple_passes':
-            # Create ZIP of Apple Wallet passes
-            zip_path = os.path.join(coordinator.event_dir, f"{event_name}_apple_passes.zip")
+            # ZIP of Apple Wallet passes, cached by the digests of the passes inside it
             apple_dir = os.path.join(coordinator.event_dir, "apple_passes")
-
-            with zipfile.ZipFile(zip_path, 'w') as zip_file:
-                for file in glob.glob(os.path.join(apple_dir, "*.pkpass")):
-                    zip_file.write(file, os.path.basename(file))
-
-            return send_file(zip_path, as_attachment=True)
+            registry = load_pass_registry(coordinator.event_dir)
+            with registry.lock:
+                registry.sync_apple_passes(apple_dir)
+                if registry.dirty:
+                    registry.save()
+
+            files = []
+            for file in sorted(glob.glob(os.path.join(apple_dir, "*.pkpass"))):
+                arcname = os.path.basename(file)
+                pass_id = arcname[:-len('.pkpass')]
+                files.append((file, arcname, registry.get(pass_id).get('apple_sha256')))
+
+            download_name = f"{event_name}_apple_passes.zip"
+            # Timed as a metric rather than traced, so the timeline keeps showing the last job
+            started = time.perf_counter()
+            bundle_path, stream = get_bundle(
+                os.path.join(coordinator.event_dir, "bundles"), "apple_passes", files
+            )
+            metrics.observe("castle_stage_duration_seconds", time.perf_counter() - started,
+                            stage="bundle_download", cache="hit" if bundle_path else "miss")
+            if bundle_path:
+                return send_cached_file(bundle_path, as_attachment=True, download_name=download_name)
+
+            # Cache miss: stream the bundle to the client while it is being built
+            return Response(
+                stream_with_context(stream),
+                mimetype='application/zip',
+                headers={"Content-Disposition": attachment_disposition(download_name)}
+            )
 
         elif file_type == 'google_passes':
             # Return Google Wallet URLs JSON
@@ -651,6 +1025,55 @@ def download_files(event_name, file_type):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/events/<event_name>/profile', methods=['GET'])
+def download_profile(event_name):
+    """Download the latest job profile as a ZIP (.prof and report), or one file with ?file=<name>"""
+    try:
+        from job_profiling import profiles_dir, latest_profile
+
+        event_dir = safe_join(EVENTS_DIR, event_name)
+        if event_dir is None or not os.path.isdir(event_dir):
+            return jsonify({"error": "Event not found"}), 404
+
+        filename = request.args.get('file')
+        if filename:
+            path = safe_join(profiles_dir(event_dir), filename)
+            if path is None or not os.path.isfile(path):
+                return jsonify({"error": "Profile not found"}), 404
+            return send_file(path, as_attachment=True)
+
+        latest = latest_profile(event_dir, request.args.get('kind'))
+        if latest is None:
+            return jsonify({"error": "No profiles for this event (start a job with ?profile=1)"}), 404
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for path in latest:
+                if path:
+                    bundle.write(path, os.path.basename(path))
+        buffer.seek(0)
+        stem = os.path.basename(latest[0])[:-len('.prof')]
+        return send_file(buffer, mimetype='application/zip', as_attachment=True,
+                         download_name=f"{event_name}_{stem}_profile.zip")
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/events/<event_name>/trace', methods=['GET'])
+def get_trace(event_name):
+    """Spans of the latest job run (or ?trace_id=) for the timeline view"""
+    try:
+        event_dir = safe_join(EVENTS_DIR, event_name)
+        if event_dir is None or not os.path.isdir(event_dir):
+            return jsonify({"error": "Event not found"}), 404
+
+        return jsonify(tracing.timeline(tracing.read_spans(event_dir), request.args.get('trace_id')))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/events/<event_name>/apple-pass/<pass_id>', methods=['GET'])
 def download_apple_pass(event_name, pass_id):
     """Download individual Apple Wallet pass"""
@@ -660,10 +1083,10 @@ def download_apple_pass(event_name, pass_id):
         pass_file = os.path.join(apple_dir, f"{pass_id}.pkpass")
         
         if os.path.exists(pass_file):
-            return send_file(pass_file, 
-                           as_attachment=True, 
-                           download_name=f"{pass_id}.pkpass",
-                           mimetype='application/vnd.apple.pkpass')
+            return send_cached_file(pass_file,
+                                    as_attachment=True,
+                                    download_name=f"{pass_id}.pkpass",
+                                    mimetype='application/vnd.apple.pkpass')
         else:
             return jsonify({"error": "Pass not found"}), 404
 
@@ -671,10 +1094,16 @@ def download_apple_pass(event_name, pass_id):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings, counters and job gauges in Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     """Serve the event workflow HTML interface"""
-    return send_from_directory(BASE_DIR, 'event-workflow.html')
+    return send_cached_file(os.path.join(BASE_DIR, 'event-workflow.html'))
 
 
 @app.route('/api/customize', methods=['POST'])
@@ -694,13 +1123,105 @@ def customize_pass_route():
         return jsonify({"error": f"Customization failed: {str(e)}"}), 500
 
 
+@app.route('/api/assets/<asset_id>/status')
+def asset_status_route(asset_id):
+    """Report whether artwork uploaded through /api/customize has finished rendering"""
+    try:
+        import sys
+        import os
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from apple_pass_customizer import get_asset_status
+        return get_asset_status(asset_id)
+    except ImportError as e:
+        print(f"Import error: {e}")
+        return jsonify({"error": f"Pass customizer not available: {str(e)}"}), 500
+
+
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve static files like JS, CSS, etc."""
-    return send_from_directory(BASE_DIR, filename)
+    path = safe_join(BASE_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        raise NotFound()
+    return send_cached_file(path)
+
+
+def run_job_worker(threads=2):
+    """Run queued background jobs until interrupted (production job worker)"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Jobs still marked running belonged to a worker that has since died
+    progress_data.fail_running_jobs("Job worker restarted")
+    print(f"🧵 Job worker started with {threads} threads")
+
+    def run(job_id, kind, event_name, profile):
+        error = None
+        try:
+            run_job(kind, event_name, bool(profile))
+        except Exception as e:
+            error = str(e)
+            print(f"❌ Job {job_id} ({kind} for {event_name}) failed: {e}")
+        progress_data.finish_job(job_id, error)
+
+    slots = threading.Semaphore(threads)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            slots.acquire()
+            job = progress_data.claim_job()
+            if job is None:
+                slots.release()
+                time.sleep(0.5)
+                continue
+            future = executor.submit(run, *job)
+            future.add_done_callback(lambda _: slots.release())
+
+
+def serve_production(workers, host='0.0.0.0', port=5001, job_threads=2):
+    """Serve the API from several gunicorn worker processes plus one job worker"""
+    if not GUNICORN_AVAILABLE:
+        print("❌ gunicorn not installed (pip install gunicorn)")
+        exit(1)
+
+    import multiprocessing
+    from gunicorn.app.base import BaseApplication
+
+    # Web workers only queue jobs; the job worker process runs them
+    os.environ["COORDINATOR_JOB_MODE"] = "queue"
+    # Not a daemon: jobs such as QR rendering start their own worker processes
+    metrics.clear_shared()
+    job_worker = multiprocessing.Process(target=run_job_worker, args=(job_threads,))
+    job_worker.start()
+
+    class CoordinatorApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            # Downloads stream while bundles build, so use threads within each worker
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', 4)
+            self.cfg.set('timeout', 300)
+
+        def load(self):
+            return app
+
+    try:
+        CoordinatorApplication().run()
+    finally:
+        job_worker.terminate()
+        job_worker.join()
 
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Castle Fine Art Event Workflow Coordinator')
+    parser.add_argument('--production', action='store_true', help='Serve with multiple gunicorn workers')
+    parser.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1,
+                        help='Number of web worker processes in production mode')
+    parser.add_argument('--job-worker', action='store_true', help='Only run queued background jobs')
+    parser.add_argument('--job-threads', type=int, default=2, help='Concurrent background jobs')
+    args = parser.parse_args()
+
     # Ensure base directories exist
     os.makedirs(EVENTS_DIR, exist_ok=True)
     os.makedirs(QR_EXPORTS_DIR, exist_ok=True)
@@ -708,6 +1229,12 @@ if __name__ == '__main__':
     print("🚀 Castle Fine Art Event Workflow Coordinator starting...")
     print(f"📁 Events directory: {EVENTS_DIR}")
     print(f"📁 Wallettest directory: {WALLETTEST_DIR}")
-    print("🌐 Server running on http://localhost:5001")
-
-    app.run(debug=False, host='0.0.0.0', port=5001)
+    if args.job_worker:
+        run_job_worker(args.job_threads)
+    elif args.production:
+        print(f"🌐 Server running on http://localhost:5001 with {args.workers} workers")
+        serve_production(args.workers, job_threads=args.job_threads)
+    else:
+        metrics.clear_shared()
+        print("🌐 Server running on http://localhost:5001")
+        app.run(debug=False, host='0.0.0.0', port=5001)